@@ -5,7 +5,11 @@ import asyncio
 from datetime import datetime
 import logging
 
-from utils.utils import send_personal_message, check_timeout
+from utils.utils import send_personal_message, check_timeout, response_cache
+from portal.http import http_client
+from portal.dispatch import llm_dispatcher
+from services.LLMService import AsyncOpenAIChatCompletionService
+from config import Config
 from contextlib import asynccontextmanager
 from dotenv import load_dotenv
 from scenes.go2.go2_sim import Go2Sim
@@ -26,7 +30,17 @@ logger = logging.getLogger(__name__)
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     load_dotenv()
+    # Pooled keep-alive connections to the LLM, TTS, STT and planner servers
+    http_client.configure(
+        limit=Config.http_pool_size,
+        keepalive_timeout=Config.http_keepalive_seconds,
+        total_timeout=Config.timeout_seconds,
+        connect_timeout=Config.http_connect_timeout,
+    )
+    llm_dispatcher.configure(max_concurrent=Config.llm_max_concurrent)
     yield
+    await http_client.close()
+    await response_cache.close()
 
 
 app = FastAPI(lifespan=lifespan, title="Fully Self-Contained WebSocket Server")
@@ -38,6 +52,16 @@ async def get():
     return {"message": "WebSocket server is running. Connect to /ws to use WebSocket."}
 
 
+@app.get("/metrics/llm")
+def llm_metrics():
+    return llm_dispatcher.metrics()
+
+
+@app.get("/metrics/history")
+def history_metrics():
+    return AsyncOpenAIChatCompletionService.history_metrics()
+
+
 @app.get("/defaul-scene-config")
 def default_config():
     return json.load(open("assets/default_scene_configuration.json", "r"))
@@ -0,0 +1,92 @@
+"""
+Step time of the locomotion envs with and without inference_mode.
+
+    python bench_env.py --robot g1 --steps 500
+    python bench_env.py --robot go2 --num-envs 16
+"""
+
+import argparse
+import pickle
+import time
+
+import genesis as gs
+import numpy as np
+import torch
+
+from scenes.g1.g1_env import G1Env
+from scenes.go2.go2_env import Go2Env
+
+LOG_DIRS = {
+    "g1": "scenes/g1/checkpoints/g1-walking",
+    "go2": "scenes/go2/checkpoints/go2-walking",
+}
+
+
+def make_env(robot, num_envs, inference_mode):
+    cfgs = pickle.load(open(LOG_DIRS[robot] + "/cfgs.pkl", "rb"))
+    env_cfg, obs_cfg, reward_cfg, command_cfg = cfgs[:4]
+    reward_cfg["reward_scales"] = {}
+
+    if robot == "g1":
+        return G1Env(
+            num_envs=num_envs,
+            env_cfg=env_cfg,
+            obs_cfg=obs_cfg,
+            reward_cfg=reward_cfg,
+            command_cfg=command_cfg,
+            domain_rand_cfg=cfgs[5],
+            inference_mode=inference_mode,
+        )
+    return Go2Env(
+        num_envs=num_envs,
+        env_cfg=env_cfg,
+        obs_cfg=obs_cfg,
+        reward_cfg=reward_cfg,
+        command_cfg=command_cfg,
+        inference_mode=inference_mode,
+    )
+
+
+def bench(env, steps, warmup=20):
+    env.reset()
+    actions = torch.zeros((env.num_envs, env.num_actions), device=env.device)
+    for _ in range(warmup):
+        env.step(actions)
+
+    times = np.empty(steps)
+    for i in range(steps):
+        start = time.perf_counter()
+        env.step(actions)
+        if env.device.type == "cuda":
+            torch.cuda.synchronize()
+        times[i] = time.perf_counter() - start
+    return times * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--robot", choices=list(LOG_DIRS), default="g1")
+    parser.add_argument("--num-envs", type=int, default=1)
+    parser.add_argument("--steps", type=int, default=500)
+    args = parser.parse_args()
+
+    gs.init()
+    results = {}
+    for inference_mode in (False, True):
+        env = make_env(args.robot, args.num_envs, inference_mode)
+        results[inference_mode] = bench(env, args.steps)
+        del env
+
+    for inference_mode, times in results.items():
+        name = "inference" if inference_mode else "training"
+        print(
+            f"{name:>10}: mean {times.mean():7.3f} ms  "
+            f"p50 {np.percentile(times, 50):7.3f} ms  "
+            f"p99 {np.percentile(times, 99):7.3f} ms"
+        )
+    speedup = results[False].mean() / results[True].mean()
+    print(f"inference_mode speedup: {speedup:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,201 @@
+"""
+End-to-end latency of the command pipelines against the mocked services of
+portal.mock, served in-process so runs are offline and reproducible.
+
+    python bench_pipeline.py --runs 20 --token-rate 40 --jitter 0.2 --final-delay 0.3 --seed 0
+
+text:   instruction -> LLM stream -> first reasoning token, first action
+        queued, whole answer
+voice:  recording -> STT -> LLM -> first TTS audio, serially and with the
+        LLM started on the partial transcript. The mocked STT streams the
+        transcript segment by segment and finalizes it --final-delay after
+        the last one, the time speculation can win.
+"""
+
+import argparse
+import asyncio
+import time
+
+import numpy as np
+import uvicorn
+
+from portal.http import http_client
+from portal.mock import (
+    DEFAULT_TRANSCRIPT,
+    add_arguments,
+    create_app,
+    latency_from,
+    silent_wav,
+)
+from portal.sse import delta_content
+from services.AudioService import AudioService
+from services.LLMService import AsyncOpenAIChatCompletionService
+from utils.action_stream import ActionStreamParser
+from utils.speculative import SpeculativeStream
+from utils.utils import send_openai_request
+
+INSTRUCTION = "Where is the supermarket?"
+TTS_TOKENS = 10  # First TTS request, like AudioService.stream_tts
+
+
+class Timer:
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.marks = {}
+
+    def mark(self, name):
+        self.marks.setdefault(name, time.perf_counter() - self.start)
+
+
+class Recorder:
+    """
+    Websocket stand-in, keeps the time of the first audio sent.
+    """
+
+    def __init__(self, timer):
+        self.timer = timer
+
+    async def send_text(self, text):
+        self.timer.mark("first_audio")
+
+
+async def text_pipeline(url):
+    timer = Timer()
+    parser = ActionStreamParser()
+    async for chunk in send_openai_request(api_url=url, prompt=INSTRUCTION, api_key="mock"):
+        delta = delta_content(chunk)
+        if delta:
+            timer.mark("first_token")
+        if parser.feed(delta):
+            timer.mark("first_action")
+    timer.mark("done")
+    return timer.marks
+
+
+async def voice_pipeline(llm, audio, recording, speculative, stats):
+    timer = Timer()
+
+    def ask(instruction, accepted=None):
+        return llm.chat_completion_stream(message_content=instruction, accepted=accepted)
+
+    if speculative:
+        stream = SpeculativeStream(ask)
+        instruction = ""
+        try:
+            async for event in audio.stt_stream(recording):
+                if "partial" in event:
+                    stream.propose(event["partial"])
+                instruction = event.get("text", instruction)
+        except BaseException:
+            stream.cancel()
+            raise
+        chunks = stream.result(instruction)
+    else:
+        instruction = await audio.stt(recording)
+        chunks = ask(instruction)
+    timer.mark("transcript")
+
+    answer = ""
+    tokens = 0
+    async for chunk in chunks:
+        delta = delta_content(chunk)
+        if delta:
+            timer.mark("first_token")
+            answer += delta
+            tokens += 1
+            if tokens == TTS_TOKENS:
+                await audio.send_to_tts(answer, Recorder(timer))
+    if tokens < TTS_TOKENS:
+        await audio.send_to_tts(answer, Recorder(timer))
+    timer.mark("done")
+    if speculative:
+        # Counted by result() once iterated
+        stats["hits"] += stream.hits
+        stats["misses"] += stream.misses
+        stats["restarts"] += stream.restarts
+    return timer.marks
+
+
+async def repeat(count, pipeline, *args):
+    runs = []
+    failures = 0
+    for _ in range(count):
+        try:
+            runs.append(await pipeline(*args))
+        except Exception:
+            # Injected with --failure-rate
+            failures += 1
+    return runs, failures
+
+
+def report(name, runs, failures):
+    print(f"{name}, {failures} failed")
+    if not runs:
+        return
+    for mark in runs[0]:
+        values = np.array([run[mark] for run in runs if mark in run]) * 1000
+        print(
+            f"  {mark:>14}: p50 {np.percentile(values, 50):7.1f} ms, "
+            f"p95 {np.percentile(values, 95):7.1f} ms"
+        )
+
+
+async def bench(args):
+    app = create_app(
+        latency_from(args), transcript=args.transcript, final_delay=args.final_delay
+    )
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=args.port, log_level="error"))
+    serving = asyncio.create_task(server.serve())
+    while not server.started:
+        await asyncio.sleep(0.01)
+
+    base = f"http://127.0.0.1:{args.port}/v1"
+    config = {
+        "models": {
+            "llm": {"api_url": base + "/chat/completions", "api_key": "mock"},
+            "audio": {
+                "tts_url": base + "/audio/speech",
+                "stt_url": base + "/audio/transcriptions",
+            },
+        }
+    }
+    llm = AsyncOpenAIChatCompletionService(config)
+    audio = AudioService(config)
+    recording = silent_wav(args.audio_seconds)
+
+    try:
+        report("text", *await repeat(args.runs, text_pipeline, llm.api_url))
+        stats = {"hits": 0, "misses": 0, "restarts": 0}
+        for speculative in (False, True):
+            report(
+                "voice, speculative" if speculative else "voice, serial",
+                *await repeat(
+                    args.runs, voice_pipeline, llm, audio, recording, speculative, stats
+                ),
+            )
+        print(
+            f"  speculation: {stats['hits']} hits, {stats['misses']} misses, "
+            f"{stats['restarts']} restarts"
+        )
+    finally:
+        await http_client.close()
+        server.should_exit = True
+        await serving
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    add_arguments(parser)
+    parser.set_defaults(port=3399, seed=0)
+    parser.add_argument("--runs", type=int, default=20)
+    parser.add_argument("--audio-seconds", type=float, default=3.0)
+    parser.add_argument(
+        "--transcript", nargs="+", default=DEFAULT_TRANSCRIPT, help="segments"
+    )
+    parser.add_argument("--final-delay", type=float, default=0.3, help="seconds")
+    args = parser.parse_args()
+    asyncio.run(bench(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+"""
+Per-step inference latency of a locomotion policy on every backend.
+
+    python export_policy.py scenes/g1/checkpoints/g1-walking
+    python bench_policy.py scenes/g1/checkpoints/g1-walking --batch 1 16 --threads 1 4
+"""
+
+import argparse
+import os
+import pickle
+import time
+
+import numpy as np
+import torch
+
+from export_policy import latest_checkpoint
+from utils.policy import BACKENDS, artifact_path, policy_registry
+
+
+def bench(policy, obs, steps, warmup=20):
+    for _ in range(warmup):
+        policy(obs)
+
+    latencies = np.empty(steps)
+    with torch.no_grad():
+        for i in range(steps):
+            start = time.perf_counter()
+            actions = policy(obs)
+            if actions.is_cuda:
+                torch.cuda.synchronize()
+            latencies[i] = time.perf_counter() - start
+    return latencies * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("log_dir")
+    parser.add_argument("--checkpoint", help="Defaults to the latest model_*.pt")
+    parser.add_argument("--backend", nargs="+", choices=BACKENDS, default=list(BACKENDS))
+    parser.add_argument("--device", default="cpu")
+    parser.add_argument("--batch", nargs="+", type=int, default=[1, 16])
+    parser.add_argument("--threads", nargs="+", type=int, default=[0])
+    parser.add_argument("--steps", type=int, default=1000)
+    args = parser.parse_args()
+
+    checkpoint = args.checkpoint or latest_checkpoint(args.log_dir)
+    num_obs = pickle.load(open(os.path.join(args.log_dir, "cfgs.pkl"), "rb"))[1][
+        "num_obs"
+    ]
+
+    for backend in args.backend:
+        if not os.path.exists(artifact_path(args.log_dir, checkpoint, backend)):
+            print(f"{backend:>12}: not exported, run export_policy.py first")
+            continue
+
+        for threads in args.threads:
+            policy_registry.clear()
+            policy = policy_registry.get(
+                args.log_dir, checkpoint, args.device, backend, threads
+            )
+            for batch in args.batch:
+                obs = torch.randn(batch, num_obs, device=args.device)
+                latencies = bench(policy, obs, args.steps)
+                print(
+                    f"{backend:>12} threads={threads or 'default':>7} batch={batch:<4} "
+                    f"mean {latencies.mean():7.3f} ms  "
+                    f"p50 {np.percentile(latencies, 50):7.3f} ms  "
+                    f"p99 {np.percentile(latencies, 99):7.3f} ms"
+                )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+"""
+Decoding throughput of LLM chunk streams, line by line with json as the
+services did before against portal.sse, with json and with orjson.
+
+    python bench_sse.py --cache response_cache.json --read-size 1024
+    python bench_sse.py --chunks 2000
+
+Streams are the answers recorded in a response cache (RESPONSE_CACHE_PATH)
+encoded back to SSE, or a synthetic answer of --chunks chunks without one.
+"""
+
+import argparse
+import json
+import time
+
+import portal.sse as sse
+from portal.sse import SSEDecoder, delta_content
+
+
+def recorded_streams(path):
+    with open(path, "r") as f:
+        entries = json.load(f)
+    return [[chunk for _, chunk in entry["chunks"]] for entry in entries.values()]
+
+
+def synthetic_stream(count):
+    words = 'Sure, I will take you there. {"actions": [{"type": "move", "distance": 2}]}'.split(" ")
+    return [
+        {
+            "id": "gen-0",
+            "object": "chat.completion.chunk",
+            "model": "bench",
+            "choices": [{"index": 0, "delta": {"content": words[i % len(words)] + " "}}],
+        }
+        for i in range(count)
+    ]
+
+
+def encode(chunks):
+    body = "".join(f"data: {json.dumps(chunk)}\n\n" for chunk in chunks)
+    return (body + "data: [DONE]\n\n").encode("utf-8")
+
+
+def reads(body, size):
+    return [body[i : i + size] for i in range(0, len(body), size)]
+
+
+def legacy(pieces):
+    # Lines as aiohttp's StreamReader yields them, parsed one by one
+    text = ""
+    for line in b"".join(pieces).splitlines(keepends=True):
+        line = line.decode("utf-8").strip()
+        if line.startswith("data: "):
+            line = line[6:]
+        if line and line != "[DONE]":
+            text += json.loads(line)["choices"][0]["delta"].get("content", "")
+    return text
+
+
+def decoder(pieces):
+    text = ""
+    decoder = SSEDecoder()
+    for piece in pieces:
+        for event in decoder.feed(piece):
+            text += delta_content(event)
+    for event in decoder.close():
+        text += delta_content(event)
+    return text
+
+
+def bench(name, decode, streams, repeat):
+    expected = None
+    begin = time.perf_counter()
+    for _ in range(repeat):
+        texts = [decode(pieces) for pieces in streams]
+        expected = expected or texts
+        assert texts == expected
+    elapsed = time.perf_counter() - begin
+
+    events = sum(piece.count(b"data:") for pieces in streams for piece in pieces) * repeat
+    print(
+        f"{name:>14}: {events / elapsed / 1000:8.1f} k events/s, "
+        f"{elapsed / (len(streams) * repeat) * 1e6:9.1f} us/stream"
+    )
+    return texts
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--cache", help="response cache JSON to take streams from")
+    parser.add_argument("--chunks", type=int, default=1000)
+    parser.add_argument("--read-size", type=int, default=1024, help="bytes per socket read")
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    chunks = recorded_streams(args.cache) if args.cache else [synthetic_stream(args.chunks)]
+    streams = [reads(encode(c), args.read_size) for c in chunks if c]
+    print(f"{len(streams)} streams, {sum(map(len, streams))} reads of {args.read_size} bytes")
+
+    baseline = bench("line by line", legacy, streams, args.repeat)
+    orjson = sse.orjson
+    sse.orjson = None
+    assert bench("sse + json", decoder, streams, args.repeat) == baseline
+    sse.orjson = orjson
+    if orjson is not None:
+        assert bench("sse + orjson", decoder, streams, args.repeat) == baseline
+    else:
+        print("orjson is not installed")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,152 @@
+"""
+Fit the progress per step of the locomotion skills and store it next to
+their checkpoints, where SkillExecutor picks it up.
+
+    python calibrate_skills.py --robot g1
+    python calibrate_skills.py --robot go2 --steps 400 --dry-run
+
+Every skill runs from a settled stand for --steps steps, then stands for
+--coast steps. The rate and start delay are a line fitted to the second
+half of the run, the lag is the progress made while coasting.
+"""
+
+import argparse
+import pickle
+
+import genesis as gs
+import numpy as np
+import torch
+
+from scenes.g1.g1_env import G1Env
+from scenes.go2.go2_env import Go2Env
+from utils.policy import policy_registry
+from utils.skills import SkillCalibration, SkillExecutor, save_calibration
+
+CHECKPOINTS = {"g1": "model_1000.pt", "go2": "model_500.pt"}
+
+# Action name to policy log dir, in the fused skill order of the sims
+SKILL_DIRS = {
+    "g1": {
+        "rotate_right": "scenes/g1/checkpoints/g1-right",
+        "rotate_left": "scenes/g1/checkpoints/g1-left",
+        "wait": "scenes/g1/checkpoints/g1-stand",
+        "move_forward": "scenes/g1/checkpoints/g1-walking",
+    },
+    "go2": {
+        "rotate_right": "scenes/go2/checkpoints/go2-right",
+        "rotate_left": "scenes/go2/checkpoints/go2-left",
+        "wait": "scenes/go2/checkpoints/go2-stand",
+        "move_forward": "scenes/go2/checkpoints/go2-walking",
+    },
+}
+STAND = 2
+
+# Velocity commands the G1 sim steps each action with
+G1_COMMANDS = {
+    "rotate_right": {"angle": -0.2},
+    "rotate_left": {"angle": 0.2},
+    "move_forward": {"x": 0.5},
+}
+
+
+def make_env(robot):
+    cfgs = pickle.load(open(SKILL_DIRS[robot]["move_forward"] + "/cfgs.pkl", "rb"))
+    env_cfg, obs_cfg, reward_cfg, command_cfg = cfgs[:4]
+    reward_cfg["reward_scales"] = {}
+
+    if robot == "g1":
+        return G1Env(
+            num_envs=1,
+            env_cfg=env_cfg,
+            obs_cfg=obs_cfg,
+            reward_cfg=reward_cfg,
+            command_cfg=command_cfg,
+            domain_rand_cfg=cfgs[5],
+            inference_mode=True,
+        )
+    return Go2Env(
+        num_envs=1,
+        env_cfg=env_cfg,
+        obs_cfg=obs_cfg,
+        reward_cfg=reward_cfg,
+        command_cfg=command_cfg,
+        inference_mode=True,
+    )
+
+
+def run_skill(env, policy, robot, action, steps, coast, warmup=50):
+    """
+    Progress of `action` after every step, then after every coasting step.
+    """
+    skills = [
+        torch.full((env.num_envs,), i, dtype=torch.long, device=env.device)
+        for i in range(len(SKILL_DIRS[robot]))
+    ]
+    skill = list(SKILL_DIRS[robot]).index(action)
+    command = G1_COMMANDS.get(action, {}) if robot == "g1" else {}
+
+    obs, _ = env.reset()
+    with torch.no_grad():
+        for _ in range(warmup):
+            obs, *_ = env.step(policy(obs, skills[STAND]))
+
+        executor = SkillExecutor({action: SkillCalibration(1.0)})
+        executor.start(action, 0, env.position)
+        progress = np.empty(steps + coast)
+        for i in range(steps + coast):
+            if i < steps:
+                obs, *_ = env.step(policy(obs, skills[skill]), **command)
+            else:
+                obs, *_ = env.step(policy(obs, skills[STAND]))
+            progress[i] = executor.measure(env.position)
+    return progress[:steps], progress[steps:]
+
+
+def fit(progress, coast):
+    """
+    SkillCalibration of a run, see the module docstring.
+    """
+    t = np.arange(1, len(progress) + 1)
+    half = len(progress) // 2
+    rate, intercept = np.polyfit(t[half:], progress[half:], 1)
+    return SkillCalibration(
+        rate=rate,
+        delay=max(0.0, -intercept / rate),
+        lag=max(0.0, (coast[-1] - progress[-1]) / rate),
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--robot", choices=list(SKILL_DIRS), default="g1")
+    parser.add_argument("--steps", type=int, default=300)
+    parser.add_argument("--coast", type=int, default=50)
+    parser.add_argument("--dry-run", action="store_true", help="only print the fit")
+    args = parser.parse_args()
+
+    gs.init()
+    env = make_env(args.robot)
+    skill_dirs = SKILL_DIRS[args.robot]
+    checkpoint = CHECKPOINTS[args.robot]
+    policy = policy_registry.get_fused(
+        list(skill_dirs.values()), checkpoint, device=str(env.device)
+    )
+
+    for action, log_dir in skill_dirs.items():
+        if action == "wait":
+            continue
+        progress, coast = run_skill(
+            env, policy, args.robot, action, args.steps, args.coast
+        )
+        calibration = fit(progress, coast)
+        print(
+            f"{action:>13}: rate {calibration.rate:.5f}/step  "
+            f"delay {calibration.delay:5.1f}  lag {calibration.lag:5.1f}"
+        )
+        if not args.dry_run:
+            path = save_calibration(log_dir, checkpoint, action, calibration)
+            print(f"{'':>13}  saved to {path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -11,7 +11,11 @@ class Config:
         "LLM_MODEL", "anthropic/claude-3.5-haiku-20241022")
     api_key = os.environ.get("API_KEY", "")
     timeout_seconds = float(os.environ.get("TIMEOUT_SECONDS", 300))
+    llm_max_concurrent = int(os.environ.get("LLM_MAX_CONCURRENT", 4))
     enable_history = bool(os.environ.get("ENABLE_HISTORY", False))
+    history_token_budget = int(os.environ.get("HISTORY_TOKEN_BUDGET", 2000))
+    history_window = int(os.environ.get("HISTORY_WINDOW", 8))
+    history_summary_tokens = int(os.environ.get("HISTORY_SUMMARY_TOKENS", 300))
     tts_url = os.environ.get(
         "TTS_URL", "http://localhost:8880/v1/audio/speech")
     tts_voice = os.environ.get("TTS_VOICE", "af_jessica")
@@ -19,3 +23,15 @@ class Config:
     stt_url = os.environ.get(
         "STT_URL", "http://localhost:3348/v1/audio/transcriptions")
     stt_model = os.environ.get("STT_MODEL", "tiny")
+    speculative_stt = os.environ.get("SPECULATIVE_STT", "1") == "1"
+    speculative_min_words = int(os.environ.get("SPECULATIVE_MIN_WORDS", 3))
+    policy_backend = os.environ.get("POLICY_BACKEND", "torch")
+    policy_device = os.environ.get("POLICY_DEVICE", "cuda:0")
+    policy_threads = int(os.environ.get("POLICY_THREADS", 0))
+    idle_loop_cache = os.environ.get("IDLE_LOOP_CACHE", "1") == "1"
+    http_pool_size = int(os.environ.get("HTTP_POOL_SIZE", 10))
+    http_keepalive_seconds = float(os.environ.get("HTTP_KEEPALIVE_SECONDS", 30))
+    http_connect_timeout = float(os.environ.get("HTTP_CONNECT_TIMEOUT", 10))
+    response_cache_size = int(os.environ.get("RESPONSE_CACHE_SIZE", 256))
+    response_cache_ttl = float(os.environ.get("RESPONSE_CACHE_TTL", 24 * 3600))
+    response_cache_path = os.environ.get("RESPONSE_CACHE_PATH", "")
@@ -0,0 +1,82 @@
+"""
+Export locomotion checkpoints to TorchScript and ONNX artifacts.
+
+Artifacts are written next to `cfgs.pkl` and picked up by the policy
+registry when POLICY_BACKEND is "torchscript" or "onnx":
+
+    python export_policy.py                       # every scenes/*/checkpoints/*
+    python export_policy.py scenes/g1/checkpoints/g1-walking --format onnx
+"""
+
+import argparse
+import glob
+import os
+import pickle
+import re
+
+import torch
+
+from utils.policy import artifact_path, load_inference_policy
+
+
+def latest_checkpoint(log_dir):
+    checkpoints = glob.glob(os.path.join(log_dir, "model_*.pt"))
+    checkpoints = [
+        c for c in checkpoints if re.fullmatch(r"model_\d+\.pt", os.path.basename(c))
+    ]
+    if not checkpoints:
+        return None
+    return os.path.basename(
+        max(checkpoints, key=lambda c: int(re.findall(r"\d+", os.path.basename(c))[0]))
+    )
+
+
+def export(log_dir, checkpoint, formats):
+    obs_cfg = pickle.load(open(os.path.join(log_dir, "cfgs.pkl"), "rb"))[1]
+    policy = load_inference_policy(log_dir, checkpoint, device="cpu")
+    example = torch.zeros(1, obs_cfg["num_obs"])
+
+    if "torchscript" in formats:
+        path = artifact_path(log_dir, checkpoint, "torchscript")
+        torch.jit.save(torch.jit.trace(policy, example), path)
+        print(f"Exported {path}")
+
+    if "onnx" in formats:
+        path = artifact_path(log_dir, checkpoint, "onnx")
+        torch.onnx.export(
+            policy,
+            example,
+            path,
+            input_names=["obs"],
+            output_names=["actions"],
+            dynamic_axes={"obs": {0: "batch"}, "actions": {0: "batch"}},
+            opset_version=17,
+        )
+        print(f"Exported {path}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("log_dirs", nargs="*", help="Checkpoint directories")
+    parser.add_argument("--checkpoint", help="Defaults to the latest model_*.pt")
+    parser.add_argument(
+        "--format",
+        nargs="+",
+        choices=["torchscript", "onnx"],
+        default=["torchscript", "onnx"],
+    )
+    args = parser.parse_args()
+
+    log_dirs = args.log_dirs or sorted(
+        os.path.dirname(p) for p in glob.glob("scenes/*/checkpoints/*/cfgs.pkl")
+    )
+    for log_dir in log_dirs:
+        checkpoint = args.checkpoint or latest_checkpoint(log_dir)
+        if checkpoint is None:
+            print(f"No checkpoint in {log_dir}, skipping")
+            continue
+        export(log_dir, checkpoint, args.format)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,150 @@
+"""
+Run LLM action plans through the locomotion envs without rendering or
+streaming, as fast as physics allows.
+
+    python headless.py --robot g1 plans.json
+    python headless.py --robot go2 plans.json --workers 4 --out results.json
+
+plans.json holds one plan or a list of plans in the format the LLM answers
+with, {"actions": [{"type": "rotate_left", "angle": 45}, ...]}. Every plan
+starts from a reset env and runs through the same policies, calibration and
+closed-loop skill executor as the server.
+"""
+
+import argparse
+import json
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import genesis as gs
+import numpy as np
+
+from scenes.g1.g1_sim import G1Sim
+from scenes.go2.go2_sim import Go2Sim
+from utils.skills import SKILL_INDEX
+
+SIMS = {"g1": G1Sim, "go2": Go2Sim}
+
+
+def load_sim(robot, config=None):
+    """
+    The server scene of `robot`, its cameras are never rendered here.
+    """
+    if not gs._initialized:
+        gs.init()
+    if config is None:
+        config = json.load(open("assets/default_scene_configuration.json", "r"))
+        config = config["scenes"].get(robot, {})
+    return SIMS[robot](config=config)
+
+
+def run_plan(sim, plan):
+    """
+    Execute the actions of `plan` one after the other from a reset env.
+
+    Returns:
+        dict: Final [x, y, yaw], the trajectory with one [x, y, yaw] per
+        step, the steps and progress of every action and the wall time.
+    """
+    env = sim.env
+    executor = sim.skill_executor
+    obs, _ = env.reset()
+    trajectory = [env.position.copy()]
+    results = []
+
+    start = time.perf_counter()
+    for action in plan.get("actions", []):
+        name = action.get("type")
+        if name not in SKILL_INDEX:
+            results.append({"type": name, "skipped": True})
+            continue
+
+        amplitude = action.get("angle", action.get("distance", 0))
+        executor.start(name, amplitude, env.position)
+        steps = 0
+        while not executor.reached(env.position):
+            obs = sim.step_skill(obs, SKILL_INDEX[name])
+            trajectory.append(env.position.copy())
+            steps += 1
+        results.append(
+            {
+                "type": name,
+                "amplitude": amplitude,
+                "steps": steps,
+                "progress": executor.progress,
+            }
+        )
+
+    return {
+        "final": trajectory[-1].tolist(),
+        "trajectory": np.array(trajectory).tolist(),
+        "actions": results,
+        "seconds": time.perf_counter() - start,
+    }
+
+
+_worker_sim = None
+
+
+def _init_worker(robot, config):
+    global _worker_sim
+    _worker_sim = load_sim(robot, config)
+
+
+def _run_in_worker(plan):
+    return run_plan(_worker_sim, plan)
+
+
+def run_plans(robot, plans, workers=0, config=None):
+    """
+    Run many plans, in this process or fanned out over `workers` processes
+    that each build the scene once.
+    """
+    if workers <= 1:
+        sim = load_sim(robot, config)
+        return [run_plan(sim, plan) for plan in plans]
+
+    # Genesis and CUDA do not survive a fork
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=context,
+        initializer=_init_worker,
+        initargs=(robot, config),
+    ) as pool:
+        return list(pool.map(_run_in_worker, plans))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("plans", help="JSON file with a plan or a list of plans")
+    parser.add_argument("--robot", choices=list(SIMS), default="g1")
+    parser.add_argument("--workers", type=int, default=0)
+    parser.add_argument("--out", help="write the results, trajectories included")
+    args = parser.parse_args()
+
+    plans = json.load(open(args.plans, "r"))
+    if isinstance(plans, dict):
+        plans = [plans]
+
+    start = time.perf_counter()
+    results = run_plans(args.robot, plans, workers=args.workers)
+    elapsed = time.perf_counter() - start
+
+    for i, result in enumerate(results):
+        x, y, yaw = result["final"]
+        steps = len(result["trajectory"]) - 1
+        print(
+            f"plan {i}: x {x:7.3f}  y {y:7.3f}  yaw {yaw:7.2f}  "
+            f"{steps} steps in {result['seconds']:.2f} s"
+        )
+    print(f"{len(results)} plans in {elapsed:.2f} s")
+
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(results, f)
+
+
+if __name__ == "__main__":
+    main()
@@ -2,6 +2,7 @@ import genesis as gs
 import numpy as np
 import logging
 
+from portal import ObjectRegistry
 
 logging.basicConfig(level=logging.ERROR)
 logger = logging.getLogger(__name__)
@@ -17,7 +18,6 @@ class BeatTheDeskEnv:
         ]
         self.init_arm_dofs = [0, 0, 0, 0, 0, 0, 0]
         self.init_finger_dofs = [0.1, 0.1]
-        self.cubes = []
 
         self.arm_jnt_names = [
             "joint1",
@@ -48,6 +48,7 @@ class BeatTheDeskEnv:
             show_FPS=False,
             rigid_options=gs.options.RigidOptions(max_collision_pairs=100),
         )
+        self.registry = ObjectRegistry(self.scene)
 
         _ = self.scene.add_entity(
             gs.morphs.Plane(),
@@ -222,7 +223,7 @@ class BeatTheDeskEnv:
                             default_roughness=1.0,
                         ),
                     )
-                    self.cubes.append({key: obj_})
+                    self.registry.add(key, obj_)
 
                 else:
                     obj_ = self.scene.add_entity(
@@ -235,4 +236,4 @@ class BeatTheDeskEnv:
                             smooth=True,
                         ),
                     )
-                    self.cubes.append({key: obj_})
+                    self.registry.add(key, obj_)
@@ -1,5 +1,6 @@
 import asyncio
-import aiohttp
+from portal.http import http_client
+from portal.dispatch import llm_dispatcher
 import json
 import logging
 from datetime import datetime
@@ -7,6 +8,7 @@ import numpy as np
 from fastapi import WebSocket, WebSocketDisconnect
 
 from utils.utils import (
+    clear_queue,
     encode_numpy_array,
     send_personal_message,
 )
@@ -27,16 +29,12 @@ class BeatTheDeskSim(SceneAbstract):
         self.res = res
 
     def get_cubes_locations(self):
-        return_list = []
-        for obj in self.env.cubes:
-            obj_ = {}
-            obj_[list(obj.keys())[0]] = [
-                int(float(x) * 100)
-                for x in list(list(obj.values())[0].get_pos().cpu().numpy())
-            ]
-            obj_[list(obj.keys())[0]][2] += 3
-            return_list.append(obj_)
-        return return_list
+        locations = self.env.registry.grid_positions(100)
+        locations[:, 2] += 3
+        return [
+            {name: location.tolist()}
+            for name, location in zip(self.env.registry.names, locations)
+        ]
 
     async def server_processor(
         self,
@@ -89,9 +87,9 @@ class BeatTheDeskSim(SceneAbstract):
                             self.env.cam_main = self.env.cam_480
 
                     elif message.get("type") == "stop":
-                        while not actions_queue.empty():
-                            actions_queue.get_nowait()
-                            actions_queue.task_done()
+                        # The running command would queue more actions
+                        llm_dispatcher.cancel(client_id)
+                        clear_queue(actions_queue)
 
                     if not actions_queue.empty():
                         action = np.array(await actions_queue.get())
@@ -182,6 +180,43 @@ class BeatTheDeskSim(SceneAbstract):
             logger.error(f"Server processor error for client {client_id}: {str(e)}")
             return
 
+    async def handle_command(self, message_data: dict, websocket: WebSocket, client_id: str, actions_queue: asyncio.Queue):
+        try:
+            robot_task_data = {
+                "instruction": message_data["content"],
+                "objects": self.get_cubes_locations(),
+            }
+
+            print(robot_task_data)
+
+            async with http_client.post(
+                "http://10.200.20.109:3348/robot/task",
+                headers={"Content-Type": "application/json"},
+                json=robot_task_data,
+            ) as response:
+                if response.status == 200:
+                    response_data = await response.json()
+                    logger.info(f"Robot task response: {response_data}")
+                    for action in response_data["actions"]:
+                        await actions_queue.put(action)
+
+                    await send_personal_message(
+                        websocket,
+                        json.dumps(
+                            {
+                                "type": "reasoning",
+                                "message": response_data["raw_output"],
+                            }
+                        ),
+                        client_id,
+                    )
+                else:
+                    logger.error(
+                        f"Robot task request failed with status {response.status}"
+                    )
+        except Exception as e:
+            logger.error(f"Error making robot task request: {str(e)}")
+
     async def client_handler(
         self,
         message_queue: asyncio.Queue,
@@ -203,42 +238,15 @@ class BeatTheDeskSim(SceneAbstract):
                     message_data = {"type": "message", "content": data}
 
                 if message_data.get("type") == "command":
-                    try:
-                        async with aiohttp.ClientSession() as session:
-                            robot_task_data = {
-                                "instruction": message_data["content"],
-                                "objects": self.get_cubes_locations(),
-                            }
-
-                            print(robot_task_data)
-
-                            async with session.post(
-                                "http://10.200.20.109:3348/robot/task",
-                                headers={"Content-Type": "application/json"},
-                                json=robot_task_data,
-                            ) as response:
-                                if response.status == 200:
-                                    response_data = await response.json()
-                                    logger.info(f"Robot task response: {response_data}")
-                                    for action in response_data["actions"]:
-                                        await actions_queue.put(action)
-
-                                    await send_personal_message(
-                                        websocket,
-                                        json.dumps(
-                                            {
-                                                "type": "reasoning",
-                                                "message": response_data["raw_output"],
-                                            }
-                                        ),
-                                        client_id,
-                                    )
-                                else:
-                                    logger.error(
-                                        f"Robot task request failed with status {response.status}"
-                                    )
-                    except Exception as e:
-                        logger.error(f"Error making robot task request: {str(e)}")
+                    # Runs on its own, a newer command cancels it
+                    llm_dispatcher.submit(
+                        client_id,
+                        lambda message_data=message_data: self.handle_command(
+                            message_data, websocket, client_id, actions_queue
+                        ),
+                        # The superseded plan's queued actions go with it
+                        on_supersede=lambda: clear_queue(actions_queue),
+                    )
 
                 else:
                     await message_queue.put(message_data)
@@ -251,6 +259,8 @@ class BeatTheDeskSim(SceneAbstract):
         except Exception as e:
             logger.error(f"Client handler error for client {client_id}: {str(e)}")
             raise
+        finally:
+            llm_dispatcher.cancel(client_id)
 
     def transform_objs(self):
         new_objs = []
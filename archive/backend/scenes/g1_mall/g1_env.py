@@ -10,6 +10,17 @@ from genesis.utils.geom import (
     transform_quat_by_quat,
 )
 
+from utils.camera_follow import CameraFollower
+from utils.idle_loop import env_fingerprint
+from scenes.g1_mall.motion_clips import (
+    ARM_KD,
+    ARM_KP,
+    L_ARM_JOINTS,
+    R_ARM_JOINTS,
+    AnimationController,
+    load_clips,
+)
+
 
 def gs_rand_float(lower, upper, shape, device):
     return (upper - lower) * torch.rand(size=shape, device=device) + lower
@@ -27,8 +38,11 @@ class G1Env:
         show_viewer=False,
         device="cuda",
         scene_config={},
+        inference_mode=False,
     ):
         self.device = torch.device(device)
+        # Skip training bookkeeping (rewards, contacts, termination) in step
+        self.inference_mode = inference_mode
 
         self.num_envs = num_envs
         self.num_obs = obs_cfg["num_obs"]
@@ -165,24 +179,21 @@ class G1Env:
         self.robot.set_dofs_kv([self.env_cfg["kd"]] *
                                self.num_actions, self.motor_dofs)
 
-        # right arm joints
-        self.r_arm_jnt_names = [
-            'right_shoulder_pitch_joint',
-            'right_shoulder_roll_joint',
-            'right_shoulder_yaw_joint',
-            'right_elbow_joint',
-            'right_wrist_roll_joint',
-        ]
+        # arm joints, driven by motion clips
+        self.r_arm_jnt_names = R_ARM_JOINTS
         self.r_arm_dofs_idx = [self.robot.get_joint(name).dof_idx_local for name in self.r_arm_jnt_names]
-        # left arm joints
-        self.l_arm_jnt_names = [
-            'left_shoulder_pitch_joint',
-            'left_shoulder_roll_joint',
-            'left_shoulder_yaw_joint',
-            'left_elbow_joint',
-            'left_wrist_roll_joint',
-        ]
+        self.l_arm_jnt_names = L_ARM_JOINTS
         self.l_arm_dofs_idx = [self.robot.get_joint(name).dof_idx_local for name in self.l_arm_jnt_names]
+        self.arm_dofs_idx = self.l_arm_dofs_idx + self.r_arm_dofs_idx
+
+        # arm gains never change, set them once instead of on every gesture step
+        self.robot.set_dofs_kp([ARM_KP] * len(self.arm_dofs_idx), self.arm_dofs_idx)
+        self.robot.set_dofs_kv([ARM_KD] * len(self.arm_dofs_idx), self.arm_dofs_idx)
+        self.gestures = AnimationController(
+            self.l_arm_jnt_names + self.r_arm_jnt_names,
+            load_clips(),
+            idle="receive_customer",
+        )
 
         # prepare reward functions and multiply reward scales by dt
         self.reward_functions, self.episode_sums = dict(), dict()
@@ -289,7 +300,11 @@ class G1Env:
             link = self.robot.get_link(name)
             link_id_local = link.idx_local
             self.termination_contact_indices.append(link_id_local)
-        self.position = self.base_init_pos.cpu().numpy()
+        self.follower = CameraFollower(
+            self,
+            [*self.base_init_pos[:2].tolist(), 0.0],
+            reset_nan=True,
+        )
         self.robot.control_dofs_position(
             np.array([0, 0, -0.3, 0.3, -0.2, 0, 0, 0, -0.3, 0.3, -0.2, 0]),
             self.motor_dofs,
@@ -323,17 +338,12 @@ class G1Env:
         )
         self.robot.control_dofs_position(target_dof_pos, self.motor_dofs)
         self.scene.step()
+        if self.inference_mode:
+            return self._inference_step(x, y, angle)
 
         # update buffers
         self.episode_length_buf += 1
         self.base_pos[:] = self.robot.get_pos()
-        # For unknown reasons, it gets NaN values in self.robot.get_*() sometimes
-        if torch.isnan(self.base_pos).any():
-            nan_envs = (
-                torch.isnan(self.base_pos).any(
-                    dim=1).nonzero(as_tuple=False).flatten()
-            )
-            self.reset_idx(nan_envs)
         self.base_quat[:] = self.robot.get_quat()
         self.base_euler = quat_to_xyz(
             transform_quat_by_quat(
@@ -351,43 +361,10 @@ class G1Env:
             self.global_gravity, inv_base_quat)
         self.dof_pos[:] = self.robot.get_dofs_position(self.motor_dofs)
         self.dof_vel[:] = self.robot.get_dofs_velocity(self.motor_dofs)
+        self.follower.mask_nan()
 
-        base_pose_cpu = self.base_pos[0].cpu().numpy()
-        base_euler_cpu = self.base_euler[0, 2].cpu().numpy()
-        self.position[:2] = base_pose_cpu[:2]
-        self.position[2] = float(base_euler_cpu)
-
-        self.cam.set_pose(
-            pos=base_pose_cpu
-            - np.array(
-                [
-                    3 * math.cos(math.radians(base_euler_cpu)),
-                    3 * math.sin(math.radians(base_euler_cpu)),
-                    -1,
-                ]
-            ),
-            lookat=(
-                1000000 * math.cos(math.radians(base_euler_cpu)),
-                1000000 * math.sin(math.radians(base_euler_cpu)),
-                1,
-            ),
-        )
-
-        self.cam_first.set_pose(
-            pos=base_pose_cpu
-            + np.array(
-                [
-                    0.3 * math.cos(math.radians(base_euler_cpu)),
-                    0.3 * math.sin(math.radians(base_euler_cpu)),
-                    1,
-                ]
-            ),
-            lookat=(
-                1000000 * math.cos(math.radians(base_euler_cpu)),
-                1000000 * math.sin(math.radians(base_euler_cpu)),
-                1,
-            ),
-        )
+        # Camera follow and position are read back lazily, see update_cameras
+        self.follower.invalidate()
 
         # resample commands
         envs_idx = (
@@ -409,15 +386,9 @@ class G1Env:
             < self.env_cfg["termination_if_pelvis_z_less_than"]
         )
 
-        time_out_idx = (
-            (self.episode_length_buf > self.max_episode_length)
-            .nonzero(as_tuple=False)
-            .flatten()
-        )
-        self.extras["time_outs"] = torch.zeros_like(
-            self.reset_buf, device=self.device, dtype=gs.tc_float
-        )
-        self.extras["time_outs"][time_out_idx] = 1.0
+        self.extras["time_outs"] = (
+            self.episode_length_buf > self.max_episode_length
+        ).to(gs.tc_float)
 
         # self.reset_idx(self.reset_buf.nonzero(as_tuple=False).flatten())
 
@@ -493,6 +464,50 @@ class G1Env:
 
         return self.obs_buf, None, self.rew_buf, self.reset_buf, self.extras
 
+    def _inference_step(self, x, y, angle):
+        # Only the state the policy observations and the cameras read, written
+        # into the preallocated obs buffer. No rewards, contacts, termination
+        # or command resampling.
+        self.episode_length_buf += 1
+        self.base_pos[:] = self.robot.get_pos()
+        self.base_quat[:] = self.robot.get_quat()
+        self.base_euler = quat_to_xyz(
+            transform_quat_by_quat(
+                torch.ones_like(self.base_quat) * self.inv_base_init_quat,
+                self.base_quat,
+            )
+        )
+        inv_base_quat = inv_quat(self.base_quat)
+        self.base_ang_vel[:] = transform_by_quat(self.robot.get_ang(), inv_base_quat)
+        self.projected_gravity = transform_by_quat(self.global_gravity, inv_base_quat)
+        self.dof_pos[:] = self.robot.get_dofs_position(self.motor_dofs)
+        self.dof_vel[:] = self.robot.get_dofs_velocity(self.motor_dofs)
+        self.follower.mask_nan()
+        self.follower.invalidate()
+
+        period = 0.8
+        phase = 2 * np.pi * ((self.episode_length_buf * self.dt) % period / period)
+
+        n = self.num_actions
+        obs = self.obs_buf
+        torch.mul(self.base_ang_vel, self.obs_scales["ang_vel"], out=obs[:, 0:3])
+        obs[:, 3:6] = self.projected_gravity
+        torch.sub(self.dof_pos, self.default_dof_pos, out=obs[:, 9 : 9 + n])
+        obs[:, 9 : 9 + n] *= self.obs_scales["dof_pos"]
+        torch.mul(self.dof_vel, self.obs_scales["dof_vel"], out=obs[:, 9 + n : 9 + 2 * n])
+        obs[:, 9 + 2 * n : 9 + 3 * n] = self.actions
+        torch.sin(phase, out=obs[:, 9 + 3 * n])
+        torch.cos(phase, out=obs[:, 10 + 3 * n])
+        obs.clamp_(-self.env_cfg["clip_observations"], self.env_cfg["clip_observations"])
+        obs[:, 6] = x
+        obs[:, 7] = y
+        obs[:, 8] = angle
+
+        self.last_actions[:] = self.actions
+        self.counter += 1
+
+        return obs, None, self.rew_buf, self.reset_buf, self.extras
+
     def randomize_friction(self):
         if self.counter % int(self.domain_rand_cfg["push_interval_s"] / self.dt) == 0:
             friction_range = self.domain_rand_cfg["friction_range"]
@@ -608,12 +623,20 @@ class G1Env:
             self.episode_sums[key][envs_idx] = 0.0
 
         self._resample_commands(envs_idx)
+        self.follower.invalidate()
 
     def reset(self):
         self.reset_buf[:] = True
         self.reset_idx(torch.arange(self.num_envs, device=self.device, dtype=torch.long))
         return self.obs_buf, None
 
+    @property
+    def position(self):
+        return self.follower.position
+
+    def update_cameras(self):
+        self.follower.update(self.cam, self.cam_first)
+
     # ------------ reward functions----------------
     def _reward_tracking_lin_vel(self):
         # Tracking of linear velocity commands (xy axes)
@@ -748,68 +771,22 @@ class G1Env:
                     setattr(self, entity["name"], mesh_entity)
 
         # Build the scene with the specified number of environments
-    def _greeting(self,step):
-        step = step % 200
-        # PD control parameters
-        arm_kp = 60
-        arm_kd = 20
-        self.robot.set_dofs_kp([arm_kp] * len(self.r_arm_jnt_names), self.r_arm_dofs_idx)
-        self.robot.set_dofs_kv([arm_kd] * len(self.r_arm_jnt_names), self.r_arm_dofs_idx)
-
-        default_dof_pos = np.array([0, 0, 0, 0.5, 0])
-        arm_wave_dafault_dof_pos = np.array([0, -0.9, -1.5, -0.65, 0])
-        target_dof_pos = np.array(arm_wave_dafault_dof_pos)
-        # waving arm
-        if step <150:
-        # for i in range(150):
-            # print(i)
-            w = 0.5 * np.sin(2 * np.pi * step / 50)  # Sine wave with amplitude 0.2 and period 50
-            self.robot.control_dofs_position(target_dof_pos + [0, w, 0, w, 0], self.r_arm_dofs_idx)
-            self.scene.step()
-        # return arm to default position
-        elif step < 200:
-        # for i in range(50):
-            self.robot.control_dofs_position(default_dof_pos, self.r_arm_dofs_idx)
-            self.scene.step() 
-    def _head_scratch(self, step):
-        step = step %130
-        # PD control parameters
-        arm_kp = 60
-        arm_kd = 20
-        self.robot.set_dofs_kp([arm_kp] * len(self.l_arm_jnt_names), self.l_arm_dofs_idx)
-        self.robot.set_dofs_kv([arm_kd] * len(self.l_arm_jnt_names), self.l_arm_dofs_idx)
-
-        default_dof_pos = np.array([0, 0, 0, 0.5, 0])
-        target_dafault_dof_pos = np.array([-1.3, 1.0, 0.3, -0.9, -0.6])
-        # waving arm
-        # for i in range(80):
-        if step < 80:
-            w = 0.2 * np.sin(4 * np.pi * step / 50)  # Sine wave with amplitude 0.2 and period 50
-            target_dof_pos = target_dafault_dof_pos + [0, 0, 0, w, 0]
-            self.robot.control_dofs_position(target_dof_pos, self.l_arm_dofs_idx)
-            self.robot.control_dofs_position(default_dof_pos, self.r_arm_dofs_idx)
-            self.scene.step()
-        # return arm to default position
-        # for i in range(50):
-        elif step < 130:
-            self.robot.control_dofs_position(default_dof_pos, self.l_arm_dofs_idx)
-            self.scene.step() 
-
-    def _receive_customer(self, step):
-        step = step %80
-        # PD control parameters
-        arm_kp = 60
-        arm_kd = 20
-        self.robot.set_dofs_kp([arm_kp] * len(self.r_arm_jnt_names), self.r_arm_dofs_idx)
-        self.robot.set_dofs_kv([arm_kd] * len(self.r_arm_jnt_names), self.r_arm_dofs_idx)
-        self.robot.set_dofs_kp([arm_kp] * len(self.l_arm_jnt_names), self.l_arm_dofs_idx)
-        self.robot.set_dofs_kv([arm_kd] * len(self.l_arm_jnt_names), self.l_arm_dofs_idx)
-
-        default_dof_pos = np.array([0, 0, 0, 0.5, 0])
-        target_l_dof_pos = np.array([-0.18, 0.81, -1.36, -0.325, -0.2])
-        target_r_dof_pos = np.array([-0.353, -0.87, 1.34, -0.3, 0.5])
-        # waving arm
-        # for i in range(80):
-        self.robot.control_dofs_position(target_l_dof_pos, self.l_arm_dofs_idx)
-        self.robot.control_dofs_position(target_r_dof_pos, self.r_arm_dofs_idx)
-        self.scene.step()
\ No newline at end of file
+
+    def play_gesture(self, name, priority=0):
+        self.gestures.request(name, priority)
+
+    def stop_gesture(self):
+        self.gestures.stop()
+
+    def step_gesture(self):
+        self.robot.control_dofs_position(self.gestures.step(), self.arm_dofs_idx)
+        self.scene.step()
+
+    def idle_fingerprint(self):
+        """
+        `env_fingerprint` plus the arm joints and their targets: step_gesture
+        steps the scene without refreshing the locomotion buffers, the arms
+        are what moves while idling.
+        """
+        arms = self.robot.get_dofs_position(self.arm_dofs_idx)[0].cpu().numpy()
+        return np.concatenate([env_fingerprint(self), arms, self.gestures.target])
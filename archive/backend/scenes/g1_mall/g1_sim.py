@@ -10,23 +10,34 @@ from datetime import datetime
 from scenes.g1_mall.g1_env import G1Env
 from rsl_rl.runners import OnPolicyRunner
 from utils.utils import (
+    clear_queue,
     encode_numpy_array,
     send_personal_message,
     send_openai_request,
     parse_json_from_mixed_string,
     decode_base64_to_audio,
     encode_audio_to_base64,
-    parse_action_robot_in_mall
+    parse_action_robot_in_mall,
+    robot_state_key,
 )
 from utils.system_prompt import SYSTEM_PROMPT, SYSTEM_PROMPT_WAREHOUSE
+from scenes.g1_mall.motion_clips import PRIORITY_ACTION, PRIORITY_SIGNAL
+from utils.idle_loop import IdleLoopCache, load_env_state, save_env_state
+from utils.speculative import SpeculativeStream
+from utils.control_signals import SignalDetector
 import logging
 from config import Config
+from portal.dispatch import llm_dispatcher
+from portal.sse import delta_content
 from services.LLMService import AsyncOpenAIChatCompletionService
 from services.AudioService import AudioService
 
 logging.basicConfig(level=logging.ERROR)
 logger = logging.getLogger(__name__)
 
+# Longest idle loop recorded, frames kept per (camera, zoom) view
+IDLE_LOOP_MAX_FRAMES = 10
+
 
 class G1SimMall(SceneAbstract):
     def __init__(self, config={}):
@@ -55,20 +66,12 @@ class G1SimMall(SceneAbstract):
             command_cfg=command_cfg,
             domain_rand_cfg=domain_rand_cfg,
             show_viewer=False,
-            scene_config=config
+            scene_config=config,
+            inference_mode=True,
         )
 
         return
 
-    def transform(self, action, amplitude):
-        if action == 1:  # left
-            amplitude = amplitude * 100 / 45
-        elif action == 0:  # right
-            amplitude = amplitude * 90 / 45
-        elif action == 3:
-            amplitude = amplitude * 120
-        return amplitude
-
     def apply_policy(self, policy, env, obs, num_steps=1000):
         # env.reset()
         for _ in range(num_steps):
@@ -76,63 +79,86 @@ class G1SimMall(SceneAbstract):
             obs, _, rews, dones, infos = env.step(action)
         return obs
 
-    async def handle_voice_command(self, message_data: dict, websocket: WebSocket, client_id: str, actions_queue: asyncio.Queue):
-        if message_data.get("content"):
-            final_answer = ""
-            audio_byte_input = decode_base64_to_audio(message_data["content"])
-            content = await self.audio_service.stt(audio_data=audio_byte_input)
-            robot_position = str(self.env.position)
-            content += ". Robot is at the position " + robot_position
-            async for chunk in self.llm_service.chat_completion_stream(message_content=content):
+    async def stream_answer(self, chunks, websocket: WebSocket, client_id: str, actions_queue: asyncio.Queue, speak: bool = False):
+        """
+        Forward an LLM answer as it streams: every chunk to the UI as
+        reasoning, its control tokens as gestures, once each even when a
+        token is split over chunks, and with `speak` the rest of the text
+        to TTS.
+
+        Returns:
+            str: The answer without its control tokens.
+        """
+        detector = SignalDetector()
+        final_answer = ""
+        async for chunk in chunks:
+            chunk_content = delta_content(chunk)
+            await send_personal_message(
+                websocket,
+                json.dumps({"type": "reasoning", "message": chunk_content}),
+                client_id,
+            )
+            text, signals = detector.feed(chunk_content)
+            for token, gesture in signals:
+                await actions_queue.put((gesture, PRIORITY_SIGNAL))
                 await send_personal_message(
                     websocket,
                     json.dumps(
-                        {
-                            "type": "reasoning",
-                            "message": chunk["choices"][0]["delta"].get(
-                                "content", ""
-                            ),
-                        }
+                        {"type": "output", "message": gesture, "signal": token}
                     ),
                     client_id,
                 )
-                chunk_content = chunk["choices"][0]["delta"].get("content", "")
-                if chunk_content in "GOODBYE" and chunk_content != "":
-                    await actions_queue.put(
-                        "greeting"
-                    )
-                    await send_personal_message(
-                        websocket,
-                        json.dumps(
-                            {
-                                "type": "output",
-                                "message": "greeting",
-                                "signal": chunk_content
-                            }
-                        ),
-                        client_id,
-                    )
-                    continue
-                elif chunk_content in "UNKNOWN" and chunk_content != "":
-                    await actions_queue.put("head_scratch")
-                    await send_personal_message(
-                        websocket,
-                        json.dumps(
-                            {
-                                "type": "output",
-                                "message": "head_scratch",
-                                "signal": chunk_content
-                            }
-                        ),
-                        client_id,
-                    )
-                    continue
-                final_answer += chunk_content
-                await self.audio_service.llm_text_queue.put(chunk)
-                # self.audio_service.llm_text_queue.task_done()
-            # send end signal
-            await self.audio_service.llm_text_queue.put(None)
-            # self.audio_service.llm_text_queue.task_done()
+            final_answer += text
+            if speak and text:
+                await self.audio_service.llm_text_queue.put(
+                    {"choices": [{"delta": {"content": text}}]})
+
+        text = detector.flush()
+        final_answer += text
+        if speak and text:
+            await self.audio_service.llm_text_queue.put(
+                {"choices": [{"delta": {"content": text}}]})
+        return final_answer
+
+    async def handle_voice_command(self, message_data: dict, websocket: WebSocket, client_id: str, actions_queue: asyncio.Queue):
+        if message_data.get("content"):
+            audio_byte_input = decode_base64_to_audio(message_data["content"])
+            position = self.env.position
+
+            def ask(instruction, accepted=None):
+                return self.llm_service.chat_completion_stream(
+                    message_content=instruction + ". Robot is at the position " + str(position),
+                    instruction=instruction,
+                    state=robot_state_key(position),
+                    accepted=accepted,
+                )
+
+            if Config.speculative_stt:
+                # The LLM starts on the partial transcript while STT
+                # finishes, and is restarted if the final one differs
+                speculative = SpeculativeStream(ask, Config.speculative_min_words)
+                instruction = ""
+                try:
+                    async for event in self.audio_service.stt_stream(audio_byte_input):
+                        if "partial" in event:
+                            speculative.propose(event["partial"])
+                        if "text" in event:
+                            instruction = event["text"]
+                except BaseException:
+                    # STT failed or the command was superseded
+                    speculative.cancel()
+                    raise
+                chunks = speculative.result(instruction)
+            else:
+                instruction = await self.audio_service.stt(audio_data=audio_byte_input)
+                chunks = ask(instruction)
+
+            try:
+                final_answer = await self.stream_answer(
+                    chunks, websocket, client_id, actions_queue, speak=True)
+            finally:
+                # send end signal, also when a newer command cancels this one
+                self.audio_service.llm_text_queue.put_nowait(None)
             actions = parse_action_robot_in_mall(final_answer)
             print(final_answer)
             if actions is None:
@@ -150,11 +176,7 @@ class G1SimMall(SceneAbstract):
                 try:
                     actions = actions["actions"]
                     for action in actions:
-                        await actions_queue.put(
-
-                            action["type"]
-
-                        )
+                        await actions_queue.put((action["type"], PRIORITY_ACTION))
 
                     await send_personal_message(
                         websocket,
@@ -171,55 +193,19 @@ class G1SimMall(SceneAbstract):
                     pass
 
     async def handle_text_command(self, message_data: dict, websocket: WebSocket, client_id: str, actions_queue: asyncio.Queue):
-        final_answer = ""
         content = message_data.get("content", "")
-        robot_position = str(self.env.position)
-        content += ". Robot is at the position " + robot_position
-        async for chunk in self.llm_service.chat_completion_stream(message_content=content):
-            await send_personal_message(
-                websocket,
-                json.dumps(
-                    {
-                        "type": "reasoning",
-                        "message": chunk["choices"][0]["delta"].get(
-                            "content", ""
-                        ),
-                    }
-                ),
-                client_id,
-            )
-            chunk_content = chunk["choices"][0]["delta"].get("content", "")
-            if chunk_content in "GOODBYE" and chunk_content != "":
-                await actions_queue.put(
-                    "greeting"
-                )
-                await send_personal_message(
-                    websocket,
-                    json.dumps(
-                        {
-                            "type": "output",
-                            "message": "greeting",
-                            "signal": chunk_content
-                        }
-                    ),
-                    client_id,
-                )
-                continue
-            elif chunk_content in "UNKNOWN" and chunk_content != "":
-                await actions_queue.put("head_scratch")
-                await send_personal_message(
-                    websocket,
-                    json.dumps(
-                        {
-                            "type": "output",
-                            "message": "head_scratch",
-                            "signal": chunk_content
-                        }
-                    ),
-                    client_id,
-                )
-                continue
-            final_answer += chunk_content
+        position = self.env.position
+        content += ". Robot is at the position " + str(position)
+        final_answer = await self.stream_answer(
+            self.llm_service.chat_completion_stream(
+                message_content=content,
+                instruction=message_data.get("content", ""),
+                state=robot_state_key(position),
+            ),
+            websocket,
+            client_id,
+            actions_queue,
+        )
         actions = parse_action_robot_in_mall(final_answer)
         print(final_answer)
         if actions is None:
@@ -237,11 +223,7 @@ class G1SimMall(SceneAbstract):
             try:
                 actions = actions["actions"]
                 for action in actions:
-                    await actions_queue.put(
-
-                        action["type"]
-
-                    )
+                    await actions_queue.put((action["type"], PRIORITY_ACTION))
 
                 await send_personal_message(
                     websocket,
@@ -265,13 +247,21 @@ class G1SimMall(SceneAbstract):
         websocket: WebSocket,
     ):
 
+        gestures = {
+            "talking": "receive_customer",
+            "greeting": "greeting",
+            "head_scratch": "head_scratch",
+        }
+
         # obs, _ = self.env.reset()
         main = 0
         zoom = 0
+        # The idle pose is replayed from here instead of rendered. It is held
+        # still, so a short loop is enough and bounds the frames per view
+        idle_loop = IdleLoopCache(
+            max_period=IDLE_LOOP_MAX_FRAMES, enabled=Config.idle_loop_cache
+        )
         try:
-            steps = 200
-            step = 0
-            stop = True
             def_pos = self.env.cam_god.pos
             while True:
                 try:
@@ -296,25 +286,36 @@ class G1SimMall(SceneAbstract):
                                 zoom += 0.1
 
                     elif message.get("type") == "stop":
-                        stop = True
+                        self.env.stop_gesture()
+                        # The running command would queue more gestures
+                        llm_dispatcher.cancel(client_id)
                         # erase the actions queue
-                        while not actions_queue.empty():
-                            actions_queue.get_nowait()
-                            actions_queue.task_done()
+                        clear_queue(actions_queue)
 
                     elif message.get("type") == "camera_change":
                         main = message.get("camera")
 
-                    if (not actions_queue.empty()) and stop == True:
-                        action = await actions_queue.get()
-                        step = 0
-                        stop = False
+                    # Hand every pending gesture to the animation controller
+                    # right away, it decides what interrupts and what waits
+                    while not actions_queue.empty():
+                        action, priority = actions_queue.get_nowait()
+                        self.env.play_gesture(
+                            gestures.get(action, "receive_customer"), priority
+                        )
+                    idle = self.env.gestures.is_idle
+                    if not idle:
+                        idle_loop.invalidate()
 
                     # render image then send message to client
 
-                    if step < steps:
-                        step += 1
+                    view = (main, round(zoom, 2))
+                    frame = idle_loop.replay(view)
+                    if frame is None:
+                        state = idle_loop.resume_state()
+                        if state is not None:
+                            load_env_state(self.env, state)
 
+                        self.env.update_cameras()
                         if main == 0:
                             main_view, _, _, _ = self.env.cam_first.render()
                         else:
@@ -328,39 +329,26 @@ class G1SimMall(SceneAbstract):
 
                         main_view = main_view[:, :, ::-1]
                         god_view = god_view[:, :, ::-1]
-                        with torch.no_grad():
-                            if stop:
-                                steps = 80
-                                self.env._receive_customer(step)
-                            else:
-
-                                if action == "talking":
-                                    steps = 80
-                                    self.env._receive_customer(step)
-                                elif action == "greeting":
-                                    steps = 200
-                                    self.env._greeting(step)
-                                elif action == "head_scratch":
-                                    steps = 130
-                                    self.env._head_scratch(step)
-                                else:
-                                    steps = 80
-                                    self.env._receive_customer(step)
 
                         processed_message = {
                             "type": "streaming_view",
                             "main_view": encode_numpy_array(main_view),
                             "god_view": encode_numpy_array(god_view),
                         }
+                        frame = json.dumps(processed_message)
+                        if idle:
+                            # Before stepping, the state the frame shows
+                            idle_loop.record(
+                                view,
+                                frame,
+                                self.env.idle_fingerprint,
+                                lambda: save_env_state(self.env),
+                            )
+                        self.env.step_gesture()
+
+                    await send_personal_message(websocket, frame, client_id)
+                    await asyncio.sleep(0.001)
 
-                        await send_personal_message(
-                            websocket, json.dumps(processed_message), client_id
-                        )
-                        await asyncio.sleep(0.001)
-
-                    else:
-                        step = 0
-                        stop = True
                 except WebSocketDisconnect:
                     logger.error("Websocket disconnected")
                     return
@@ -396,7 +384,7 @@ class G1SimMall(SceneAbstract):
         last_activity: datetime,
     ):
         try:
-            await actions_queue.put("greeting")
+            await actions_queue.put(("greeting", PRIORITY_ACTION))
             while True:
                 # Wait for message from client
                 data = await websocket.receive_text()
@@ -407,11 +395,23 @@ class G1SimMall(SceneAbstract):
                 except json.JSONDecodeError:
                     message_data = {"type": "message", "content": data}
 
-                # Add client message to processing queue
+                # Add client message to processing queue, commands run on
+                # their own and a newer one cancels them
                 if message_data.get("type") == "command":
-                    await self.handle_text_command(message_data, websocket, client_id, actions_queue)
+                    llm_dispatcher.submit(
+                        client_id,
+                        lambda message_data=message_data: self.handle_text_command(
+                            message_data, websocket, client_id, actions_queue),
+                        # The superseded answer's queued gestures go with it
+                        on_supersede=lambda: clear_queue(actions_queue),
+                    )
                 elif message_data.get("type") == "voice":
-                    await self.handle_voice_command(message_data, websocket, client_id, actions_queue)
+                    llm_dispatcher.submit(
+                        client_id,
+                        lambda message_data=message_data: self.handle_voice_command(
+                            message_data, websocket, client_id, actions_queue),
+                        on_supersede=lambda: clear_queue(actions_queue),
+                    )
                 else:
                     await message_queue.put(message_data)
                 last_activity = datetime.now()
@@ -424,3 +424,5 @@ class G1SimMall(SceneAbstract):
             logger.error(
                 f"Client handler error for client {client_id}: {str(e)}")
             raise
+        finally:
+            llm_dispatcher.cancel(client_id)
@@ -0,0 +1,249 @@
+import heapq
+import os
+import sys
+
+import numpy as np
+
+CLIP_DIR = os.path.join(os.path.dirname(os.path.realpath(__file__)), "clips")
+
+# PD gains of the arm joints while playing gestures
+ARM_KP = 60
+ARM_KD = 20
+
+# Steps of the crossfade whenever a gesture starts, is interrupted or ends
+CLIP_BLEND_STEPS = 10
+
+# Gesture priorities, signals from speech interrupt planned actions
+PRIORITY_ACTION = 1
+PRIORITY_SIGNAL = 2
+
+L_ARM_JOINTS = [
+    "left_shoulder_pitch_joint",
+    "left_shoulder_roll_joint",
+    "left_shoulder_yaw_joint",
+    "left_elbow_joint",
+    "left_wrist_roll_joint",
+]
+R_ARM_JOINTS = [
+    "right_shoulder_pitch_joint",
+    "right_shoulder_roll_joint",
+    "right_shoulder_yaw_joint",
+    "right_elbow_joint",
+    "right_wrist_roll_joint",
+]
+ARM_REST_POS = [0, 0, 0, 0.5, 0]
+
+
+class MotionClip:
+    """
+    Joint position keyframes of a gesture, one row per control step.
+
+    Args:
+        name (str): Clip name, also the file name on disk.
+        joints (list): Names of the joints the clip drives.
+        frames: (T, len(joints)) joint position targets.
+        loop (bool): Restart from the first frame instead of ending.
+    """
+
+    def __init__(self, name, joints, frames, loop=False):
+        self.name = name
+        self.joints = list(joints)
+        self.frames = np.asarray(frames, dtype=np.float32).reshape(-1, len(self.joints))
+        self.loop = loop
+
+    def __len__(self):
+        return len(self.frames)
+
+    def save(self, directory=CLIP_DIR):
+        os.makedirs(directory, exist_ok=True)
+        np.savez(
+            os.path.join(directory, self.name + ".npz"),
+            joints=np.array(self.joints),
+            frames=self.frames,
+            loop=self.loop,
+        )
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            return cls(
+                name=os.path.splitext(os.path.basename(path))[0],
+                joints=data["joints"].tolist(),
+                frames=data["frames"],
+                loop=bool(data["loop"]),
+            )
+
+
+def default_clips():
+    """
+    The built-in mall gestures, sampled from their sine formulas once.
+    """
+    rest = np.array(ARM_REST_POS)
+
+    # Wave the right arm for 150 steps, then lower it
+    w = 0.5 * np.sin(2 * np.pi * np.arange(150) / 50)
+    wave = np.array([0, -0.9, -1.5, -0.65, 0]) + np.outer(w, [0, 1, 0, 1, 0])
+    greeting = MotionClip(
+        "greeting", R_ARM_JOINTS, np.concatenate([wave, np.tile(rest, (50, 1))])
+    )
+
+    # Scratch the head with the left arm for 80 steps, right arm at rest
+    w = 0.2 * np.sin(4 * np.pi * np.arange(80) / 50)
+    scratch = np.array([-1.3, 1.0, 0.3, -0.9, -0.6]) + np.outer(w, [0, 0, 0, 1, 0])
+    left = np.concatenate([scratch, np.tile(rest, (50, 1))])
+    head_scratch = MotionClip(
+        "head_scratch",
+        L_ARM_JOINTS + R_ARM_JOINTS,
+        np.concatenate([left, np.tile(rest, (len(left), 1))], axis=1),
+    )
+
+    receive_customer = MotionClip(
+        "receive_customer",
+        L_ARM_JOINTS + R_ARM_JOINTS,
+        [[-0.18, 0.81, -1.36, -0.325, -0.2, -0.353, -0.87, 1.34, -0.3, 0.5]],
+        loop=True,
+    )
+
+    return {clip.name: clip for clip in (greeting, head_scratch, receive_customer)}
+
+
+def load_clips(directory=CLIP_DIR):
+    """
+    Built-in clips, overridden and extended by the .npz clips in `directory`.
+    """
+    clips = default_clips()
+    if os.path.isdir(directory):
+        for file in sorted(os.listdir(directory)):
+            if file.endswith(".npz"):
+                clip = MotionClip.load(os.path.join(directory, file))
+                clips[clip.name] = clip
+    return clips
+
+
+class _Layer:
+    def __init__(self, clip, priority, cols):
+        self.clip = clip
+        self.priority = priority
+        self.cols = cols
+        self.frame = 0
+
+    def read(self):
+        """
+        Current frame, looping clips wrap around. None once the clip ended.
+        """
+        if self.frame >= len(self.clip):
+            if not self.clip.loop:
+                return None
+            self.frame = 0
+        frame = self.clip.frames[self.frame]
+        self.frame += 1
+        return frame
+
+
+class AnimationController:
+    """
+    Layered gesture playback on a fixed set of joints.
+
+    The idle clip loops underneath and a gesture plays on top of it on its
+    own joints. Gestures have a priority: a request above the priority of
+    the running gesture replaces it on the next step, others wait in the
+    queue and play in priority then arrival order. Every change of layers (a gesture starting, interrupting
+    another or ending) crossfades from the pose shown at that moment over
+    `fade` steps, so nothing snaps. Each step is one indexed read of the
+    precomputed frames per layer.
+    """
+
+    def __init__(self, joints, clips, idle, fade=CLIP_BLEND_STEPS):
+        self.joints = list(joints)
+        self.clips = clips
+        self.fade = fade
+        self.queue = []
+        self.gesture = None
+        self.target = np.zeros(len(self.joints), dtype=np.float32)
+
+        self._columns = {name: i for i, name in enumerate(self.joints)}
+        self._seq = 0
+        self.idle = self._layer(idle, priority=None)
+        self._from = None
+        self._fade_tick = 0
+
+    def _layer(self, name, priority):
+        clip = self.clips[name]
+        cols = np.array([self._columns[joint] for joint in clip.joints])
+        return _Layer(clip, priority, cols)
+
+    def _crossfade(self):
+        self._from = self.target.copy()
+        self._fade_tick = 0
+
+    def request(self, name, priority=0):
+        """
+        Play a gesture. Requesting the idle clip ends the running gesture if
+        the priority is higher, and is dropped otherwise.
+        """
+        running = self.gesture.priority if self.gesture is not None else None
+        if running is not None and priority <= running:
+            if name != self.idle.clip.name:
+                heapq.heappush(self.queue, (-priority, self._seq, name))
+                self._seq += 1
+            return
+
+        if name == self.idle.clip.name:
+            self.gesture = None
+        else:
+            self.gesture = self._layer(name, priority)
+        self._crossfade()
+
+    def stop(self):
+        """
+        Drop the queue and fade back to idle.
+        """
+        self.queue.clear()
+        if self.gesture is not None:
+            self.gesture = None
+            self._crossfade()
+
+    @property
+    def is_idle(self):
+        return self.gesture is None and not self.queue
+
+    def step(self):
+        """
+        Advance one frame.
+
+        Returns:
+            numpy.ndarray: Targets of all joints, in `joints` order.
+        """
+        pose = self.target.copy() if self._from is None else self._from.copy()
+        pose[self.idle.cols] = self.idle.read()
+
+        if self.gesture is not None:
+            frame = self.gesture.read()
+            if frame is None:
+                if self.queue:
+                    priority, _, name = heapq.heappop(self.queue)
+                    self.gesture = self._layer(name, -priority)
+                    frame = self.gesture.read()
+                else:
+                    self.gesture = None
+                self._crossfade()
+            if self.gesture is not None:
+                pose[self.gesture.cols] = frame
+
+        if self._from is not None:
+            self._fade_tick += 1
+            alpha = self._fade_tick / (self.fade + 1)
+            pose = self._from + alpha * (pose - self._from)
+            if self._fade_tick >= self.fade:
+                self._from = None
+
+        self.target[:] = pose
+        return self.target
+
+
+if __name__ == "__main__":
+    # Write the built-in clips as data files to start new gestures from
+    directory = sys.argv[1] if len(sys.argv) > 1 else CLIP_DIR
+    for clip in default_clips().values():
+        clip.save(directory)
+        print(f"Saved {clip.name} ({len(clip)} frames) to {directory}")
@@ -9,6 +9,8 @@ from genesis.utils.geom import (
 )
 import numpy as np
 
+from utils.camera_follow import CameraFollower
+
 
 def gs_rand_float(lower, upper, shape, device):
     return (upper - lower) * torch.rand(size=shape, device=device) + lower
@@ -24,9 +26,12 @@ class Go2Env:
         command_cfg,
         show_viewer=False,
         device="cuda",
-        scene_config={}
+        scene_config={},
+        inference_mode=False,
     ):
         self.device = torch.device(device)
+        # Skip training bookkeeping (rewards, termination) in step
+        self.inference_mode = inference_mode
 
         self.num_envs = num_envs
         self.num_obs = obs_cfg["num_obs"]
@@ -205,6 +210,7 @@ class Go2Env:
         self.base_quat = torch.zeros(
             (self.num_envs, 4), device=self.device, dtype=gs.tc_float
         )
+        self.base_euler = torch.zeros_like(self.base_pos)
         self.default_dof_pos = torch.tensor(
             [
                 self.env_cfg["default_joint_angles"][name]
@@ -216,7 +222,9 @@ class Go2Env:
         self.extras = dict()  # extra information for logging
         # self.cam.start_recording()
         # self.cam_first.start_recording()
-        self.position = [0, 0, 0]
+        self.follower = CameraFollower(
+            self, [0, 0, 0], chase_height=0.3, first_height=0.0
+        )
 
     def _resample_commands(self, envs_idx):
         self.commands[envs_idx, 0] = gs_rand_float(
@@ -242,6 +250,8 @@ class Go2Env:
         )
         self.robot.control_dofs_position(target_dof_pos, self.motor_dofs)
         self.scene.step()
+        if self.inference_mode:
+            return self._inference_step()
 
         # update buffers
         self.episode_length_buf += 1
@@ -262,42 +272,8 @@ class Go2Env:
             self.global_gravity, inv_base_quat)
         self.dof_pos[:] = self.robot.get_dofs_position(self.motor_dofs)
         self.dof_vel[:] = self.robot.get_dofs_velocity(self.motor_dofs)
-        base_pose_cpu = self.base_pos[0].cpu().numpy()
-        base_euler_cpu = self.base_euler[0, 2].cpu().numpy()
-        self.position[:2] = base_pose_cpu[:2]
-        self.position[2] = float(base_euler_cpu)
-        # print(self.base_euler)
-        self.cam.set_pose(
-            pos=base_pose_cpu
-            - np.array(
-                [
-                    3 * math.cos(math.radians(base_euler_cpu)),
-                    3 * math.sin(math.radians(base_euler_cpu)),
-                    -0.3,
-                ]
-            ),
-            lookat=(
-                1000000 * math.cos(math.radians(base_euler_cpu)),
-                1000000 * math.sin(math.radians(base_euler_cpu)),
-                1,
-            ),
-        )
-
-        self.cam_first.set_pose(
-            pos=base_pose_cpu
-            + np.array(
-                [
-                    0.3 * math.cos(math.radians(base_euler_cpu)),
-                    0.3 * math.sin(math.radians(base_euler_cpu)),
-                    0,
-                ]
-            ),
-            lookat=(
-                1000000 * math.cos(math.radians(base_euler_cpu)),
-                1000000 * math.sin(math.radians(base_euler_cpu)),
-                1,
-            ),
-        )
+        # Camera follow and position are read back lazily, see update_cameras
+        self.follower.invalidate()
         # resample commands
         envs_idx = (
             (
@@ -321,15 +297,9 @@ class Go2Env:
             > self.env_cfg["termination_if_roll_greater_than"]
         )
 
-        time_out_idx = (
-            (self.episode_length_buf > self.max_episode_length)
-            .nonzero(as_tuple=False)
-            .flatten()
-        )
-        self.extras["time_outs"] = torch.zeros_like(
-            self.reset_buf, device=self.device, dtype=gs.tc_float
-        )
-        self.extras["time_outs"][time_out_idx] = 1.0
+        self.extras["time_outs"] = (
+            self.episode_length_buf > self.max_episode_length
+        ).to(gs.tc_float)
 
         # self.reset_idx(self.reset_buf.nonzero(as_tuple=False).flatten())
 
@@ -359,6 +329,53 @@ class Go2Env:
 
         return self.obs_buf, None, self.rew_buf, self.reset_buf, self.extras
 
+    def _inference_step(self):
+        # Only the state the policy observations and the cameras read, written
+        # into the preallocated obs buffer. No rewards or termination checks,
+        # and commands are resampled by mask instead of by index.
+        self.episode_length_buf += 1
+        self.base_pos[:] = self.robot.get_pos()
+        self.base_quat[:] = self.robot.get_quat()
+        self.base_euler = quat_to_xyz(
+            transform_quat_by_quat(
+                torch.ones_like(self.base_quat) * self.inv_base_init_quat,
+                self.base_quat,
+            )
+        )
+        inv_base_quat = inv_quat(self.base_quat)
+        self.base_ang_vel[:] = transform_by_quat(self.robot.get_ang(), inv_base_quat)
+        self.projected_gravity = transform_by_quat(self.global_gravity, inv_base_quat)
+        self.dof_pos[:] = self.robot.get_dofs_position(self.motor_dofs)
+        self.dof_vel[:] = self.robot.get_dofs_velocity(self.motor_dofs)
+        self.follower.invalidate()
+
+        resample = (
+            self.episode_length_buf % int(self.env_cfg["resampling_time_s"] / self.dt)
+            == 0
+        )
+        commands = torch.stack(
+            [
+                gs_rand_float(*self.command_cfg[name], (self.num_envs,), self.device)
+                for name in ("lin_vel_x_range", "lin_vel_y_range", "ang_vel_range")
+            ],
+            dim=-1,
+        )
+        self.commands[:] = torch.where(resample[:, None], commands, self.commands)
+
+        n = self.num_actions
+        obs = self.obs_buf
+        torch.mul(self.base_ang_vel, self.obs_scales["ang_vel"], out=obs[:, 0:3])
+        obs[:, 3:6] = self.projected_gravity
+        torch.mul(self.commands, self.commands_scale, out=obs[:, 6:9])
+        torch.sub(self.dof_pos, self.default_dof_pos, out=obs[:, 9 : 9 + n])
+        obs[:, 9 : 9 + n] *= self.obs_scales["dof_pos"]
+        torch.mul(self.dof_vel, self.obs_scales["dof_vel"], out=obs[:, 9 + n : 9 + 2 * n])
+        obs[:, 9 + 2 * n : 9 + 3 * n] = self.actions
+
+        self.last_actions[:] = self.actions
+
+        return obs, None, self.rew_buf, self.reset_buf, self.extras
+
     def get_observations(self):
         return self.obs_buf
 
@@ -408,6 +425,7 @@ class Go2Env:
             self.episode_sums[key][envs_idx] = 0.0
 
         self._resample_commands(envs_idx)
+        self.follower.invalidate()
 
     # def reset_robot_only(self):
     #     envs_idx = torch.arange(self.num_envs, device=self.device)
@@ -426,6 +444,13 @@ class Go2Env:
         self.reset_idx(torch.arange(self.num_envs, device=self.device))
         return self.obs_buf, None
 
+    @property
+    def position(self):
+        return self.follower.position
+
+    def update_cameras(self):
+        self.follower.update(self.cam, self.cam_first)
+
     # ------------ reward functions----------------
     def _reward_tracking_lin_vel(self):
         # Tracking of linear velocity commands (xy axes)
@@ -7,22 +7,47 @@ import torch
 import pickle
 from scenes.scene_abstract import SceneAbstract
 from scenes.go2.go2_env import Go2Env
-from rsl_rl.runners import OnPolicyRunner
 from datetime import datetime
 from utils.utils import (
+    clear_queue,
     encode_numpy_array,
     send_personal_message,
     send_openai_request,
     parse_json_from_mixed_string,
+    robot_state_key,
 )
 from utils.system_prompt import SYSTEM_PROMPT_WAREHOUSE
+from utils.action_stream import ActionStreamParser
+from utils.policy import policy_registry
+from utils.skills import (
+    SKILL_INDEX,
+    SkillCalibration,
+    SkillExecutor,
+    load_calibration,
+)
+from utils.idle_loop import (
+    IdleLoopCache,
+    env_fingerprint,
+    load_env_state,
+    save_env_state,
+)
 from config import Config
+from portal.dispatch import llm_dispatcher
 
 import logging
 
 logging.basicConfig(level=logging.ERROR)
 logger = logging.getLogger(__name__)
 
+# Open-loop rates (degrees, meters or steps per step) used until
+# calibrate_skills.py has been run for the checkpoints
+DEFAULT_CALIBRATION = {
+    "rotate_right": SkillCalibration(45 / 90),
+    "rotate_left": SkillCalibration(45 / 80),
+    "wait": SkillCalibration(1),
+    "move_forward": SkillCalibration(1 / 120),
+}
+
 
 class Go2Sim(SceneAbstract):
     def __init__(self, config={}):
@@ -48,63 +73,41 @@ class Go2Sim(SceneAbstract):
             command_cfg=command_cfg,
             show_viewer=False,
             scene_config=config,
+            inference_mode=True,
         )
 
-        runner = OnPolicyRunner(self.env, train_cfg, log_dir, device="cpu")
-        resume_path = os.path.join(log_dir, "model_500.pt")
-        runner.load(resume_path)
-        self.policy_walk = runner.get_inference_policy(device="cuda:0")
-
-        log_dir = model_config.get("left", "scenes/go2/checkpoints/go2-left")
-
-        env_cfg, obs_cfg, reward_cfg, command_cfg, train_cfg = pickle.load(
-            open(log_dir + "/cfgs.pkl", "rb")
-        )
-        reward_cfg["reward_scales"] = {}
-
-        runner = OnPolicyRunner(self.env, train_cfg, log_dir, device="cpu")
-        resume_path = os.path.join(log_dir, "model_500.pt")
-        runner.load(resume_path)
-        self.policy_left = runner.get_inference_policy(device="cuda:0")
-
-        log_dir = model_config.get("right", "scenes/go2/checkpoints/go2-right")
-        env_cfg, obs_cfg, reward_cfg, command_cfg, train_cfg = pickle.load(
-            open(log_dir + "/cfgs.pkl", "rb")
-        )
-        reward_cfg["reward_scales"] = {}
-
-        runner = OnPolicyRunner(self.env, train_cfg, log_dir, device="cpu")
-        resume_path = os.path.join(log_dir, "model_500.pt")
-        runner.load(resume_path)
-        self.policy_right = runner.get_inference_policy(device="cuda:0")
-
-        log_dir = model_config.get("stand", "scenes/go2/checkpoints/go2-stand")
-        env_cfg, obs_cfg, reward_cfg, command_cfg, train_cfg = pickle.load(
-            open(log_dir + "/cfgs.pkl", "rb")
+        # Skill indices follow SKILL_INDEX: right, left, stand, walk
+        skill_dirs = {
+            "rotate_right": model_config.get("right", "scenes/go2/checkpoints/go2-right"),
+            "rotate_left": model_config.get("left", "scenes/go2/checkpoints/go2-left"),
+            "wait": model_config.get("stand", "scenes/go2/checkpoints/go2-stand"),
+            "move_forward": log_dir,
+        }
+        self.policy = policy_registry.get_fused(
+            list(skill_dirs.values()),
+            "model_500.pt",
+            device=Config.policy_device,
+            backend=Config.policy_backend,
+            threads=Config.policy_threads,
         )
-        reward_cfg["reward_scales"] = {}
-
-        runner = OnPolicyRunner(self.env, train_cfg, log_dir, device="cpu")
-        resume_path = os.path.join(log_dir, "model_500.pt")
-        runner.load(resume_path)
-        self.policy_stand = runner.get_inference_policy(device="cuda:0")
-        self.list_actions = [
-            self.policy_right,
-            self.policy_left,
-            self.policy_stand,
-            self.policy_walk,
+        self.skills = [
+            torch.full((self.env.num_envs,), i, dtype=torch.long, device=self.env.device)
+            for i in range(4)
         ]
+        self.skill_executor = SkillExecutor(
+            load_calibration(skill_dirs, "model_500.pt", DEFAULT_CALIBRATION)
+        )
         return
 
-    def transform(self, action, amplitude):
-        if action == 1:  # left
-            amplitude = amplitude * 80 / 45
-        elif action == 0:  # right
-            amplitude = amplitude * 90 / 45
-
-        elif action == 3:
-            amplitude = amplitude * 120
-        return amplitude
+    def step_skill(self, obs, action):
+        """
+        One env step of the skill at index `action` of SKILL_INDEX, returns
+        the next observations.
+        """
+        with torch.no_grad():
+            actions = self.policy(obs, self.skills[action])
+            obs, _, rews, dones, infos = self.env.step(actions)
+        return obs
 
     def apply_policy(self, policy, env, obs, num_steps=1000):
         # env.reset()
@@ -120,16 +123,11 @@ class Go2Sim(SceneAbstract):
         client_id: str,
         websocket: WebSocket,
     ):
-        actions_map = {
-            "move_forward": 3,
-            "rotate_left": 1,
-            "rotate_right": 0,
-            "wait": 2,
-        }
-
         obs, _ = self.env.reset()
         main = 0
         zoom = 0
+        # Stand phases are replayed from here instead of simulated
+        idle_loop = IdleLoopCache(enabled=Config.idle_loop_cache)
         try:
             steps = 100
             step = 0
@@ -159,10 +157,10 @@ class Go2Sim(SceneAbstract):
 
                     elif message.get("type") == "stop":
                         stop = True
+                        # The running command would queue more actions
+                        llm_dispatcher.cancel(client_id)
                         # erase the actions queue
-                        while not actions_queue.empty():
-                            actions_queue.get_nowait()
-                            actions_queue.task_done()
+                        clear_queue(actions_queue)
 
                     elif message.get("type") == "camera_change":
                         main = message.get("camera")
@@ -170,44 +168,65 @@ class Go2Sim(SceneAbstract):
                     if (not actions_queue.empty()) and stop == True:
                         action, amptitude = await actions_queue.get()
                         logger.info("action: " + str(action) + ", am:" + str(amptitude))
-                        action = actions_map[action]
-                        steps = self.transform(action, amptitude)
+                        steps = self.skill_executor.start(
+                            action, amptitude, self.env.position
+                        )
+                        action = SKILL_INDEX[action]
                         logger.info("action: " + str(action) + ", steps:" + str(steps))
                         step = 0
                         stop = False
+                        idle_loop.invalidate()
+
+                    # End the action once the robot has covered it
+                    if not stop and self.skill_executor.reached(self.env.position):
+                        step = steps
 
                     # render image then send message to client
 
                     if step < steps:
                         step += 1
 
-                        if main == 0:
-                            main_view, _, _, _ = self.env.cam_first.render()
-                        else:
-                            main_view, _, _, _ = self.env.cam.render()
+                        # While standing, replay the recorded stand loop if
+                        # this view has been recorded
+                        view = (main, round(zoom, 2))
+                        frame = idle_loop.replay(view) if stop else None
+                        if frame is None:
+                            state = idle_loop.resume_state()
+                            if state is not None:
+                                obs = load_env_state(self.env, state)
+
+                            self.env.update_cameras()
+                            if main == 0:
+                                main_view, _, _, _ = self.env.cam_first.render()
+                            else:
+                                main_view, _, _, _ = self.env.cam.render()
 
-                        lookat = np.array(self.env.cam_god.lookat)
-                        self.env.cam_god.set_pose(
-                            pos=def_pos + zoom * (def_pos - lookat),
-                        )
-                        god_view, _, _, _ = self.env.cam_god.render()
+                            lookat = np.array(self.env.cam_god.lookat)
+                            self.env.cam_god.set_pose(
+                                pos=def_pos + zoom * (def_pos - lookat),
+                            )
+                            god_view, _, _, _ = self.env.cam_god.render()
 
-                        with torch.no_grad():
+                            processed_message = {
+                                "type": "streaming_view",
+                                "main_view": encode_numpy_array(main_view),
+                                "god_view": encode_numpy_array(god_view),
+                            }
+                            frame = json.dumps(processed_message)
                             if stop:
-                                actions = self.list_actions[2](obs)  # stand
-                                obs, _, rews, dones, infos = self.env.step(actions)
-                            else:
-                                actions = self.list_actions[action](obs)
-                                obs, _, rews, dones, infos = self.env.step(actions)
-                        processed_message = {
-                            "type": "streaming_view",
-                            "main_view": encode_numpy_array(main_view),
-                            "god_view": encode_numpy_array(god_view),
-                        }
+                                # Before stepping, the state the frame shows
+                                idle_loop.record(
+                                    view,
+                                    frame,
+                                    lambda: env_fingerprint(self.env),
+                                    lambda: save_env_state(self.env),
+                                )
 
-                        await send_personal_message(
-                            websocket, json.dumps(processed_message), client_id
-                        )
+                            obs = self.step_skill(
+                                obs, SKILL_INDEX["wait"] if stop else action
+                            )
+
+                        await send_personal_message(websocket, frame, client_id)
                         await asyncio.sleep(0.001)
 
                     else:
@@ -239,6 +258,95 @@ class Go2Sim(SceneAbstract):
 
             return
 
+    async def handle_text_command(self, message_data: dict, websocket: WebSocket, client_id: str, actions_queue: asyncio.Queue):
+        model_config = self.config.get("models", {}).get("llm", {})
+        api_url = model_config.get("api_url", Config.openai_base_url)
+        llm_model = model_config.get("model", Config.llm_model)
+        api_key = model_config.get("api_key", Config.api_key)
+        system_prompt = model_config.get("system_prompt", SYSTEM_PROMPT_WAREHOUSE)
+
+        final_answer = ""
+        parser = ActionStreamParser()
+        content = message_data.get("content", "")
+        position = self.env.position
+        robot_position = str(position)
+        content += ". Robot is at the position " + robot_position
+        async for chunk in send_openai_request(
+            api_url=api_url,
+            api_key=api_key,
+            system_prompt=system_prompt,
+            prompt=content,
+            model=llm_model,
+            instruction=message_data.get("content", ""),
+            state=robot_state_key(position),
+        ):
+            await send_personal_message(
+                websocket,
+                json.dumps(
+                    {
+                        "type": "reasoning",
+                        "message": chunk["choices"][0]["delta"].get(
+                            "content", ""
+                        ),
+                    }
+                ),
+                client_id,
+            )
+            delta = chunk["choices"][0]["delta"].get("content", "")
+            final_answer += delta
+            # Queue every action as soon as its object is complete
+            for action in parser.feed(delta):
+                if action.get("type") in SKILL_INDEX:
+                    await actions_queue.put(
+                        (
+                            action["type"],
+                            action.get("angle", action.get("distance", 0)),
+                        )
+                    )
+        print(final_answer)
+        if parser.actions:
+            actions = {"actions": parser.actions}
+        else:
+            # Nothing streamed, search the whole answer
+            actions = parse_json_from_mixed_string(final_answer)
+
+        if actions is None:
+            await send_personal_message(
+                websocket,
+                json.dumps(
+                    {
+                        "type": "error",
+                        "message": "can not parse action from LLM",
+                    }
+                ),
+                client_id,
+            )
+        else:
+            try:
+                actions = actions["actions"]
+                # The streamed actions are queued already
+                for action in actions[len(parser.actions) :]:
+                    await actions_queue.put(
+                        (
+                            action["type"],
+                            action.get("angle", action.get("distance", 0)),
+                        )
+                    )
+
+                await send_personal_message(
+                    websocket,
+                    json.dumps(
+                        {
+                            "type": "output",
+                            "message": actions,
+                        }
+                    ),
+                    client_id,
+                )
+            except Exception as e:
+                print(e)
+                pass
+
     async def client_handler(
         self,
         message_queue: asyncio.Queue,
@@ -247,12 +355,6 @@ class Go2Sim(SceneAbstract):
         websocket: WebSocket,
         last_activity: datetime,
     ):
-        model_config = self.config.get("models", {}).get("llm", {})
-        api_url = model_config.get("api_url", Config.openai_base_url)
-        llm_model = model_config.get("model", Config.llm_model)
-        api_key = model_config.get("api_key", Config.api_key)
-        system_prompt = model_config.get("system_prompt", SYSTEM_PROMPT_WAREHOUSE)
-
         try:
             while True:
                 # Wait for message from client
@@ -266,69 +368,15 @@ class Go2Sim(SceneAbstract):
 
                 # Add client message to processing queue
                 if message_data.get("type") == "command":
-                    final_answer = ""
-                    content = message_data.get("content", "")
-                    robot_position = str(self.env.position)
-                    content += ". Robot is at the position " + robot_position
-                    async for chunk in send_openai_request(
-                        api_url=api_url,
-                        api_key=api_key,
-                        system_prompt=system_prompt,
-                        prompt=content,
-                        model=llm_model,
-                    ):
-                        await send_personal_message(
-                            websocket,
-                            json.dumps(
-                                {
-                                    "type": "reasoning",
-                                    "message": chunk["choices"][0]["delta"].get(
-                                        "content", ""
-                                    ),
-                                }
-                            ),
-                            client_id,
-                        )
-                        final_answer += chunk["choices"][0]["delta"].get("content", "")
-                    actions = parse_json_from_mixed_string(final_answer)
-                    print(final_answer)
-
-                    if actions is None:
-                        await send_personal_message(
-                            websocket,
-                            json.dumps(
-                                {
-                                    "type": "error",
-                                    "message": "can not parse action from LLM",
-                                }
-                            ),
-                            client_id,
-                        )
-                    else:
-                        try:
-                            actions = actions["actions"]
-                            for action in actions:
-                                await actions_queue.put(
-                                    (
-                                        action["type"],
-                                        action.get("angle", action.get("distance", 0)),
-                                    )
-                                )
-
-                            await send_personal_message(
-                                websocket,
-                                json.dumps(
-                                    {
-                                        "type": "output",
-                                        "message": actions,
-                                    }
-                                ),
-                                client_id,
-                            )
-                        except Exception as e:
-                            print(e)
-                            pass
-
+                    # Runs on its own, a newer command cancels it
+                    llm_dispatcher.submit(
+                        client_id,
+                        lambda message_data=message_data: self.handle_text_command(
+                            message_data, websocket, client_id, actions_queue
+                        ),
+                        # The superseded plan's queued actions go with it
+                        on_supersede=lambda: clear_queue(actions_queue),
+                    )
                 else:
                     await message_queue.put(message_data)
                 last_activity = datetime.now()
@@ -342,3 +390,5 @@ class Go2Sim(SceneAbstract):
             logger.error(f"Client handler error for client {client_id}: {str(e)}")
 
             raise
+        finally:
+            llm_dispatcher.cancel(client_id)
@@ -1,5 +1,7 @@
 import asyncio
 import aiohttp
+from portal.http import http_client
+from portal.sse import decode_response
 import json
 from fastapi import WebSocket, WebSocketDisconnect
 from config import Config
@@ -47,18 +49,17 @@ class AudioService:
             Exception: For other errors during the STT call.
         """
         try:
-            async with aiohttp.ClientSession() as session:
-                data = aiohttp.FormData()
-                data.add_field('file',
-                               audio_data,
-                               filename=f"file.wav",
-                               content_type="audio/wav")
-                data.add_field("model", "tiny")
-                async with session.post(self.stt_url, data=data) as response:
-                    response.raise_for_status()  # Raise HTTPError for bad responses (4xx or 5xx)
-                    response_json = await response.json()
-                    # Assuming response has "text" field
-                    return response_json.get("text", "")
+            data = aiohttp.FormData()
+            data.add_field('file',
+                           audio_data,
+                           filename=f"file.wav",
+                           content_type="audio/wav")
+            data.add_field("model", Config.stt_model)
+            async with http_client.post(self.stt_url, data=data) as response:
+                response.raise_for_status()  # Raise HTTPError for bad responses (4xx or 5xx)
+                response_json = await response.json()
+                # Assuming response has "text" field
+                return response_json.get("text", "")
         except aiohttp.ClientResponseError as e:
             logger.info(f"STT service error: {e}")
             raise
@@ -66,10 +67,44 @@ class AudioService:
             logger.info(f"Error during STT call: {e}")
             raise
 
-    async def send_to_tts(self, session, text, websocket):
+    async def stt_stream(self, audio_data: bytes):
+        """
+        Asynchronously calls the STT service in streaming mode and yields the
+        transcript as it is decoded.
+
+        Args:
+            audio_data (bytes): The audio data to send to the STT service.
+
+        Yields:
+            dict: {"partial": text so far} while decoding, then
+                {"text": whole transcript}. A service without streaming
+                answers with the whole transcript only.
+
+        Raises:
+            aiohttp.ClientResponseError: If the STT service returns an error status.
+        """
+        data = aiohttp.FormData()
+        data.add_field('file',
+                       audio_data,
+                       filename=f"file.wav",
+                       content_type="audio/wav")
+        data.add_field("model", Config.stt_model)
+        data.add_field("stream", "true")
+        async with http_client.post(self.stt_url, data=data) as response:
+            response.raise_for_status()
+            if response.content_type == "application/json":
+                response_json = await response.json()
+                yield {"text": response_json.get("text", "")}
+                return
+            async for event in decode_response(response):
+                if "error" in event:
+                    raise RuntimeError(f"STT service error: {event['error']}")
+                yield event
+
+    async def send_to_tts(self, text, websocket):
         body = {"input": text, "model": "kokoro", "voice": Config.tts_voice,
                 "response_format": Config.tts_response_format, "stream": True}
-        async with session.post(self.tts_url, json=body) as response:
+        async with http_client.post(self.tts_url, json=body) as response:
             byte = await response.read()
             # logger.info("Putting bytes:" ,len(byte), str(datetime.now()))
             await websocket.send_text(json.dumps(
@@ -98,47 +133,46 @@ class AudioService:
             # Assuming your TTS service expects a JSON payload
             while True:
                 if not self.llm_text_queue.empty():
-                    async with aiohttp.ClientSession() as session:
-                        message = await self.llm_text_queue.get()
-                        print("tts processing: ", message)
-                        if message is None: # End of turn
-                            if answer:
-                                await self.send_to_tts(session, answer, websocket)
-                                logger.info(answer)
-                                
-                            ## Reset for the next turn
-                            final_answer = ""
-                            answer = ""
-                            tokens_processed = 0
-                            chunk_size = 10
+                    message = await self.llm_text_queue.get()
+                    print("tts processing: ", message)
+                    if message is None: # End of turn
+                        if answer:
+                            await self.send_to_tts(answer, websocket)
+                            logger.info(answer)
+                            
+                        ## Reset for the next turn
+                        final_answer = ""
+                        answer = ""
+                        tokens_processed = 0
+                        chunk_size = 10
+                        currentCount = 0
+                        continue
+                    object = message
+
+                    if object["choices"][0]["delta"].get("content"):
+                        delta_content = object["choices"][0]["delta"]["content"]
+                        final_answer += delta_content
+
+                        if currentCount < chunk_size:
+                            answer += delta_content
+                        elif currentCount < 60 and delta_content in [".", ",", ":", ";"]:
+                            await self.send_to_tts(answer, websocket)
+                            logger.info(answer)
+                            answer = ""  # Reset answer
+                            currentCount = 0
+                            chunk_size = 60
+                        elif chunk_size == 10:
+                            answer += delta_content
+                        else:
+                            await self.send_to_tts(answer, websocket)
+                            logger.info(answer)
+                            answer = delta_content  # Reset answer
                             currentCount = 0
-                            continue
-                        object = message
-
-                        if object["choices"][0]["delta"].get("content"):
-                            delta_content = object["choices"][0]["delta"]["content"]
-                            final_answer += delta_content
-
-                            if currentCount < chunk_size:
-                                answer += delta_content
-                            elif currentCount < 60 and delta_content in [".", ",", ":", ";"]:
-                                await self.send_to_tts(session, answer, websocket)
-                                logger.info(answer)
-                                answer = ""  # Reset answer
-                                currentCount = 0
-                                chunk_size = 60
-                            elif chunk_size == 10:
-                                answer += delta_content
-                            else:
-                                await self.send_to_tts(session, answer, websocket)
-                                logger.info(answer)
-                                answer = delta_content  # Reset answer
-                                currentCount = 0
-                                if chunk_size == 60:
-                                    chunk_size = 200
-
-                            tokens_processed += 1
-                            currentCount += 1
+                            if chunk_size == 60:
+                                chunk_size = 200
+
+                        tokens_processed += 1
+                        currentCount += 1
                 else:
                     await asyncio.sleep(0.01)
         except aiohttp.ClientResponseError as e:
@@ -4,7 +4,12 @@ from typing import AsyncGenerator, Optional, List, Dict
 from config import Config
 from utils.system_prompt import SYSTEM_PROMPT, SYSTEM_PROMPT_WAREHOUSE, SYSTEM_PROMPT_MALL
 import aiohttp
+from portal.http import http_client
+from portal.sse import decode_response, delta_content
+from utils.utils import response_cache
+from utils.chat_history import ChatHistory, combined_metrics
 import json
+import weakref
 
 
 class AsyncOpenAIChatCompletionService:
@@ -14,6 +19,9 @@ class AsyncOpenAIChatCompletionService:
     a chat history across multiple calls.
     """
 
+    # Live services, one per mall session, for the history metrics
+    _instances = weakref.WeakSet()
+
     def __init__(self, config: dict = {}):
         """
         Initializes the service with an OpenAI API key, optional model, and an option to enable chat history.
@@ -34,9 +42,23 @@ class AsyncOpenAIChatCompletionService:
         # Initialize empty chat history
         self.system_prompt = model_config.get(
             "system_prompt", SYSTEM_PROMPT_MALL)
-        self.chat_history: List[Dict[str, str]] = []
+        self.chat_history = ChatHistory(
+            token_budget=model_config.get(
+                "history_token_budget", Config.history_token_budget),
+            window=model_config.get("history_window", Config.history_window),
+            summary_tokens=model_config.get(
+                "history_summary_tokens", Config.history_summary_tokens),
+        )
+        AsyncOpenAIChatCompletionService._instances.add(self)
+
+    @classmethod
+    def history_metrics(cls):
+        """
+        Prompt token metrics of the chat histories of every live service.
+        """
+        return combined_metrics(service.chat_history for service in list(cls._instances))
 
-    async def chat_completion_stream(self, message_content: str, temperature: float = 0.7, max_tokens: int = 10000) -> AsyncGenerator[str, None]:
+    async def chat_completion_stream(self, message_content: str, temperature: float = 0.7, max_tokens: int = 10000, instruction: Optional[str] = None, state=None, accepted: Optional[asyncio.Future] = None) -> AsyncGenerator[str, None]:
         """
         Asynchronously generates chat completions and yields response chunks.
 
@@ -44,19 +66,29 @@ class AsyncOpenAIChatCompletionService:
             message_content: The content of the user's message.
             temperature:  Sampling temperature, between 0 and 2.
             max_tokens:  The maximum number of tokens to generate.
+            instruction: The user's own words, without the scene context
+                appended to them. When given, the answer is served from and
+                stored in the response cache.
+            state: Quantized scene state the answer depends on.
+            accepted: Future resolved with whether the answer is served,
+                for answers generated ahead of time. History and cache are
+                only updated once it is True.
 
         Yields:
             str:  Individual text chunks from the chat completion response.
         """
 
-        messages: List[Dict[str, str]] = [
-            {"role": "system", "content": self.system_prompt}]
-
         if self.enable_history:
-            messages.extend(self.chat_history)  # Add history if enabled
+            # System prompt, summary of older turns, recent turns, message
+            messages = self.chat_history.messages(
+                self.system_prompt, message_content)
+        else:
+            messages: List[Dict[str, str]] = [
+                {"role": "system", "content": self.system_prompt},
+                {"role": "user", "content": message_content},
+            ]
+        self.chat_history.record(messages)
 
-        # Add the current user message
-        messages.append({"role": "user", "content": message_content})
         payload = {
             "model": self.model,
             "messages": messages,
@@ -65,61 +97,49 @@ class AsyncOpenAIChatCompletionService:
             "stream": True,
             # "max_tokens": 5000    # Optional: limit response length
         }
+
+        if instruction is None:
+            chunks = self._request_stream(payload)
+        else:
+            # System prompt and history are part of the key
+            key = response_cache.key(
+                instruction, self.model + json.dumps(messages[:-1]), state)
+            chunks = response_cache.stream(
+                key, lambda: self._request_stream(payload), accepted=accepted)
+
         full_response_content = ""
-        async with aiohttp.ClientSession() as session:
-            try:
-                # Send POST request to the API
-                async with session.post(
-                    self.api_url,
-                    json=payload,
-                    headers={
-                        "Content-Type": "application/json",
-                        "Authorization": f"Bearer {self.api_key}",
-                        "HTTP-Referer": "https://your-site.com",
-                        "X-Title": "Robot Navigation System",
-                    },
-                ) as response:
-                    # Check if the request was successful
-                    if response.status == 200:
-                        # Parse and return the response
-                        full_text_content = ""
-
-                        async for chunk in response.content:
-                            if chunk:
-                                # Decode the chunk (assumes JSON lines format)
-                                try:
-                                    chunk_str = chunk.decode("utf-8").strip()
-
-                                    # Handle SSE format (data: prefix)
-                                    if chunk_str.startswith("data: "):
-                                        chunk_str = chunk_str[6:]
-
-                                    # Skip empty or "data: [DONE]" messages
-                                    if chunk_str and chunk_str != "[DONE]":
-                                        # Parse JSON and extract content
-                                        chunk_data = json.loads(chunk_str)
-
-                                        yield chunk_data
-                                    full_response_content += chunk_data["choices"][0]["delta"].get(
-                                        "content", "")
-                                except json.JSONDecodeError:
-                                    # Some chunks might not be valid JSON
-                                    # This can happen with SSE formatting
-                                    if "[DONE]" not in chunk_str:
-                                        print(
-                                            f"Warning: Could not parse chunk as JSON: {chunk_str}"
-                                        )
-                        if self.enable_history:
-                            self.chat_history.append(
-                                {"role": "user", "content": message_content})
-                            self.chat_history.append(
-                                {"role": "assistant", "content": full_response_content})
-                    else:
-                        # Handle error responses
-                        error_text = await response.text()
-                        print(f"Error: {response.status} - {error_text}")
-                        # return None
-
-            except aiohttp.ClientError as e:
-                print(f"Request failed: {e}")
-                # return None
+        async for chunk_data in chunks:
+            full_response_content += delta_content(chunk_data)
+            yield chunk_data
+
+        if accepted is not None and not await accepted:
+            return
+        if self.enable_history and full_response_content:
+            self.chat_history.add(message_content, full_response_content)
+
+    async def _request_stream(self, payload: dict):
+        try:
+            # Send POST request to the API
+            async with http_client.post(
+                self.api_url,
+                json=payload,
+                headers={
+                    "Content-Type": "application/json",
+                    "Authorization": f"Bearer {self.api_key}",
+                    "HTTP-Referer": "https://your-site.com",
+                    "X-Title": "Robot Navigation System",
+                },
+            ) as response:
+                # Check if the request was successful
+                if response.status == 200:
+                    async for chunk_data in decode_response(response):
+                        yield chunk_data
+                else:
+                    # Handle error responses
+                    error_text = await response.text()
+                    print(f"Error: {response.status} - {error_text}")
+                    # return None
+
+        except aiohttp.ClientError as e:
+            print(f"Request failed: {e}")
+            # return None
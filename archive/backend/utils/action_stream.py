@@ -0,0 +1,107 @@
+import json
+
+
+class ActionStreamParser:
+    """
+    Incremental scanner of an LLM answer for the elements of its "actions"
+    array.
+
+    Chunks are fed as they stream in and every element of
+    `"actions": [...]` is returned by `feed` as soon as its closing brace
+    arrives, so the robot starts the first action while the rest of the
+    answer is still being generated. Text around the JSON (reasoning,
+    markdown fences) is skipped: scanning only starts at a `{` and ends when
+    its object closes. Each character is looked at once.
+    """
+
+    def __init__(self):
+        self.text = ""
+        self.actions = []
+        self.errors = 0
+
+        self._pos = 0
+        self._stack = []  # Open containers, "{" or "["
+        self._in_string = False
+        self._escape = False
+        self._string_start = 0
+        self._last_string = None  # Last string closed, a key if ":" follows
+        self._key = None  # Key whose value comes next
+        self._actions_depth = None  # Stack depth inside the actions array
+        self._element_start = None
+        self._finished = False  # Only the first actions array counts
+
+    def feed(self, chunk):
+        """
+        Scan the next chunk of the answer.
+
+        Returns:
+            list: Action objects completed by this chunk, in order.
+        """
+        self.text += chunk
+        completed = []
+        text = self.text
+
+        for i in range(self._pos, len(text)):
+            c = text[i]
+
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif c == "\\":
+                    self._escape = True
+                elif c == '"':
+                    self._in_string = False
+                    self._last_string = text[self._string_start + 1 : i]
+                continue
+
+            if not self._stack:
+                # Outside JSON, wait for an object to open
+                if c == "{":
+                    self._stack.append(c)
+                continue
+
+            if c == '"':
+                self._in_string = True
+                self._string_start = i
+            elif c == ":":
+                self._key = self._last_string
+            elif c == ",":
+                self._key = None
+                self._last_string = None
+            elif c in "{[":
+                if (
+                    c == "["
+                    and self._key == "actions"
+                    and self._stack[-1] == "{"
+                    and self._actions_depth is None
+                    and not self._finished
+                ):
+                    self._actions_depth = len(self._stack) + 1
+                elif c == "{" and len(self._stack) == self._actions_depth:
+                    self._element_start = i
+                self._stack.append(c)
+                self._key = None
+                self._last_string = None
+            elif c in "}]":
+                self._stack.pop()
+                depth = len(self._stack)
+                if c == "}" and depth == self._actions_depth:
+                    completed.extend(self._emit(text[self._element_start : i + 1]))
+                    self._element_start = None
+                elif depth < (self._actions_depth or 0):
+                    self._actions_depth = None
+                    self._finished = True
+                self._key = None
+                self._last_string = None
+
+        self._pos = len(text)
+        return completed
+
+    def _emit(self, element):
+        try:
+            action = json.loads(element)
+        except json.JSONDecodeError:
+            self.errors += 1
+            return []
+        self.actions.append(action)
+        return [action]
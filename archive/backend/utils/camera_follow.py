@@ -0,0 +1,145 @@
+import numpy as np
+import torch
+
+CHASE_DISTANCE = 3.0
+FIRST_PERSON_OFFSET = 0.3
+LOOKAT_DISTANCE = 1000000
+LOOKAT_HEIGHT = 1.0
+
+
+def follow_poses(base_pos, yaw, chase_height, first_height):
+    """
+    Follow camera poses of every env, computed on device.
+
+    Args:
+        base_pos (torch.Tensor): (num_envs, 3) base positions.
+        yaw (torch.Tensor): (num_envs,) base yaw in degrees.
+        chase_height (float): Chase camera height above the base.
+        first_height (float): First person camera height above the base.
+
+    Returns:
+        torch.Tensor: (num_envs, 12) chase camera position, first person
+        camera position, shared lookat point and [x, y, yaw].
+    """
+    heading = torch.stack(
+        [
+            torch.cos(torch.deg2rad(yaw)),
+            torch.sin(torch.deg2rad(yaw)),
+            torch.zeros_like(yaw),
+        ],
+        dim=-1,
+    )
+    up = torch.zeros_like(base_pos)
+    up[:, 2] = 1.0
+    return torch.cat(
+        [
+            base_pos - CHASE_DISTANCE * heading + chase_height * up,
+            base_pos + FIRST_PERSON_OFFSET * heading + first_height * up,
+            LOOKAT_DISTANCE * heading + LOOKAT_HEIGHT * up,
+            base_pos[:, :2],
+            yaw[:, None],
+        ],
+        dim=-1,
+    )
+
+
+class CameraFollower:
+    """
+    Tracks env 0 of a locomotion env for the follow cameras and the
+    reported robot position.
+
+    `env.step` only marks the state stale. The follow poses, the position
+    and, with `reset_nan`, the NaN flags of the envs are packed into one
+    tensor and read back together the next time a frame is rendered or the
+    position is asked for, so stepping never waits on the device.
+
+    With `reset_nan`, `env.step` calls `mask_nan` once the state buffers are
+    read: envs that read back NaN are put in their reset state on device
+    right away, so the NaN never reaches the observations, and are reset in
+    the simulator at the next readback.
+    """
+
+    def __init__(
+        self, env, position, chase_height=1.0, first_height=1.0, reset_nan=False
+    ):
+        self.env = env
+        self.chase_height = chase_height
+        self.first_height = first_height
+        self.reset_nan = reset_nan
+        self._position = np.array(position, dtype=np.float64)
+        self._poses = None
+        self._stale = False
+        self._nan_envs = None  # Envs masked since the last readback
+
+    def invalidate(self):
+        self._stale = True
+
+    def mask_nan(self):
+        """
+        Replace the state buffers of envs that read back NaN by their reset
+        values, with masks only, no host sync.
+        """
+        # For unknown reasons, it gets NaN values in self.robot.get_*() sometimes
+        env = self.env
+        nan_envs = torch.isnan(
+            torch.cat([env.base_pos, env.base_quat, env.dof_pos, env.dof_vel], dim=1)
+        ).any(dim=1)
+        mask = nan_envs[:, None]
+        env.base_pos[:] = torch.where(mask, env.base_init_pos, env.base_pos)
+        env.base_quat[:] = torch.where(mask, env.base_init_quat, env.base_quat)
+        env.dof_pos[:] = torch.where(mask, env.default_dof_pos, env.dof_pos)
+        env.projected_gravity = torch.where(
+            mask, env.global_gravity, env.projected_gravity
+        )
+        env.base_euler = env.base_euler.masked_fill(mask, 0.0)
+        env.base_lin_vel.masked_fill_(mask, 0.0)
+        env.base_ang_vel.masked_fill_(mask, 0.0)
+        env.dof_vel.masked_fill_(mask, 0.0)
+
+        if self._nan_envs is None:
+            self._nan_envs = nan_envs
+        else:
+            self._nan_envs |= nan_envs
+
+    def _read(self):
+        if not self._stale:
+            return
+
+        env = self.env
+        state = follow_poses(
+            env.base_pos[:1], env.base_euler[:1, 2], self.chase_height, self.first_height
+        )[0]
+        nan_envs = self._nan_envs
+        if nan_envs is not None:
+            state = torch.cat([state, nan_envs.any()[None].to(state.dtype)])
+        state = state.cpu().numpy()
+
+        if nan_envs is not None and state[-1]:
+            # Masked in step, now reset in the simulator as well
+            self._nan_envs = None
+            env.reset_idx(nan_envs.nonzero(as_tuple=False).flatten())
+            return self._read()
+
+        self._poses = state[:9].reshape(3, 3)
+        self._position = state[9:12]
+        self._stale = False
+
+    @property
+    def position(self):
+        """
+        [x, y, yaw] of env 0, yaw in degrees.
+        """
+        self._read()
+        return self._position
+
+    def update(self, cam, cam_first):
+        """
+        Move the chase and first person cameras, call right before rendering.
+        """
+        self._read()
+        if self._poses is None:
+            return
+
+        chase, first, lookat = self._poses
+        cam.set_pose(pos=chase, lookat=lookat)
+        cam_first.set_pose(pos=first, lookat=lookat)
@@ -0,0 +1,160 @@
+import re
+
+MESSAGE_OVERHEAD = 4  # Tokens the chat template adds around a message
+
+
+def estimate_tokens(text):
+    """
+    Token count of `text` without a tokenizer.
+
+    BPE vocabularies average about 4 characters per token on English prose,
+    but numbers, punctuation and JSON split finer, so the larger of that and
+    a count of words and symbols is taken. Within ~10% on the prompts here.
+    """
+    if not text:
+        return 0
+    symbols = len(re.findall(r"\w+|[^\w\s]", text))
+    return max((len(text) + 3) // 4, symbols)
+
+
+def message_tokens(messages):
+    return sum(estimate_tokens(m["content"]) + MESSAGE_OVERHEAD for m in messages)
+
+
+def first_sentence(text, max_chars=160):
+    text = " ".join(text.split())
+    match = re.match(r"(.+?[.!?])(\s|$)", text)
+    sentence = match.group(1) if match else text
+    if len(sentence) > max_chars:
+        sentence = sentence[: max_chars - 3].rstrip() + "..."
+    return sentence
+
+
+def combined_metrics(histories):
+    """
+    `ChatHistory.metrics` summed over `histories`, e.g. one per session.
+    """
+    metrics = [history.metrics() for history in histories]
+    requests = sum(m["requests"] for m in metrics)
+    total = sum(m["total_prompt_tokens"] for m in metrics)
+    return {
+        "histories": len(metrics),
+        "requests": requests,
+        "turns": sum(m["turns"] for m in metrics),
+        "compactions": sum(m["compactions"] for m in metrics),
+        "summary_tokens": sum(m["summary_tokens"] for m in metrics),
+        "max_prompt_tokens": max((m["max_prompt_tokens"] for m in metrics), default=0),
+        "total_prompt_tokens": total,
+        "mean_prompt_tokens": total / max(requests, 1),
+    }
+
+
+class ChatHistory:
+    """
+    Conversation history bounded by a token budget.
+
+    The prompt sent is the system prompt, a summary of the evicted turns and
+    the most recent turns verbatim. Once the turns outgrow `token_budget` or
+    `window`, the oldest half of them is folded into the summary in one go,
+    so between compactions a prompt only grows at its end and repeats the
+    previous one as its prefix, which providers' prompt caching can reuse.
+    The summary is extractive (first sentence of every message) and keeps
+    its newest lines within `summary_tokens`.
+
+    Args:
+        token_budget (int): Tokens for the summary and turns together.
+        window (int): Most turns kept verbatim.
+        summary_tokens (int): Tokens for the summary.
+    """
+
+    def __init__(self, token_budget=2000, window=8, summary_tokens=300):
+        self.token_budget = token_budget
+        self.window = window
+        self.summary_tokens = summary_tokens
+        self.turns = []  # [(user message, assistant message), ...]
+        self.summary = []  # Lines, oldest first
+
+        self.requests = 0
+        self.compactions = 0
+        self.last_prompt_tokens = 0
+        self.max_prompt_tokens = 0
+        self.total_prompt_tokens = 0
+
+    def __len__(self):
+        return len(self.turns)
+
+    def clear(self):
+        self.turns = []
+        self.summary = []
+
+    def messages(self, system_prompt, user_message):
+        """
+        Chat messages for the next request, ending with `user_message`.
+        """
+        messages = [{"role": "system", "content": system_prompt}]
+        if self.summary:
+            messages.append({
+                "role": "system",
+                "content": "Summary of the earlier conversation:\n" + "\n".join(self.summary),
+            })
+        for user, assistant in self.turns:
+            messages.append({"role": "user", "content": user})
+            messages.append({"role": "assistant", "content": assistant})
+        messages.append({"role": "user", "content": user_message})
+        return messages
+
+    def add(self, user_message, assistant_message):
+        self.turns.append((user_message, assistant_message))
+        if len(self.turns) > self.window or self._turn_tokens() > self._turn_budget():
+            self._compact()
+
+    def record(self, messages):
+        """
+        Count the prompt tokens of a request built from `messages`.
+        """
+        tokens = message_tokens(messages)
+        self.requests += 1
+        self.last_prompt_tokens = tokens
+        self.max_prompt_tokens = max(self.max_prompt_tokens, tokens)
+        self.total_prompt_tokens += tokens
+        return tokens
+
+    def metrics(self):
+        return {
+            "requests": self.requests,
+            "turns": len(self.turns),
+            "compactions": self.compactions,
+            "summary_tokens": self._summary_tokens(),
+            "last_prompt_tokens": self.last_prompt_tokens,
+            "max_prompt_tokens": self.max_prompt_tokens,
+            "total_prompt_tokens": self.total_prompt_tokens,
+            "mean_prompt_tokens": self.total_prompt_tokens / max(self.requests, 1),
+        }
+
+    def _turn_tokens(self, start=0):
+        return sum(
+            estimate_tokens(user) + estimate_tokens(assistant) + 2 * MESSAGE_OVERHEAD
+            for user, assistant in self.turns[start:]
+        )
+
+    def _summary_tokens(self):
+        return estimate_tokens("\n".join(self.summary))
+
+    def _turn_budget(self):
+        return max(self.token_budget - self.summary_tokens, 0)
+
+    def _compact(self):
+        # Fold the oldest half at once, and more while still over budget,
+        # the newest turn always stays
+        keep = max(len(self.turns) // 2, 1)
+        while keep > 1 and self._turn_tokens(len(self.turns) - keep) > self._turn_budget():
+            keep -= 1
+        evicted, self.turns = self.turns[:-keep], self.turns[-keep:]
+
+        for user, assistant in evicted:
+            self.summary.append(
+                f"User: {first_sentence(user)} Assistant: {first_sentence(assistant)}")
+        while len(self.summary) > 1 and self._summary_tokens() > self.summary_tokens:
+            self.summary.pop(0)
+        self.compactions += 1
+
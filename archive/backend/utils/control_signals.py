@@ -0,0 +1,107 @@
+from collections import deque
+
+# Control tokens of the mall system prompt and the gesture each one plays
+MALL_SIGNALS = {
+    "<GOODBYE>": "greeting",
+    "<UNKNOWN>": "head_scratch",
+}
+
+
+class SignalDetector:
+    """
+    Streaming Aho-Corasick matcher of control tokens in an LLM answer.
+
+    Chunks are fed as they stream in, the automaton carries its state across
+    them, so a token split over several chunks ("<GOOD", "BYE>") is found
+    like a whole one, and every character is looked at once. `feed` returns
+    the chunk's text without the tokens, for speech and parsing, and the
+    signals it completed. A signal is reported once per answer. Text that
+    may still be the start of a token is held back until it is decided.
+
+    Args:
+        signals (dict): Control token: the value reported for it.
+    """
+
+    def __init__(self, signals=MALL_SIGNALS):
+        self.signals = signals
+        self.seen = set()
+
+        # Trie of the tokens, then failure links breadth first
+        self._goto = [{}]
+        self._fail = [0]
+        self._match = [None]  # Token ending at the node
+        self._depth = [0]
+        for token in signals:
+            node = 0
+            for c in token:
+                if c not in self._goto[node]:
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._match.append(None)
+                    self._depth.append(self._depth[node] + 1)
+                    self._goto[node][c] = len(self._goto) - 1
+                node = self._goto[node][c]
+            self._match[node] = token
+
+        queue = deque(self._goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for c, child in self._goto[node].items():
+                fail = self._fail[node]
+                while fail and c not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[child] = self._goto[fail].get(c, 0)
+                if self._match[child] is None:
+                    self._match[child] = self._match[self._fail[child]]
+                queue.append(child)
+
+        self._node = 0
+        self._held = ""  # Text that may still be part of a token
+
+    def reset(self):
+        self.seen = set()
+        self._node = 0
+        self._held = ""
+
+    def feed(self, chunk):
+        """
+        Scan the next chunk of the answer.
+
+        Returns:
+            tuple: (text of the chunk without control tokens, [(token,
+                signal), ...] completed by it and not reported before).
+        """
+        text = ""
+        found = []
+        goto, fail = self._goto, self._fail
+        node, held = self._node, self._held
+
+        for c in chunk:
+            while node and c not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(c, 0)
+            held += c
+
+            token = self._match[node]
+            if token is not None:
+                held = held[: -len(token)]
+                node = 0
+                if token not in self.seen:
+                    self.seen.add(token)
+                    found.append((token, self.signals[token]))
+
+            # Only the deepest partial match can still become a token
+            keep = self._depth[node]
+            if len(held) > keep:
+                text += held[: len(held) - keep]
+                held = held[len(held) - keep :]
+
+        self._node, self._held = node, held
+        return text, found
+
+    def flush(self):
+        """
+        Text held back at the end of the answer.
+        """
+        text, self._held, self._node = self._held, "", 0
+        return text
@@ -0,0 +1,192 @@
+from collections import deque
+
+import numpy as np
+import torch
+
+_MISSING = object()
+
+# Env buffers the policy observations and the follow cameras are built from,
+# restored together with the simulator state
+ENV_STATE_BUFFERS = (
+    "obs_buf",
+    "actions",
+    "last_actions",
+    "commands",
+    "episode_length_buf",
+    "base_pos",
+    "base_quat",
+    "base_euler",
+    "base_ang_vel",
+    "projected_gravity",
+    "dof_pos",
+    "dof_vel",
+)
+
+
+def save_env_state(env):
+    """
+    Snapshot of a locomotion env: simulator state plus its env buffers.
+    """
+    buffers = {
+        name: getattr(env, name).clone()
+        for name in ENV_STATE_BUFFERS
+        if hasattr(env, name)
+    }
+    return env.scene.get_state(), buffers
+
+
+def load_env_state(env, state):
+    """
+    Restore a `save_env_state` snapshot. Returns the restored observations.
+    """
+    scene_state, buffers = state
+    env.scene.reset(scene_state)
+    for name, value in buffers.items():
+        setattr(env, name, value.clone())
+    env.follower.invalidate()
+    return env.obs_buf
+
+
+def env_fingerprint(env):
+    """
+    Observations and base pose of env 0, what the rendered frame depends on.
+    """
+    return (
+        torch.cat([env.obs_buf[0], env.base_pos[0], env.base_euler[0, 2:]])
+        .cpu()
+        .numpy()
+    )
+
+
+class IdleLoopCache:
+    """
+    Replays the frames of an idle robot instead of simulating it.
+
+    While a robot idles (the mall G1 holding its receive pose, a locomotion
+    robot running the stand policy) its state becomes periodic. The cache
+    watches a fingerprint of the state every tick and, once the last
+    `confirm` fingerprints repeat with some period P, records one period:
+    the simulator state of every phase and the encoded frame of every
+    (camera, zoom) view seen. When the current view is complete it is
+    replayed without stepping physics.
+
+    Replaying stops when the view changes to one that was not recorded or
+    when `invalidate` is called because a command arrived. The state saved
+    for the current phase is then handed back through `resume_state` so
+    physics resumes exactly where the replayed frames left off.
+
+    Args:
+        min_period (int): Shortest period detected, in ticks.
+        max_period (int): Longest period detected, bounds memory use.
+        confirm (int): Consecutive ticks that must repeat before recording.
+        tol (float): Largest fingerprint difference considered equal.
+        enabled (bool): Never record anything when False.
+    """
+
+    def __init__(
+        self, min_period=1, max_period=100, confirm=20, tol=1e-3, enabled=True
+    ):
+        self.enabled = enabled
+        self.min_period = min_period
+        self.max_period = max_period
+        self.confirm = confirm
+        self.tol = tol
+
+        self._history = deque(maxlen=max_period + confirm)
+        self._resume = None
+        self._reset_loop()
+
+    def _reset_loop(self):
+        self.period = None
+        self.phase = 0
+        self.replaying = False
+        self._states = None
+        self._frames = {}
+
+    def _detect_period(self):
+        history = np.stack(self._history)
+        n = len(history)
+        recent = history[n - self.confirm :]
+        for period in range(self.min_period, min(self.max_period, n - self.confirm) + 1):
+            previous = history[n - self.confirm - period : n - period]
+            if np.abs(recent - previous).max() <= self.tol:
+                return period
+        return None
+
+    def _complete(self, key):
+        frames = self._frames.get(key)
+        return (
+            frames is not None
+            and all(frame is not None for frame in frames)
+            and _MISSING not in self._states
+        )
+
+    def replay(self, key):
+        """
+        Frame of this tick for view `key`, or None when physics has to run.
+        """
+        if self.period is None:
+            return None
+
+        if not self._complete(key):
+            if self.replaying:
+                self.replaying = False
+                self._resume = self._states[self.phase]
+            return None
+
+        self.replaying = True
+        frame = self._frames[key][self.phase]
+        self.phase = (self.phase + 1) % self.period
+        return frame
+
+    def record(self, key, frame, get_fingerprint, get_state):
+        """
+        Feed a simulated tick.
+
+        Args:
+            key: View the frame was rendered for, e.g. (camera, zoom).
+            frame: Encoded frame sent to the client.
+            get_fingerprint: Callable returning a 1D array summarising the
+                state the frame shows, only called while looking for a period.
+            get_state: Callable returning the state to resume from at this
+                tick, only called while a period is being recorded.
+        """
+        if not self.enabled:
+            return
+
+        if self.period is None:
+            self._history.append(np.asarray(get_fingerprint(), dtype=np.float64))
+            if len(self._history) < self.confirm + self.min_period:
+                return
+
+            period = self._detect_period()
+            if period is None:
+                return
+
+            # This tick becomes phase 0 of the loop
+            self.period = period
+            self.phase = 0
+            self._states = [_MISSING] * period
+
+        if self._states[self.phase] is _MISSING:
+            self._states[self.phase] = get_state()
+        frames = self._frames.setdefault(key, [None] * self.period)
+        if frames[self.phase] is None:
+            frames[self.phase] = frame
+        self.phase = (self.phase + 1) % self.period
+
+    def resume_state(self):
+        """
+        State to restore before stepping physics again, once per resume.
+        """
+        state, self._resume = self._resume, None
+        return state
+
+    def invalidate(self):
+        """
+        Forget the loop because the robot is about to leave its idle state.
+        """
+        if self.replaying:
+            self._resume = self._states[self.phase]
+        self._history.clear()
+        self._reset_loop()
@@ -0,0 +1,308 @@
+import os
+import pickle
+import threading
+
+import torch
+from torch import nn
+
+try:
+    import onnxruntime as ort
+except ImportError:
+    ort = None
+
+BACKENDS = ("torch", "torchscript", "onnx")
+
+
+class InferencePolicy(nn.Module):
+    """
+    Standalone actor network of an rsl_rl checkpoint.
+
+    Holds only the actor MLP (and the observation normalizer when the policy
+    was trained with one), frozen and in eval mode. Calling it maps
+    observations to actions like `runner.get_inference_policy()`.
+    """
+
+    def __init__(self, actor: nn.Module, normalizer: nn.Module = None):
+        super().__init__()
+        self.actor = actor
+        self.normalizer = normalizer if normalizer is not None else nn.Identity()
+        self.eval()
+        self.requires_grad_(False)
+
+    def forward(self, obs):
+        return self.actor(self.normalizer(obs))
+
+
+def load_inference_policy(log_dir, checkpoint, device="cuda:0"):
+    """
+    Build an InferencePolicy from a training log directory without creating
+    an OnPolicyRunner or an environment.
+
+    Args:
+        log_dir (str): Directory holding `cfgs.pkl` and the checkpoint.
+        checkpoint (str): Checkpoint file name, e.g. "model_1000.pt".
+        device (str): Device the policy runs on.
+
+    Returns:
+        InferencePolicy: The frozen actor.
+    """
+    # Only the torch backend needs rsl_rl, exported artifacts load without it
+    from rsl_rl.modules import ActorCritic, EmpiricalNormalization
+
+    cfgs = pickle.load(open(os.path.join(log_dir, "cfgs.pkl"), "rb"))
+    env_cfg, obs_cfg, train_cfg = cfgs[0], cfgs[1], cfgs[4]
+
+    policy_cfg = dict(train_cfg["policy"])
+    policy_cfg.pop("class_name", None)
+    num_obs = obs_cfg["num_obs"]
+    actor_critic = ActorCritic(num_obs, num_obs, env_cfg["num_actions"], **policy_cfg)
+
+    loaded = torch.load(os.path.join(log_dir, checkpoint), map_location=device)
+    actor_critic.load_state_dict(loaded["model_state_dict"])
+
+    normalizer = None
+    empirical_normalization = train_cfg.get(
+        "empirical_normalization",
+        train_cfg.get("runner", {}).get("empirical_normalization", False),
+    )
+    if empirical_normalization:
+        normalizer = EmpiricalNormalization(shape=[num_obs], until=1.0e8)
+        normalizer.load_state_dict(loaded["obs_norm_state_dict"])
+
+    return InferencePolicy(actor_critic.actor, normalizer).to(device)
+
+
+def artifact_path(log_dir, checkpoint, backend):
+    """
+    Path of the exported artifact of a checkpoint, next to `cfgs.pkl`.
+    """
+    stem = os.path.splitext(checkpoint)[0]
+    if backend == "torch":
+        return os.path.join(log_dir, checkpoint)
+    if backend == "torchscript":
+        return os.path.join(log_dir, stem + ".jit.pt")
+    if backend == "onnx":
+        return os.path.join(log_dir, stem + ".onnx")
+    raise ValueError(f"Unknown policy backend {backend!r}, expected one of {BACKENDS}")
+
+
+class DevicePolicy:
+    """
+    Policy running on its own device, e.g. a CPU policy serving a GPU scene.
+
+    Observations are moved to the policy device and actions are handed back
+    on the device of the observations, so the sims do not care where the
+    policy runs.
+    """
+
+    def __init__(self, run, device):
+        self.run = run
+        self.device = torch.device(device)
+
+    def __call__(self, obs, *args):
+        actions = self.run(obs.to(self.device), *(a.to(self.device) for a in args))
+        return actions.to(obs.device)
+
+
+class FusedPolicy(nn.Module):
+    """
+    Several actors with the same architecture evaluated together.
+
+    The weights of each layer are stacked along a leading policy axis so a
+    layer is a single batched matmul over all policies. Every env picks the
+    output of its own skill, so a mixed batch of envs costs one kernel per
+    layer instead of one forward pass per policy.
+    """
+
+    def __init__(self, policies):
+        super().__init__()
+        actors = [list(policy.actor) for policy in policies]
+        if len({len(layers) for layers in actors}) != 1:
+            raise ValueError("Fused policies must share the same architecture")
+
+        self.layers = []
+        for i, layers in enumerate(zip(*actors)):
+            if isinstance(layers[0], nn.Linear):
+                # (P, in, out) weights and (P, 1, out) biases
+                weight = torch.stack([layer.weight.T for layer in layers])
+                bias = torch.stack([layer.bias[None] for layer in layers])
+                self.register_buffer(f"weight_{i}", weight.contiguous())
+                self.register_buffer(f"bias_{i}", bias)
+                self.layers.append(i)
+            else:
+                self.add_module(f"activation_{i}", layers[0])
+                self.layers.append(layers[0])
+
+        means, stds = [], []
+        for policy in policies:
+            normalizer = policy.normalizer
+            if isinstance(normalizer, nn.Identity):
+                means.append(torch.zeros_like(self.weight_0[0, :, 0]))
+                stds.append(torch.ones_like(self.weight_0[0, :, 0]))
+            else:
+                means.append(normalizer._mean.reshape(-1))
+                stds.append(normalizer._std.reshape(-1) + normalizer.eps)
+        self.register_buffer("obs_mean", torch.stack(means)[:, None])
+        self.register_buffer("obs_std", torch.stack(stds)[:, None])
+
+        self.eval()
+        self.requires_grad_(False)
+
+    def forward(self, obs, skills):
+        """
+        Args:
+            obs: (B, num_obs) observations.
+            skills: (B,) index of the policy of every env.
+
+        Returns:
+            torch.Tensor: (B, num_actions) actions.
+        """
+        x = (obs[None] - self.obs_mean) / self.obs_std
+        for layer in self.layers:
+            if isinstance(layer, int):
+                x = torch.baddbmm(
+                    getattr(self, f"bias_{layer}"), x, getattr(self, f"weight_{layer}")
+                )
+            else:
+                x = layer(x)
+        return x[skills, torch.arange(obs.shape[0], device=obs.device)]
+
+
+class SkillPolicy:
+    """
+    Per-skill dispatch with the FusedPolicy interface, for backends whose
+    weights cannot be stacked.
+    """
+
+    def __init__(self, policies):
+        self.policies = policies
+
+    def __call__(self, obs, skills):
+        actions = None
+        for skill in torch.unique(skills).tolist():
+            mask = skills == skill
+            out = self.policies[skill](obs[mask])
+            if actions is None:
+                actions = out.new_empty((obs.shape[0], out.shape[1]))
+            actions[mask] = out
+        return actions
+
+
+def load_torchscript_policy(path, device="cpu"):
+    module = torch.jit.load(path, map_location=device)
+    module.eval()
+    return DevicePolicy(module, device)
+
+
+def load_onnx_policy(path, threads=0):
+    if ort is None:
+        raise ImportError("The onnx policy backend requires onnxruntime")
+
+    options = ort.SessionOptions()
+    options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+    options.execution_mode = ort.ExecutionMode.ORT_SEQUENTIAL
+    options.inter_op_num_threads = 1
+    if threads:
+        options.intra_op_num_threads = threads
+    session = ort.InferenceSession(
+        path, sess_options=options, providers=["CPUExecutionProvider"]
+    )
+    input_name = session.get_inputs()[0].name
+
+    def run(obs):
+        (actions,) = session.run(None, {input_name: obs.numpy()})
+        return torch.from_numpy(actions)
+
+    return DevicePolicy(run, "cpu")
+
+
+class PolicyRegistry:
+    """
+    Process-wide cache of inference policies shared by every session.
+
+    Policies are keyed by artifact path, modification time, device and
+    backend, so each checkpoint is loaded once and reloaded only when the
+    file changes. The "torchscript" and "onnx" backends load the artifacts
+    written by `export_policy.py` and run without rsl_rl.
+    """
+
+    def __init__(self):
+        self._policies = {}
+        self._fused = {}
+        self._lock = threading.Lock()
+
+    def get(self, log_dir, checkpoint, device="cuda:0", backend="torch", threads=0):
+        """
+        Args:
+            log_dir (str): Directory holding `cfgs.pkl` and the checkpoint.
+            checkpoint (str): Checkpoint file name, e.g. "model_1000.pt".
+            device (str): Device the policy runs on. The onnx backend always
+                runs on the CPU.
+            backend (str): One of "torch", "torchscript" or "onnx".
+            threads (int): Intra-op threads for CPU inference, 0 keeps the
+                library default.
+        """
+        path = os.path.realpath(artifact_path(log_dir, checkpoint, backend))
+        if backend == "onnx":
+            device = "cpu"
+        key = (path, os.path.getmtime(path), str(device), backend)
+
+        with self._lock:
+            policy = self._policies.get(key)
+            if policy is None:
+                # Forget older versions of the same artifact
+                for stale in [
+                    k for k in self._policies if k[0] == path and k[2:] == key[2:]
+                ]:
+                    del self._policies[stale]
+
+                if threads and backend != "onnx" and str(device) == "cpu":
+                    torch.set_num_threads(threads)
+
+                if backend == "torch":
+                    policy = DevicePolicy(
+                        load_inference_policy(log_dir, checkpoint, device), device
+                    )
+                elif backend == "torchscript":
+                    policy = load_torchscript_policy(path, device)
+                else:
+                    policy = load_onnx_policy(path, threads)
+                self._policies[key] = policy
+
+        return policy
+
+    def get_fused(self, log_dirs, checkpoint, device="cuda:0", backend="torch", threads=0):
+        """
+        Load the policies of `log_dirs` and fuse them into one module called
+        as `policy(obs, skills)`, where `skills` indexes into `log_dirs`.
+        """
+        policies = tuple(
+            self.get(log_dir, checkpoint, device, backend, threads) for log_dir in log_dirs
+        )
+
+        with self._lock:
+            fused = self._fused.get(policies)
+            if fused is None:
+                if backend == "torch":
+                    fused = DevicePolicy(
+                        FusedPolicy([policy.run for policy in policies]).to(device),
+                        device,
+                    )
+                else:
+                    fused = SkillPolicy(policies)
+                # Drop fusions of policies that have since been reloaded
+                live = set(map(id, self._policies.values()))
+                self._fused = {
+                    k: v for k, v in self._fused.items() if all(id(p) in live for p in k)
+                }
+                self._fused[policies] = fused
+
+        return fused
+
+    def clear(self):
+        with self._lock:
+            self._policies.clear()
+            self._fused.clear()
+
+
+policy_registry = PolicyRegistry()
@@ -0,0 +1,177 @@
+import json
+import logging
+import math
+import os
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+CALIBRATION_FILE = "calibration.json"
+
+# Index of each action's policy in the fused skill stack of the sims
+SKILL_INDEX = {
+    "rotate_right": 0,
+    "rotate_left": 1,
+    "wait": 2,
+    "move_forward": 3,
+}
+
+# Unit of the LLM amplitude per action: degrees of yaw, meters along the
+# ground or plain steps
+UNITS = {
+    "rotate_left": "deg",
+    "rotate_right": "deg",
+    "move_forward": "m",
+    "wait": "step",
+}
+
+# Direction of the yaw change of the rotate actions, yaw grows to the left
+YAW_SIGN = {"rotate_left": 1.0, "rotate_right": -1.0}
+
+
+class SkillCalibration:
+    """
+    How fast a skill makes progress, fitted by calibrate_skills.py.
+
+    Progress after t steps is modelled as rate * (t - delay), and after the
+    robot switches back to standing it keeps going for `lag` more steps.
+
+    Args:
+        rate (float): Progress per step once moving, in the action unit.
+        delay (float): Steps before the robot starts moving.
+        lag (float): Steps of progress the robot coasts after stopping.
+    """
+
+    def __init__(self, rate, delay=0.0, lag=0.0):
+        self.rate = float(rate)
+        self.delay = float(delay)
+        self.lag = float(lag)
+
+    def steps(self, amount):
+        """
+        Open-loop step count to cover `amount`.
+        """
+        return max(1, math.ceil(amount / self.rate + self.delay - self.lag))
+
+    def to_dict(self):
+        return {"rate": self.rate, "delay": self.delay, "lag": self.lag}
+
+
+def load_calibration(skill_dirs, checkpoint, defaults):
+    """
+    Calibration of every action, read from calibration.json in the log dir
+    of the skill running it.
+
+    Args:
+        skill_dirs (dict): Action name to the log dir of its policy.
+        checkpoint (str): Checkpoint file name the entries are fitted for.
+        defaults (dict): Action name to the SkillCalibration used when the
+            checkpoint has not been calibrated.
+    """
+    calibration = dict(defaults)
+    for action, log_dir in skill_dirs.items():
+        path = os.path.join(log_dir, CALIBRATION_FILE)
+        if not os.path.isfile(path):
+            continue
+        with open(path) as f:
+            entry = json.load(f).get(checkpoint, {}).get(action)
+        if entry is None:
+            logger.warning(f"{path} has no {action} entry for {checkpoint}")
+            continue
+        calibration[action] = SkillCalibration(**entry)
+    return calibration
+
+
+def save_calibration(log_dir, checkpoint, action, calibration):
+    """
+    Store the fitted calibration of `action` next to its checkpoint.
+    """
+    path = os.path.join(log_dir, CALIBRATION_FILE)
+    table = {}
+    if os.path.isfile(path):
+        with open(path) as f:
+            table = json.load(f)
+    table.setdefault(checkpoint, {})[action] = calibration.to_dict()
+    with open(path, "w") as f:
+        json.dump(table, f, indent=2, sort_keys=True)
+    return path
+
+
+def wrap_degrees(angle):
+    return (angle + 180.0) % 360.0 - 180.0
+
+
+class SkillExecutor:
+    """
+    Runs a locomotion action until the robot has actually covered it.
+
+    Progress is measured on the [x, y, yaw] robot position every step:
+    accumulated yaw change for the rotate actions, distance travelled for
+    move_forward, steps for wait. The action ends as soon as stopping now
+    lands closer to the target than one more step would, counting the
+    calibrated coast after the stop, or once the open-loop step budget
+    times `margin` runs out.
+
+    Args:
+        calibration (dict): Action name to SkillCalibration.
+        margin (float): Step budget relative to the open-loop step count.
+    """
+
+    def __init__(self, calibration, margin=1.5):
+        self.calibration = calibration
+        self.margin = margin
+        self.action = None
+        self.target = 0.0
+        self.progress = 0.0
+        self.step = 0
+        self.max_steps = 0
+
+    def start(self, action, amplitude, position):
+        """
+        Begin `action`, returns its step budget.
+        """
+        cal = self.calibration[action]
+        self.action = action
+        self.target = abs(float(amplitude))
+        self.progress = 0.0
+        self.step = 0
+        self._last = np.array(position, dtype=np.float64)
+        if UNITS[action] == "step":
+            self.max_steps = cal.steps(self.target)
+        else:
+            self.max_steps = math.ceil(self.margin * cal.steps(self.target))
+        return self.max_steps
+
+    def measure(self, position):
+        """
+        Add the progress made since the last position, returns the total.
+        """
+        position = np.array(position, dtype=np.float64)
+        unit = UNITS[self.action]
+        if unit == "deg":
+            delta = wrap_degrees(position[2] - self._last[2])
+            self.progress += YAW_SIGN[self.action] * delta
+        elif unit == "m":
+            self.progress += float(np.linalg.norm(position[:2] - self._last[:2]))
+        else:
+            self.progress += self.calibration[self.action].rate
+        self._last = position
+        return self.progress
+
+    def reached(self, position):
+        """
+        Feed the position before a step, True when the action should end.
+        """
+        if self.step > 0:
+            self.measure(position)
+        self.step += 1
+        if self.step > self.max_steps:
+            return True
+
+        cal = self.calibration[self.action]
+        if UNITS[self.action] == "step":
+            return self.progress >= self.target
+
+        remaining = self.target - self.progress - cal.rate * cal.lag
+        return remaining <= cal.rate / 2
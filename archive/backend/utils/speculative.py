@@ -0,0 +1,114 @@
+import asyncio
+import re
+
+_END = object()
+
+# Hesitations STT writes out, they do not change what was asked
+FILLERS = {"um", "umm", "uh", "uhm", "er", "erm", "ah", "hmm", "mm"}
+
+
+def words(text):
+    """
+    Words of a transcript, lowercased, without punctuation and fillers.
+    """
+    return [w for w in re.findall(r"[\w']+", text.lower()) if w not in FILLERS]
+
+
+def same_request(a, b):
+    """
+    Whether two transcripts ask the same thing: they have the same words and
+    differ at most in case, punctuation and fillers.
+    """
+    return words(a) == words(b)
+
+
+class SpeculativeStream:
+    """
+    Streaming request started on a partial transcript, before the final one
+    is known.
+
+    `propose` starts `generate(text, accepted)` in the background once a
+    partial has `min_words` words, and restarts it when a later partial has
+    other words. Its chunks are held back, so nothing reaches the user before
+    `result` is called with the final transcript: when that is the
+    `same_request` as the speculated one the held chunks and the rest of the
+    stream are served, otherwise the speculation is cancelled and the
+    request made again with the final transcript.
+
+    `accepted` is a future resolved with whether the answer is served, a
+    speculation finished ahead of `result` must wait on it before it records
+    anything (history, cache).
+
+    Args:
+        generate: Callable taking a transcript and the `accepted` future and
+            returning an async iterator of chunks.
+        min_words (int): Words a partial needs before it is speculated on.
+    """
+
+    def __init__(self, generate, min_words=3):
+        self.generate = generate
+        self.min_words = min_words
+        self.text = None  # Transcript of the running speculation
+        self.hits = 0
+        self.misses = 0
+        self.restarts = 0
+        self._task = None
+        self._chunks = None
+        self._accepted = None
+
+    def propose(self, text):
+        if len(words(text)) < self.min_words:
+            return
+        if self._task is not None:
+            if same_request(self.text, text):
+                return
+            self.restarts += 1
+        self.cancel()
+        self.text = text
+        self._chunks = asyncio.Queue()
+        self._accepted = asyncio.get_running_loop().create_future()
+        self._task = asyncio.create_task(self._run(text, self._accepted, self._chunks))
+
+    def cancel(self):
+        if self._accepted is not None and not self._accepted.done():
+            self._accepted.set_result(False)
+        if self._task is not None:
+            self._task.cancel()
+        self._task = None
+        self._chunks = None
+        self._accepted = None
+        self.text = None
+
+    async def _run(self, text, accepted, chunks):
+        try:
+            async for chunk in self.generate(text, accepted):
+                chunks.put_nowait(chunk)
+        finally:
+            chunks.put_nowait(_END)
+
+    async def result(self, text):
+        """
+        Chunks of the answer to the final transcript `text`.
+        """
+        if self._task is None or not same_request(self.text, text):
+            if self._task is not None:
+                self.misses += 1
+            self.cancel()
+            accepted = asyncio.get_running_loop().create_future()
+            accepted.set_result(True)
+            async for chunk in self.generate(text, accepted):
+                yield chunk
+            return
+
+        self.hits += 1
+        task, chunks = self._task, self._chunks
+        self._accepted.set_result(True)
+        try:
+            while True:
+                chunk = await chunks.get()
+                if chunk is _END:
+                    break
+                yield chunk
+            await task  # Raises what the request raised
+        finally:
+            self.cancel()
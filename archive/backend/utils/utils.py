@@ -7,11 +7,28 @@ from PIL import Image
 
 import re
 import aiohttp
+from portal.cache import ResponseCache, quantize
+from portal.http import http_client
+from portal.sse import decode_response
 from datetime import datetime
 from fastapi import WebSocket
 from config import Config
 from .system_prompt import SYSTEM_PROMPT_WAREHOUSE
 
+# Answers to repeated instructions, shared by every session
+response_cache = ResponseCache(
+    max_entries=Config.response_cache_size,
+    ttl=Config.response_cache_ttl,
+    path=Config.response_cache_path or None,
+)
+
+def robot_state_key(position):
+    """
+    Robot [x, y, yaw] on a 0.25 m and 15 degree grid, for the response cache.
+    """
+    return quantize(position[:2], 0.25) + quantize(position[2:], 15)
+
+
 def parse_action_robot_in_mall(string):
     return {"actions":[{"type":"talking"}]}
 
@@ -61,6 +78,8 @@ async def send_openai_request(
     system_prompt: str = SYSTEM_PROMPT_WAREHOUSE,
     model: str = Config.llm_model,
     api_key: str = Config.api_key,
+    instruction: str = None,
+    state=None,
 ):
     """
     Send an async request to a local OpenAI-like API server.
@@ -70,10 +89,24 @@ async def send_openai_request(
         prompt (str): The user's message/prompt
         system_prompt (str, optional): System instruction for the AI. Defaults to a helpful assistant.
         model (str, optional): The model to use. Defaults to "gpt-3.5-turbo".
+        instruction (str, optional): The user's own words, without the scene context in the prompt.
+            When given, the answer is served from and stored in the response cache.
+        state (optional): Quantized scene state the answer depends on.
 
     Returns:
         dict: The API response with full text content
     """
+    if instruction is not None:
+        key = response_cache.key(instruction, model + system_prompt, state)
+        async for chunk in response_cache.stream(
+            key,
+            lambda: send_openai_request(
+                api_url, prompt, system_prompt, model, api_key
+            ),
+        ):
+            yield chunk
+        return
+
     # Load API key from .env file
 
     # Prepare the request payload
@@ -89,54 +122,31 @@ async def send_openai_request(
         # "max_tokens": 5000    # Optional: limit response length
     }
 
-    # Create an async HTTP session
-    async with aiohttp.ClientSession() as session:
-        try:
-            # Send POST request to the API
-            async with session.post(
-                api_url,
-                json=payload,
-                headers={
-                    "Content-Type": "application/json",
-                    "Authorization": f"Bearer {api_key}",
-                    "HTTP-Referer": "https://your-site.com",
-                    "X-Title": "Robot Navigation System",
-                },
-            ) as response:
-                # Check if the request was successful
-                if response.status == 200:
-                    async for chunk in response.content:
-                        if chunk:
-                            # Decode the chunk (assumes JSON lines format)
-                            try:
-                                chunk_str = chunk.decode("utf-8").strip()
-
-                                # Handle SSE format (data: prefix)
-                                if chunk_str.startswith("data: "):
-                                    chunk_str = chunk_str[6:]
-
-                                # Skip empty or "data: [DONE]" messages
-                                if chunk_str and chunk_str != "[DONE]":
-                                    # Parse JSON and extract content
-                                    chunk_data = json.loads(chunk_str)
-
-                                    yield chunk_data
-                            except json.JSONDecodeError:
-                                # Some chunks might not be valid JSON
-                                # This can happen with SSE formatting
-                                if "[DONE]" not in chunk_str:
-                                    print(
-                                        f"Warning: Could not parse chunk as JSON: {chunk_str}"
-                                    )
-                else:
-                    # Handle error responses
-                    error_text = await response.text()
-                    print(f"Error: {response.status} - {error_text}")
-                    # return None
-
-        except aiohttp.ClientError as e:
-            print(f"Request failed: {e}")
-            # return None
+    try:
+        # Send POST request to the API
+        async with http_client.post(
+            api_url,
+            json=payload,
+            headers={
+                "Content-Type": "application/json",
+                "Authorization": f"Bearer {api_key}",
+                "HTTP-Referer": "https://your-site.com",
+                "X-Title": "Robot Navigation System",
+            },
+        ) as response:
+            # Check if the request was successful
+            if response.status == 200:
+                async for chunk_data in decode_response(response):
+                    yield chunk_data
+            else:
+                # Handle error responses
+                error_text = await response.text()
+                print(f"Error: {response.status} - {error_text}")
+                # return None
+
+    except aiohttp.ClientError as e:
+        print(f"Request failed: {e}")
+        # return None
 
 
 def encode_numpy_array(arr):
@@ -168,6 +178,16 @@ async def send_personal_message(websocket, message: str, target_id: int):
     await websocket.send_text(message)
 
 
+def clear_queue(queue: asyncio.Queue):
+    """
+    Drop every queued item, e.g. the actions of a stopped or superseded
+    command.
+    """
+    while not queue.empty():
+        queue.get_nowait()
+        queue.task_done()
+
+
 async def check_timeout(websocket: WebSocket, last_activity_ref):
     while True:
         await asyncio.sleep(10)  # Check every 10 seconds
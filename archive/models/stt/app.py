@@ -3,7 +3,7 @@ import io
 from dotenv import load_dotenv
 from fastapi import FastAPI, File, UploadFile, HTTPException
 import torch
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, StreamingResponse
 import json
 import uvicorn
 from typing import Annotated
@@ -44,12 +44,37 @@ app = FastAPI(lifespan=lifespan, title="Fully Self-Contained WebSocket Server")
 # model = WhisperModel(model_size, device="cpu", compute_type="int8")
 
 
+def transcript_events(audio):
+    """
+    NDJSON lines of a transcription as it is decoded: {"partial": text so
+    far} after every segment, then {"text": whole transcript}. Whisper does
+    not revise a segment once it is out, so a partial only ever grows.
+    """
+    try:
+        segments, info = transcribe_model.transcribe(
+            audio, beam_size=BEAM_SIZE, language="en")
+        final = ""
+        for segment in segments:
+            final += segment.text
+            yield json.dumps({"partial": final.strip()}) + "\n"
+        yield json.dumps({"text": final}) + "\n"
+    except Exception as e:
+        logger.error(f"Error processing request: {e}")
+        yield json.dumps({"error": str(e)}) + "\n"
+
+
 @app.post("/v1/audio/transcriptions")
-async def tokenize_audio(model: Annotated[str, Form()], file: UploadFile = File(...)):
+async def tokenize_audio(model: Annotated[str, Form()], file: UploadFile = File(...), stream: Annotated[bool, Form()] = False):
     try:
         # Read file
         file_obj = await file.read()
 
+        if stream:
+            # Sync generator, run in the threadpool segment by segment
+            return StreamingResponse(
+                transcript_events(io.BytesIO(file_obj)),
+                media_type="application/x-ndjson")
+
         segments, info = transcribe_model.transcribe(
             io.BytesIO(file_obj), beam_size=BEAM_SIZE, language="en")
         final = ""
@@ -1,5 +1,7 @@
-from portal import Server
-from examples.desk.simulation import Simulation
+from contextlib import asynccontextmanager
+
+from portal import Server, http_client, llm_dispatcher
+from examples.desk.simulation import Simulation, response_cache
 import uvicorn
 from fastapi import FastAPI
 
@@ -21,8 +23,22 @@ server.register_simulations(
     ]
 )
 
-app = FastAPI(title="Fully Self-Contained WebSocket Server")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    yield
+    await http_client.close()
+    await response_cache.close()
+
+
+app = FastAPI(lifespan=lifespan, title="Fully Self-Contained WebSocket Server")
 app.include_router(server.router)
 
+
+@app.get("/metrics/llm")
+def llm_metrics():
+    return llm_dispatcher.metrics()
+
+
 if __name__ == "__main__":
     uvicorn.run("example:app", host="0.0.0.0", port=8000, reload=False)
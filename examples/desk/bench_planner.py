@@ -0,0 +1,85 @@
+"""
+Plans per second of the desk planner against Genesis' OMPL RRTConnect.
+
+Run from the repository root:
+
+    python -m examples.desk.bench_planner --plans 20
+"""
+
+import argparse
+import time
+
+import genesis as gs
+import numpy as np
+
+from .config import OBJECT_SIZES
+from .scene import Scene
+from .trajectory import to_numpy
+
+
+def sample_goals(scene, count, rng):
+    goals = []
+    start = np.array([*scene.init_arm_dofs, *scene.init_finger_dofs])
+    while len(goals) < count:
+        target = np.array([rng.uniform(0.3, 0.8), rng.uniform(0.2, 0.8), 0.2])
+        qpos, error = scene.robot.inverse_kinematics(
+            link=scene.end_effector,
+            pos=target,
+            quat=np.array([0, 1, 0, 0]),
+            init_qpos=start,
+            return_error=True,
+        )
+        if float(error.abs().max()) < 0.01:
+            goals.append(to_numpy([qpos])[0])
+    return start, goals
+
+
+def bench(name, plan, start, goals):
+    solved = 0
+    begin = time.perf_counter()
+    for goal in goals:
+        if plan(start, goal) is not None:
+            solved += 1
+    elapsed = time.perf_counter() - begin
+
+    print(
+        f"{name:>8}: {len(goals) / elapsed:8.2f} plans/s, "
+        f"{elapsed / len(goals) * 1000:8.1f} ms/plan, "
+        f"{solved}/{len(goals)} solved"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--plans", type=int, default=20)
+    parser.add_argument("--waypoints", type=int, default=150)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    gs.init()
+    scene = Scene(480)
+    start, goals = sample_goals(scene, args.plans, np.random.default_rng(args.seed))
+
+    scene.planner.set_obstacles(scene.registry.poses(), np.array(OBJECT_SIZES) / 2)
+    bench(
+        "desk",
+        lambda s, g: scene.planner.plan(s, g, args.waypoints),
+        start,
+        goals,
+    )
+    bench(
+        "genesis",
+        lambda s, g: scene.robot.plan_path(
+            qpos_start=s,
+            qpos_goal=g,
+            num_waypoints=args.waypoints,
+            timeout=5,
+            planner="RRTConnect",
+        ),
+        start,
+        goals,
+    )
+
+
+if __name__ == "__main__":
+    main()
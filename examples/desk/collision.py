@@ -0,0 +1,214 @@
+import numpy as np
+
+# Panda kinematics, modified DH convention: (a, d, alpha) per joint, then the
+# flange. Matches the MJCF up to the hand link.
+PANDA_DH = [
+    (0.0, 0.333, 0.0),
+    (0.0, 0.0, -np.pi / 2),
+    (0.0, 0.316, np.pi / 2),
+    (0.0825, 0.0, np.pi / 2),
+    (-0.0825, 0.384, -np.pi / 2),
+    (0.0, 0.0, np.pi / 2),
+    (0.088, 0.0, np.pi / 2),
+]
+PANDA_FLANGE = (0.0, 0.107, 0.0)
+
+# Spheres along the arm: (from frame, to frame, number of spheres, radius).
+# Frames 0 and 1 never leave the base and are not checked.
+PANDA_SEGMENTS = [
+    (2, 3, 3, 0.075),
+    (3, 4, 2, 0.07),
+    (4, 5, 4, 0.065),
+    (5, 7, 2, 0.06),
+    (7, 8, 2, 0.06),
+]
+
+# Hand and fingers in the flange frame (the hand is turned -45 deg about z)
+_c, _s = np.cos(-np.pi / 4), np.sin(-np.pi / 4)
+PANDA_HAND_SPHERES = [
+    ((-_s * 0.05, _c * 0.05, 0.06), 0.05),
+    ((0.0, 0.0, 0.06), 0.05),
+    ((_s * 0.05, -_c * 0.05, 0.06), 0.05),
+    ((0.0, 0.0, 0.11), 0.03),
+]
+
+
+def _dh_transforms(a, d, alpha, theta):
+    ct, st = np.cos(theta), np.sin(theta)
+    ca, sa = np.cos(alpha), np.sin(alpha)
+
+    T = np.zeros((len(theta), 4, 4))
+    T[:, 0, 0] = ct
+    T[:, 0, 1] = -st
+    T[:, 0, 3] = a
+    T[:, 1, 0] = st * ca
+    T[:, 1, 1] = ct * ca
+    T[:, 1, 2] = -sa
+    T[:, 1, 3] = -d * sa
+    T[:, 2, 0] = st * sa
+    T[:, 2, 1] = ct * sa
+    T[:, 2, 2] = ca
+    T[:, 2, 3] = d * ca
+    T[:, 3, 3] = 1
+    return T
+
+
+def panda_fk(qs, base_pos):
+    """
+    Forward kinematics for a batch of arm configurations.
+
+    Args:
+        qs: (B, 7) joint positions.
+        base_pos: World position of the robot base.
+
+    Returns:
+        numpy.ndarray: (B, 9, 4, 4) world transforms of the base, the seven
+        joint frames and the flange.
+    """
+    qs = np.atleast_2d(qs)
+    B = len(qs)
+
+    T = np.tile(np.eye(4), (B, 1, 1))
+    T[:, :3, 3] = base_pos
+    frames = [T]
+    for i, (a, d, alpha) in enumerate(PANDA_DH):
+        T = T @ _dh_transforms(a, d, alpha, qs[:, i])
+        frames.append(T)
+    T = T @ _dh_transforms(*PANDA_FLANGE, np.zeros(B))
+    frames.append(T)
+
+    return np.stack(frames, axis=1)
+
+
+class PandaSpheres:
+    """
+    Sphere approximation of the Panda used for cheap collision checks.
+    """
+
+    def __init__(self, base_pos):
+        self.base_pos = np.asarray(base_pos, dtype=np.float64)
+
+        weights, radii = [], []
+        for start, end, count, radius in PANDA_SEGMENTS:
+            for t in np.linspace(0, 1, count):
+                weights.append((start, end, t))
+                radii.append(radius)
+        self._segments = weights
+        self._hand = np.array([offset for offset, _ in PANDA_HAND_SPHERES])
+
+        radii += [radius for _, radius in PANDA_HAND_SPHERES]
+        self.radii = np.array(radii)
+
+    def centers(self, qs):
+        """
+        (B, S, 3) sphere centers for (B, 7) arm configurations.
+        """
+        frames = panda_fk(qs, self.base_pos)
+        origins = frames[:, :, :3, 3]
+
+        arm = np.stack(
+            [
+                (1 - t) * origins[:, start] + t * origins[:, end]
+                for start, end, t in self._segments
+            ],
+            axis=1,
+        )
+
+        flange = frames[:, -1]
+        hand = np.einsum("bij,sj->bsi", flange[:, :3, :3], self._hand)
+        hand += flange[:, None, :3, 3]
+
+        return np.concatenate([arm, hand], axis=1)
+
+
+def box_distance(points, center, half_extents, quat=None):
+    """
+    Signed distance from points to boxes.
+
+    Args:
+        points: (..., 3) query points.
+        center: (M, 3) box centers.
+        half_extents: (M, 3) box half sizes.
+        quat: Optional (M, 4) box orientations as [w, x, y, z].
+
+    Returns:
+        numpy.ndarray: (..., M) distances, negative inside a box.
+    """
+    local = points[..., None, :] - center
+    if quat is not None:
+        local = np.einsum("mji,...mj->...mi", quat_to_rotation(quat), local)
+
+    q = np.abs(local) - half_extents
+    outside = np.linalg.norm(np.maximum(q, 0), axis=-1)
+    inside = np.minimum(q.max(axis=-1), 0)
+    return outside + inside
+
+
+def quat_to_rotation(quat):
+    w, x, y, z = np.moveaxis(np.asarray(quat, dtype=np.float64), -1, 0)
+    return np.stack(
+        [
+            np.stack([1 - 2 * (y * y + z * z), 2 * (x * y - w * z), 2 * (x * z + w * y)], -1),
+            np.stack([2 * (x * y + w * z), 1 - 2 * (x * x + z * z), 2 * (y * z - w * x)], -1),
+            np.stack([2 * (x * z - w * y), 2 * (y * z + w * x), 1 - 2 * (x * x + y * y)], -1),
+        ],
+        -2,
+    )
+
+
+class StaticSDF:
+    """
+    Signed distance grid of the static desk geometry (ground plane and table).
+
+    Distances are sampled once on a regular grid and looked up with
+    trilinear interpolation. Queries outside the grid are clamped to its
+    border.
+    """
+
+    def __init__(self, grid, origin, voxel_size):
+        self.grid = grid
+        self.origin = np.asarray(origin, dtype=np.float64)
+        self.voxel_size = float(voxel_size)
+        self.shape = np.array(grid.shape)
+
+    @classmethod
+    def from_boxes(cls, boxes, origin, shape, voxel_size, plane=True):
+        """
+        Args:
+            boxes: List of (center, size) of static axis aligned boxes.
+            origin: World position of the first grid sample.
+            shape: Number of samples along x, y, z.
+            voxel_size: Sample spacing.
+            plane: Include the ground plane z = 0.
+        """
+        origin = np.asarray(origin, dtype=np.float64)
+        axes = [origin[i] + np.arange(shape[i]) * voxel_size for i in range(3)]
+        points = np.stack(np.meshgrid(*axes, indexing="ij"), axis=-1)
+
+        grid = np.full(tuple(shape), np.inf)
+        if plane:
+            grid = np.minimum(grid, points[..., 2])
+        if boxes:
+            centers = np.array([center for center, _ in boxes], dtype=np.float64)
+            half = np.array([size for _, size in boxes], dtype=np.float64) / 2
+            grid = np.minimum(grid, box_distance(points, centers, half).min(axis=-1))
+
+        return cls(grid.astype(np.float32), origin, voxel_size)
+
+    def __call__(self, points):
+        coords = (points - self.origin) / self.voxel_size
+        coords = np.clip(coords, 0, self.shape - 1.000001)
+
+        i = np.floor(coords).astype(int)
+        f = coords - i
+        x, y, z = i[..., 0], i[..., 1], i[..., 2]
+        fx, fy, fz = f[..., 0], f[..., 1], f[..., 2]
+        g = self.grid
+
+        c00 = g[x, y, z] * (1 - fx) + g[x + 1, y, z] * fx
+        c10 = g[x, y + 1, z] * (1 - fx) + g[x + 1, y + 1, z] * fx
+        c01 = g[x, y, z + 1] * (1 - fx) + g[x + 1, y, z + 1] * fx
+        c11 = g[x, y + 1, z + 1] * (1 - fx) + g[x + 1, y + 1, z + 1] * fx
+        c0 = c00 * (1 - fy) + c10 * fy
+        c1 = c01 * (1 - fy) + c11 * fy
+        return c0 * (1 - fz) + c1 * fz
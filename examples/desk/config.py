@@ -1,9 +1,50 @@
+import os
+
 KP = [4500, 4500, 3500, 3500, 2000, 2000, 2000, 100, 100]
 KV = [450, 450, 350, 350, 200, 200, 200, 10, 10]
 FORCE_RANGE = [
     [-87, -87, -87, -87, -12, -12, -12, -100, -100],
     [87, 87, 87, 87, 12, 12, 12, 100, 100],
 ]
+# Panda joint velocity (rad/s) and acceleration (rad/s^2) limits. The MJCF only
+# carries position and force ranges, these come from the Franka datasheet.
+ARM_VEL_LIMITS = [2.175, 2.175, 2.175, 2.175, 2.61, 2.61, 2.61]
+ARM_ACC_LIMITS = [15, 7.5, 10, 12.5, 15, 20, 20]
+TRAJECTORY_SPEED_SCALE = 0.5  # Fraction of the limits used when retiming
+
+# A hold ends once the arm is within SETTLE_POS_TOL (rad) of its target, every
+# DOF moves slower than SETTLE_VEL_TOL (rad/s) and the fingers are done: open,
+# fully closed, or closed on an object with at least GRASP_FORCE_THRESHOLD (N)
+SETTLE_POS_TOL = 0.01
+SETTLE_VEL_TOL = 0.05
+FINGER_POS_TOL = 0.002
+GRASP_FORCE_THRESHOLD = 1.0
+SETTLE_MIN_TICKS = 5
+SETTLE_MAX_TICKS = 100  # Timeout cap, the old fixed hold length
+
+FINGER_OPEN_POS = 0.05  # Commanded target, the joints stop at their 0.04 m limit
+FINGER_CLOSED_POS = 0.0
+
+# Reachability map of the hand target over the desk workspace, built offline
+# with `python -m examples.desk.reachability`
+REACH_MAP_PATH = os.path.join(os.path.dirname(__file__), "reach_map")
+REACH_MAP_ORIGIN = (-0.2, -0.1, 0.0)
+REACH_MAP_SHAPE = (48, 48, 32)
+REACH_MAP_VOXEL = 0.025
+REACH_POS_TOL = 0.005
+REACH_ROT_TOL = 0.05
+REACH_SNAP_DISTANCE = 0.05  # Furthest a target is moved before it is rejected
+
+ROBOT_POS = (0, 0.5, 0)
+TABLE_POS = (0.5, 0.5, 0)
+TABLE_SIZE = (1, 1, 0.02)
+
+# Signed distance grid of the static geometry used by the desk planner
+SDF_ORIGIN = (-0.5, -0.5, -0.1)
+SDF_SHAPE = (100, 100, 65)
+SDF_VOXEL = 0.02
+PLANNER_TIMEOUT = 1.0  # Desk planner budget before falling back to OMPL
+
 INIT_ARM_DOFS = [0, 0, 0, 0, 0, 0, 0]
 INIT_FINGER_DOFS = [0.1, 0.1]
 
@@ -22,6 +63,11 @@ FINGER_JOINT_NAMES = [
     "finger_joint2",
 ]
 
+FINGER_LINK_NAMES = [
+    "left_finger",
+    "right_finger",
+]
+
 
 COLORS = {
     "red": (0.94, 0.5, 0.5, 1.0),
@@ -58,3 +104,18 @@ CAMERA_CONFIGS = {
 }
 
 OBJECT_SIZES = (0.05, 0.05, 0.05)
+
+# Robot task planner, `python -m examples.desk.stub_server` serves a local one.
+# With ROBOT_TASK_STREAM=1 reasoning and actions are streamed as NDJSON or SSE
+# events and handled as they arrive, see stub_server.py for the format
+ROBOT_TASK_URL = os.environ.get(
+    "ROBOT_TASK_URL", "http://10.200.20.109:3348/robot/task"
+)
+ROBOT_TASK_STREAM = os.environ.get("ROBOT_TASK_STREAM", "0") == "1"
+
+# Planner answers are cached per instruction and cube layout, positions in
+# model units (cm) snapped to RESPONSE_CACHE_STATE_STEP. Set RESPONSE_CACHE_PATH
+# to keep the cache across restarts
+RESPONSE_CACHE_STATE_STEP = 2
+RESPONSE_CACHE_TTL = float(os.environ.get("RESPONSE_CACHE_TTL", 24 * 3600))
+RESPONSE_CACHE_PATH = os.environ.get("RESPONSE_CACHE_PATH")
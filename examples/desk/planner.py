@@ -0,0 +1,206 @@
+import time
+
+import numpy as np
+
+from .collision import PandaSpheres, box_distance
+
+
+class _Tree:
+    def __init__(self, root, capacity=1024):
+        self.nodes = np.zeros((capacity, len(root)))
+        self.parents = np.zeros(capacity, dtype=int)
+        self.nodes[0] = root
+        self.parents[0] = -1
+        self.size = 1
+
+    def add(self, q, parent):
+        if self.size == len(self.nodes):
+            self.nodes = np.concatenate([self.nodes, np.zeros_like(self.nodes)])
+            self.parents = np.concatenate([self.parents, np.zeros_like(self.parents)])
+        self.nodes[self.size] = q
+        self.parents[self.size] = parent
+        self.size += 1
+        return self.size - 1
+
+    def nearest(self, q):
+        return int(np.argmin(np.sum((self.nodes[: self.size] - q) ** 2, axis=1)))
+
+    def branch(self, idx):
+        path = []
+        while idx != -1:
+            path.append(self.nodes[idx])
+            idx = self.parents[idx]
+        return path
+
+
+class DeskPlanner:
+    """
+    RRTConnect for the Panda arm specialised to the desk scene.
+
+    Validity checks run on a sphere model of the arm: static geometry is
+    looked up in a precomputed signed distance grid and cubes are checked as
+    oriented boxes, all vectorized over the configurations of an edge. Paths
+    are shortcut and resampled to a fixed number of waypoints, like
+    `RigidEntity.plan_path`.
+    """
+
+    def __init__(
+        self,
+        sdf,
+        base_pos,
+        lower,
+        upper,
+        step_size=0.3,
+        resolution=0.05,
+        margin=0.01,
+        shortcut_iters=50,
+        seed=None,
+    ):
+        self.sdf = sdf
+        self.spheres = PandaSpheres(base_pos)
+        self.lower = np.asarray(lower, dtype=np.float64)
+        self.upper = np.asarray(upper, dtype=np.float64)
+        self.step_size = step_size
+        self.resolution = resolution
+        self.margin = margin
+        self.shortcut_iters = shortcut_iters
+        self.rng = np.random.default_rng(seed)
+
+        self._obstacles = None
+
+    def set_obstacles(self, poses, half_extents):
+        """
+        Args:
+            poses: (M, 7) object poses as [x, y, z, qw, qx, qy, qz].
+            half_extents: (M, 3) or (3,) object half sizes.
+        """
+        poses = np.asarray(poses, dtype=np.float64)
+        half = np.broadcast_to(np.asarray(half_extents, dtype=np.float64), (len(poses), 3))
+        self._obstacles = (poses[:, :3], half, poses[:, 3:])
+
+    def _clearance(self, qs):
+        """
+        (B, S, 1 + M) clearance of every sphere to the static geometry and to
+        each obstacle.
+        """
+        centers = self.spheres.centers(qs)
+        clearance = [self.sdf(centers)[..., None]]
+        if self._obstacles is not None and len(self._obstacles[0]) > 0:
+            clearance.append(box_distance(centers, *self._obstacles))
+        clearance = np.concatenate(clearance, axis=-1)
+        return clearance - self.spheres.radii[None, :, None] - self.margin
+
+    def is_valid(self, qs, ignore=None):
+        clearance = self._clearance(qs)
+        if ignore is not None:
+            clearance[..., ignore] = np.inf
+        return np.all(clearance > 0, axis=(1, 2))
+
+    def edge_valid(self, q_from, q_to, ignore=None):
+        n = int(np.ceil(np.abs(q_to - q_from).max() / self.resolution)) + 1
+        qs = np.linspace(q_from, q_to, max(n, 2))
+        return bool(np.all(self.is_valid(qs, ignore)))
+
+    def _steer(self, q_from, q_to):
+        delta = q_to - q_from
+        dist = np.linalg.norm(delta)
+        if dist <= self.step_size:
+            return q_to, True
+        return q_from + delta * (self.step_size / dist), False
+
+    def _extend(self, tree, q_target, ignore):
+        near = tree.nearest(q_target)
+        q_new, reached = self._steer(tree.nodes[near], q_target)
+        if not self.edge_valid(tree.nodes[near], q_new, ignore):
+            return None, False
+        return tree.add(q_new, near), reached
+
+    def _connect(self, tree, q_target, ignore):
+        while True:
+            idx, reached = self._extend(tree, q_target, ignore)
+            if idx is None:
+                return None
+            if reached:
+                return idx
+
+    def _shortcut(self, path, ignore):
+        path = list(path)
+        for _ in range(self.shortcut_iters):
+            if len(path) < 3:
+                break
+            i, j = sorted(self.rng.choice(len(path), 2, replace=False))
+            if j - i < 2:
+                continue
+            if self.edge_valid(path[i], path[j], ignore):
+                path = path[: i + 1] + path[j:]
+        return np.array(path)
+
+    @staticmethod
+    def _resample(path, num_waypoints):
+        lengths = np.linalg.norm(np.diff(path, axis=0), axis=1)
+        s = np.concatenate([[0.0], np.cumsum(lengths)])
+        if s[-1] == 0:
+            return np.repeat(path[:1], num_waypoints, axis=0)
+
+        samples = np.linspace(0, s[-1], num_waypoints)
+        return np.stack(
+            [np.interp(samples, s, path[:, j]) for j in range(path.shape[1])], axis=1
+        )
+
+    def plan(self, qpos_start, qpos_goal, num_waypoints, timeout=1.0):
+        """
+        Plan a collision free arm path.
+
+        Args:
+            qpos_start: Full start qpos (arm then fingers).
+            qpos_goal: Full goal qpos (arm then fingers).
+            num_waypoints: Number of waypoints of the returned path.
+            timeout: Planning budget in seconds.
+
+        Returns:
+            numpy.ndarray: (num_waypoints, D) waypoints, fingers interpolated
+            between start and goal, or None when no path was found.
+        """
+        qpos_start = np.asarray(qpos_start, dtype=np.float64)
+        qpos_goal = np.asarray(qpos_goal, dtype=np.float64)
+        n = len(self.lower)
+        start, goal = qpos_start[:n], qpos_goal[:n]
+
+        # Objects touching the arm at either end are being manipulated
+        ends = self._clearance(np.stack([start, goal]))
+        ignore = np.flatnonzero(np.any(ends[..., 1:] <= 0, axis=(0, 1))) + 1
+        if not np.all(self.is_valid(np.stack([start, goal]), ignore)):
+            return None
+
+        if self.edge_valid(start, goal, ignore):
+            path = np.stack([start, goal])
+        else:
+            path = self._rrt_connect(start, goal, ignore, timeout)
+            if path is None:
+                return None
+            path = self._shortcut(path, ignore)
+
+        arm = self._resample(path, num_waypoints)
+        fingers = np.linspace(qpos_start[n:], qpos_goal[n:], num_waypoints)
+        return np.concatenate([arm, fingers], axis=1)
+
+    def _rrt_connect(self, start, goal, ignore, timeout):
+        trees = [_Tree(start), _Tree(goal)]
+        start_tree = trees[0]
+        deadline = time.perf_counter() + timeout
+
+        while time.perf_counter() < deadline:
+            q_rand = self.rng.uniform(self.lower, self.upper)
+            a, b = trees
+            idx, _ = self._extend(a, q_rand, ignore)
+            if idx is not None:
+                other = self._connect(b, a.nodes[idx], ignore)
+                if other is not None:
+                    # Both branches end on the same configuration
+                    path = a.branch(idx)[::-1] + b.branch(other)[1:]
+                    if a is not start_tree:
+                        path = path[::-1]
+                    return np.array(path)
+            trees.reverse()
+
+        return None
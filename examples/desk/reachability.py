@@ -0,0 +1,201 @@
+import json
+import os
+import sys
+
+import numpy as np
+
+from .config import (
+    REACH_MAP_ORIGIN,
+    REACH_MAP_SHAPE,
+    REACH_MAP_VOXEL,
+    REACH_MAP_PATH,
+    REACH_POS_TOL,
+    REACH_ROT_TOL,
+)
+
+
+class ReachabilityMap:
+    """
+    Voxel map of the hand positions the Panda reaches with the fixed downward
+    grasp orientation used by `Scene.ik`.
+
+    Every voxel stores whether its center is reachable, an IK solution to
+    warm start from, and the index of the nearest reachable voxel. All three
+    are plain .npy files, loaded memory-mapped so lookups are O(1) and the
+    map is shared between sessions by the page cache.
+    """
+
+    def __init__(self, reachable, seeds, snap, origin, voxel_size):
+        self.reachable = reachable
+        self.seeds = seeds
+        self.snap_idx = snap
+        self.origin = np.asarray(origin, dtype=np.float64)
+        self.voxel_size = float(voxel_size)
+        self.shape = np.array(reachable.shape)
+
+    @classmethod
+    def load(cls, path=REACH_MAP_PATH):
+        with open(os.path.join(path, "meta.json"), "r") as f:
+            meta = json.load(f)
+
+        return cls(
+            reachable=np.load(os.path.join(path, "reachable.npy"), mmap_mode="r"),
+            seeds=np.load(os.path.join(path, "seeds.npy"), mmap_mode="r"),
+            snap=np.load(os.path.join(path, "snap.npy"), mmap_mode="r"),
+            origin=meta["origin"],
+            voxel_size=meta["voxel_size"],
+        )
+
+    def save(self, path=REACH_MAP_PATH):
+        os.makedirs(path, exist_ok=True)
+        np.save(os.path.join(path, "reachable.npy"), np.asarray(self.reachable))
+        np.save(os.path.join(path, "seeds.npy"), np.asarray(self.seeds))
+        np.save(os.path.join(path, "snap.npy"), np.asarray(self.snap_idx))
+
+        with open(os.path.join(path, "meta.json"), "w") as f:
+            json.dump(
+                {
+                    "origin": self.origin.tolist(),
+                    "voxel_size": self.voxel_size,
+                    "shape": self.shape.tolist(),
+                },
+                f,
+            )
+
+    def voxel(self, pos):
+        """
+        Voxel index of a position, None outside the mapped volume.
+        """
+        idx = np.floor((np.asarray(pos) - self.origin) / self.voxel_size).astype(int)
+        if np.any(idx < 0) or np.any(idx >= self.shape):
+            return None
+        return tuple(idx)
+
+    def nearest_voxel(self, pos):
+        """
+        Voxel index of a position, clamped onto the grid.
+        """
+        idx = np.floor((np.asarray(pos) - self.origin) / self.voxel_size).astype(int)
+        return tuple(np.clip(idx, 0, self.shape - 1))
+
+    def center(self, idx):
+        return self.origin + (np.asarray(idx) + 0.5) * self.voxel_size
+
+    def is_reachable(self, pos):
+        idx = self.voxel(pos)
+        return idx is not None and bool(self.reachable[idx])
+
+    def seed(self, pos):
+        idx = self.voxel(pos)
+        if idx is None or not self.reachable[idx]:
+            return None
+        return np.array(self.seeds[idx])
+
+    def snap(self, pos, max_distance):
+        """
+        Move a position onto the nearest reachable voxel.
+
+        Args:
+            pos: Hand target in sim units.
+            max_distance: Largest correction allowed, in sim units.
+
+        Returns:
+            tuple: (position, IK seed). The position is returned unchanged
+            when it is already reachable and is None when the nearest
+            reachable voxel is further than max_distance. Positions outside
+            the map are only accepted when snapped within max_distance.
+        """
+        pos = np.asarray(pos, dtype=np.float64)
+        idx = self.voxel(pos)
+        if idx is not None and self.reachable[idx]:
+            return pos, np.array(self.seeds[idx])
+
+        nearest = tuple(self.snap_idx[self.nearest_voxel(pos)])
+        if nearest[0] < 0:
+            return None, None
+
+        snapped = self.center(nearest)
+        if np.linalg.norm(snapped - pos) > max_distance:
+            return None, None
+        return snapped, np.array(self.seeds[nearest])
+
+    @classmethod
+    def build(
+        cls,
+        scene,
+        origin=REACH_MAP_ORIGIN,
+        shape=REACH_MAP_SHAPE,
+        voxel_size=REACH_MAP_VOXEL,
+    ):
+        """
+        Solve IK for every voxel center of the desk workspace.
+
+        Voxels are swept in order and each solve is seeded with the last
+        successful one, so neighbouring seeds stay on the same IK branch.
+        """
+        origin = np.asarray(origin, dtype=np.float64)
+        reachable = np.zeros(shape, dtype=bool)
+        seeds = np.zeros((*shape, scene.robot.n_dofs), dtype=np.float32)
+
+        init_qpos = np.array([*scene.init_arm_dofs, *scene.init_finger_dofs])
+        last_qpos = init_qpos
+        for idx in np.ndindex(*shape):
+            if idx[2] == 0:
+                last_qpos = init_qpos
+
+            pos = origin + (np.array(idx) + 0.5) * voxel_size
+            qpos, error = scene.robot.inverse_kinematics(
+                link=scene.end_effector,
+                pos=pos,
+                quat=np.array([0, 1, 0, 0]),
+                init_qpos=last_qpos,
+                return_error=True,
+            )
+            error = error.cpu().numpy()
+
+            if (
+                np.linalg.norm(error[:3]) < REACH_POS_TOL
+                and np.linalg.norm(error[3:]) < REACH_ROT_TOL
+            ):
+                qpos = qpos.cpu().numpy()
+                reachable[idx] = True
+                seeds[idx] = qpos
+                last_qpos = qpos
+
+        return cls(
+            reachable=reachable,
+            seeds=seeds,
+            snap=cls._nearest_reachable(reachable),
+            origin=origin,
+            voxel_size=voxel_size,
+        )
+
+    @staticmethod
+    def _nearest_reachable(reachable, chunk=128):
+        shape = reachable.shape
+        coords = np.indices(shape).reshape(3, -1).T.astype(np.float32)
+        targets = coords[reachable.reshape(-1)]
+
+        snap = np.full((coords.shape[0], 3), -1, dtype=np.int32)
+        if len(targets) == 0:
+            return snap.reshape(*shape, 3)
+
+        for start in range(0, len(coords), chunk):
+            block = coords[start : start + chunk]
+            dist = ((block[:, None, :] - targets[None, :, :]) ** 2).sum(-1)
+            snap[start : start + chunk] = targets[dist.argmin(axis=1)]
+
+        return snap.reshape(*shape, 3)
+
+
+if __name__ == "__main__":
+    import genesis as gs
+
+    from .scene import Scene
+
+    gs.init()
+    path = sys.argv[1] if len(sys.argv) > 1 else REACH_MAP_PATH
+    reach_map = ReachabilityMap.build(Scene(480))
+    reach_map.save(path)
+    print(f"Reachability map: {int(reach_map.reachable.sum())} reachable voxels")
+    print(f"Saved to {path}")
@@ -1,18 +1,99 @@
 import genesis as gs
 import numpy as np
+import torch
 
+from portal import ObjectRegistry
 from .config import (
     KP,
     KV,
     FORCE_RANGE,
+    ARM_VEL_LIMITS,
+    ARM_ACC_LIMITS,
+    TRAJECTORY_SPEED_SCALE,
+    SETTLE_POS_TOL,
+    SETTLE_VEL_TOL,
+    FINGER_POS_TOL,
+    GRASP_FORCE_THRESHOLD,
+    SETTLE_MIN_TICKS,
+    SETTLE_MAX_TICKS,
+    FINGER_OPEN_POS,
+    FINGER_CLOSED_POS,
     INIT_ARM_DOFS,
     INIT_FINGER_DOFS,
     ARM_JOINT_NAMES,
     FINGER_JOINT_NAMES,
+    FINGER_LINK_NAMES,
     COLORS,
     CAMERA_CONFIGS,
     OBJECT_SIZES,
+    ROBOT_POS,
+    TABLE_POS,
+    TABLE_SIZE,
+    SDF_ORIGIN,
+    SDF_SHAPE,
+    SDF_VOXEL,
+    PLANNER_TIMEOUT,
 )
+from .collision import StaticSDF
+from .planner import DeskPlanner
+from .trajectory import retime, to_numpy
+
+
+class SettleMonitor:
+    """
+    Decides when a held pose has converged so the next path segment can start.
+
+    Each update reads arm/finger positions, velocities and finger contact
+    forces in one transfer. The hold is over once the arm sits on its target
+    and has stopped, and the fingers have opened, fully closed or closed on an
+    object. SETTLE_MAX_TICKS caps the wait.
+    """
+
+    def __init__(self, scene):
+        self.scene = scene
+        self.active = False
+        self.ticks = 0
+        self.arm_goal = None
+        self.close = False
+
+    def start(self, qpos_goal, close):
+        qpos_goal = qpos_goal.cpu().numpy() if hasattr(qpos_goal, "cpu") else qpos_goal
+        self.arm_goal = np.asarray(qpos_goal[:-2], dtype=np.float64)
+        self.close = close
+        self.ticks = 0
+        self.active = True
+
+    def reset(self):
+        """
+        Stop tracking the current hold, e.g. when its plan is aborted.
+        """
+        self.active = False
+        self.ticks = 0
+
+    def update(self):
+        self.ticks += 1
+        if self.ticks < SETTLE_MIN_TICKS:
+            return False
+
+        if self.ticks >= SETTLE_MAX_TICKS or self._converged():
+            self.active = False
+            return True
+        return False
+
+    def _converged(self):
+        n_arm = len(self.arm_goal)
+        pos, vel, force = self.scene.dofs_state()
+
+        if np.abs(pos[:n_arm] - self.arm_goal).max() > SETTLE_POS_TOL:
+            return False
+        if np.abs(vel).max() > SETTLE_VEL_TOL:
+            return False
+
+        finger_pos = pos[n_arm:]
+        if self.close:
+            closed = np.all(finger_pos - FINGER_CLOSED_POS < FINGER_POS_TOL)
+            return closed or np.all(force > GRASP_FORCE_THRESHOLD)
+        return np.all(self.scene.finger_open_pos - finger_pos < FINGER_POS_TOL)
 
 
 class Scene:
@@ -30,7 +111,6 @@ class Scene:
             {"green-cube": [0.7, 0.4, 0]},
             {"purple-cube": [0.7, 0.7, 0]},
         ]
-        self.cubes = []
 
         self._scene = gs.Scene(
             vis_options=gs.options.VisOptions(
@@ -46,6 +126,7 @@ class Scene:
             show_viewer=False,
             show_FPS=False,
         )
+        self.registry = ObjectRegistry(self._scene)
 
         _ = self._scene.add_entity(
             gs.morphs.Plane(),
@@ -54,8 +135,8 @@ class Scene:
         # Add the table platform
         _ = self._scene.add_entity(
             gs.morphs.Box(
-                pos=(0.5, 0.5, 0),
-                size=(1, 1, 0.02),
+                pos=TABLE_POS,
+                size=TABLE_SIZE,
                 fixed=True,
                 collision=False,
             ),
@@ -69,7 +150,7 @@ class Scene:
         self.robot = self._scene.add_entity(
             gs.morphs.MJCF(
                 file="xml/franka_emika_panda/panda.xml",
-                pos=(0, 0.5, 0),
+                pos=ROBOT_POS,
                 euler=(0, 0, 0),
             ),
         )
@@ -125,6 +206,25 @@ class Scene:
 
         self.end_effector = self.robot.get_link("hand")
 
+        self.finger_links_idx = [
+            self.robot.get_link(name).idx_local for name in FINGER_LINK_NAMES
+        ]
+        self.settle_monitor = SettleMonitor(self)
+
+        lower, upper = self.robot.get_dofs_limit(self.arm_dofs_idx)
+        # FINGER_OPEN_POS is commanded past the joint limit (0.04 m), open
+        # fingers stop at the limit
+        _, finger_upper = self.robot.get_dofs_limit(self.finger_dofs_idx)
+        self.finger_open_pos = np.minimum(
+            FINGER_OPEN_POS, finger_upper.cpu().numpy()
+        )
+        self.sdf = StaticSDF.from_boxes(
+            [(TABLE_POS, TABLE_SIZE)], SDF_ORIGIN, SDF_SHAPE, SDF_VOXEL
+        )
+        self.planner = DeskPlanner(
+            self.sdf, ROBOT_POS, lower.cpu().numpy(), upper.cpu().numpy()
+        )
+
         self.robot.set_dofs_force_range(
             lower=np.array(self._force_range[0]),
             upper=np.array(self._force_range[1]),
@@ -157,6 +257,17 @@ class Scene:
         return qpos
 
     def path_to(self, qpos_start, qpos_goal, num_waypoints):
+        self.planner.set_obstacles(self.registry.poses(), np.array(OBJECT_SIZES) / 2)
+        path = self.planner.plan(
+            to_numpy([qpos_start])[0],
+            to_numpy([qpos_goal])[0],
+            num_waypoints,
+            timeout=PLANNER_TIMEOUT,
+        )
+        if path is not None:
+            return path
+
+        # Fall back to the generic planner
         path = self.robot.plan_path(
             qpos_start=qpos_start,
             qpos_goal=qpos_goal,
@@ -167,15 +278,39 @@ class Scene:
 
         return path
 
+    def retime(self, path):
+        return retime(
+            path,
+            np.array(ARM_VEL_LIMITS) * TRAJECTORY_SPEED_SCALE,
+            np.array(ARM_ACC_LIMITS) * TRAJECTORY_SPEED_SCALE,
+            self._scene.dt,
+        )
+
+    def dofs_state(self):
+        dofs_idx = self.arm_dofs_idx + self.finger_dofs_idx
+        forces = self.robot.get_links_net_contact_force()[self.finger_links_idx]
+
+        # Single device to host copy for the whole state
+        state = torch.cat(
+            [
+                self.robot.get_dofs_position(dofs_idx),
+                self.robot.get_dofs_velocity(dofs_idx),
+                torch.linalg.norm(forces, dim=-1),
+            ]
+        ).cpu().numpy()
+
+        n = len(dofs_idx)
+        return state[:n], state[n : 2 * n], state[2 * n :]
+
     def grasp(self, close):
         if close:
             self.robot.control_dofs_position(
-                [0, 0],
+                [FINGER_CLOSED_POS, FINGER_CLOSED_POS],
                 self.finger_dofs_idx,
             )
         else:
             self.robot.control_dofs_position(
-                [0.05, 0.05],
+                [FINGER_OPEN_POS, FINGER_OPEN_POS],
                 self.finger_dofs_idx,
             )
 
@@ -199,16 +334,13 @@ class Scene:
                     ),
                 )
 
-                self.cubes.append({key: obj_})
+                self.registry.add(key, obj_)
 
     def get_cubes_locations(self):
-        return_list = []
-        for obj in self.cubes:
-            obj_ = {}
-            obj_[list(obj.keys())[0]] = [
-                int(float(x) * 100)
-                for x in list(list(obj.values())[0].get_pos().cpu().numpy())
-            ]
-            obj_[list(obj.keys())[0]][2] += 3
-            return_list.append(obj_)
-        return return_list
+        # Model use 100 x 100 units, padded by 3 on the height
+        locations = self.registry.grid_positions(100)
+        locations[:, 2] += 3
+        return [
+            {name: location.tolist()}
+            for name, location in zip(self.registry.names, locations)
+        ]
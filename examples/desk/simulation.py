@@ -1,11 +1,28 @@
 import asyncio
-import aiohttp
+import os
 import numpy as np
 from fastapi import WebSocket, WebSocketDisconnect
 
+from portal.cache import ResponseCache, quantize
+from portal.dispatch import llm_dispatcher
+from portal.http import http_client
+from portal.sse import decode_response
 from portal.utils import encode_numpy_array
+from .config import (
+    REACH_MAP_PATH,
+    REACH_SNAP_DISTANCE,
+    RESPONSE_CACHE_PATH,
+    RESPONSE_CACHE_STATE_STEP,
+    RESPONSE_CACHE_TTL,
+    ROBOT_TASK_STREAM,
+    ROBOT_TASK_URL,
+)
+from .reachability import ReachabilityMap
 from .scene import Scene
 
+# Planner answers to repeated instructions, shared by every session
+response_cache = ResponseCache(ttl=RESPONSE_CACHE_TTL, path=RESPONSE_CACHE_PATH)
+
 
 class Simulation:
     def __init__(self, res) -> None:
@@ -24,6 +41,11 @@ class Simulation:
         self.finger_grasp = False
         self.macro = 0
 
+        if os.path.isdir(REACH_MAP_PATH):
+            self.reach_map = ReachabilityMap.load(REACH_MAP_PATH)
+        else:
+            self.reach_map = None
+
     async def server_processor(
         self,
         websocket: WebSocket,
@@ -34,37 +56,30 @@ class Simulation:
                     action = np.array(self.actions_queue.pop(0))
                     print("action: ", action)
 
-                    # Model use 100 x 100, Sim use 1 x 1 in term of unit
-                    target = action[0:3] / 100
-                    target[2] += 0.15  # Pad the height of the gripper
-                    print("target: ", target)
-
-                    self.prev_qpos = self.curr_qpos
-                    self.curr_qpos = self.scene.ik(self.curr_qpos, target)
-
-                    if self.macro == 0 or self.macro == 4:
-                        paths = self.scene.path_to(self.prev_qpos, self.curr_qpos, 150)
-                        for path in paths:
-                            self.path.append((path, action[6]))
-                    else:
-                        self.path.extend([(self.curr_qpos, action[6])] * 100)
-
-                    if self.macro == 6:  # AI model returned 7 actions
-                        self.macro = 0
-                        self.prev_qpos = self.curr_qpos
-                        target[2] = 0.5
-                        self.curr_qpos = self.scene.ik(self.curr_qpos, target)
-                        paths = self.scene.path_to(self.prev_qpos, self.curr_qpos, 50)
-                        for path in paths:
-                            self.path.append((path, action[6]))
-                    else:
-                        self.macro += 1
+                    if not self.plan_action(action):
+                        # The plan is aborted, stop the request still
+                        # streaming its later actions
+                        llm_dispatcher.cancel(id(websocket))
+                        await websocket.send_json(
+                            {
+                                "type": "reasoning",
+                                "message": f"Target {action[0:3].tolist()} is out of reach",
+                            }
+                        )
 
                 if len(self.path) > 0:
-                    path = self.path.pop(0)
+                    path = self.path[0]
                     self.arm_pos = path[0][:-2]
                     self.finger_grasp = False if path[1] == 1 else True
 
+                    settle = self.scene.settle_monitor
+                    if not path[2]:
+                        self.path.pop(0)
+                    elif not settle.active:
+                        settle.start(path[0], self.finger_grasp)
+                    elif settle.update():
+                        self.path.pop(0)
+
                 self.scene.robot.control_dofs_position(
                     self.arm_pos,
                     self.scene.arm_dofs_idx,
@@ -94,6 +109,66 @@ class Simulation:
         except Exception as e:
             raise Exception(f"Exception occured: {e}")
 
+    def abort_plan(self):
+        """
+        Drop the current plan: its queued actions, the moves and holds
+        already planned for it and the hold being settled. The arm stops
+        where it is, the gripper keeps its state, and the next action starts
+        a new pick and place from there.
+        """
+        self.actions_queue = []
+        self.path = []
+        self.scene.settle_monitor.reset()
+        self.macro = 0
+
+        qpos, _, _ = self.scene.dofs_state()
+        self.arm_pos = qpos[:-2]
+        self.prev_qpos = self.curr_qpos = qpos
+
+    def plan_action(self, action):
+        # Model use 100 x 100, Sim use 1 x 1 in term of unit
+        target = action[0:3] / 100
+        target[2] += 0.15  # Pad the height of the gripper
+        print("target: ", target)
+
+        # Reject or snap targets the arm cannot reach before IK and planning
+        target, seed = self.reach(target)
+        if target is None:
+            self.abort_plan()
+            return False
+
+        self.prev_qpos = self.curr_qpos
+        self.curr_qpos = self.scene.ik(
+            self.curr_qpos if seed is None else seed, target
+        )
+
+        # Path entries are (qpos, grip, hold). Planned moves are
+        # retimed to the sim dt, holds last until the robot settles
+        if self.macro == 0 or self.macro == 4:
+            paths = self.scene.path_to(self.prev_qpos, self.curr_qpos, 150)
+            for path in self.scene.retime(paths):
+                self.path.append((path, action[6], False))
+        else:
+            self.path.append((self.curr_qpos, action[6], True))
+
+        if self.macro == 6:  # AI model returned 7 actions
+            self.macro = 0
+            self.prev_qpos = self.curr_qpos
+            target[2] = 0.5
+            self.curr_qpos = self.scene.ik(self.curr_qpos, target)
+            paths = self.scene.path_to(self.prev_qpos, self.curr_qpos, 50)
+            for path in self.scene.retime(paths):
+                self.path.append((path, action[6], False))
+        else:
+            self.macro += 1
+
+        return True
+
+    def reach(self, target):
+        if self.reach_map is None:
+            return target, None
+        return self.reach_map.snap(target, REACH_SNAP_DISTANCE)
+
     def update_camera(self):
         lookat = self.scene.cam_main.lookat
 
@@ -114,7 +189,15 @@ class Simulation:
                 message = await websocket.receive_json()
 
                 if message.get("type") == "command":
-                    await self.get_model_reasoning(websocket, message)
+                    # Runs on its own, a newer command cancels it
+                    llm_dispatcher.submit(
+                        id(websocket),
+                        lambda message=message: self.get_model_reasoning(
+                            websocket, message
+                        ),
+                        # The superseded plan's queued actions go with it
+                        on_supersede=self.abort_plan,
+                    )
 
                 if message.get("type") == "zoom":
                     if message["direction"] == "in":
@@ -141,6 +224,7 @@ class Simulation:
             raise Exception(f"Exception occured: {e}")
         finally:
             # clean up actions state
+            llm_dispatcher.cancel(id(websocket))
             self.actions_queue = []
 
     async def get_model_reasoning(self, websocket, message):
@@ -148,35 +232,91 @@ class Simulation:
             "instruction": message["content"],
             "objects": self.scene.get_cubes_locations(),
         }
+        key = response_cache.key(
+            message["content"],
+            ROBOT_TASK_URL,
+            quantize(robot_task_data["objects"], RESPONSE_CACHE_STATE_STEP),
+        )
+
+        if ROBOT_TASK_STREAM:
+            return await self.stream_model_reasoning(websocket, robot_task_data, key)
+
+        cached = response_cache.get(key)
+        if cached is not None:
+            await self.queue_task_response(websocket, cached[0][1])
+            return
 
         try:
-            async with aiohttp.ClientSession() as session:
-                print(robot_task_data)
-
-                async with session.post(
-                    "http://10.200.20.109:3348/robot/task",
-                    # "https://alphaspace.menlo.ai/api",
-                    headers={"Content-Type": "application/json"},
-                    json=robot_task_data,
-                ) as response:
-                    if response.status == 200:
-                        response_data = await response.json()
-                        for action in response_data["actions"]:
-                            self.actions_queue.append(action)
-                            pass
+            print(robot_task_data)
 
-                        await websocket.send_json(
-                            {
-                                "type": "reasoning",
-                                "message": response_data["raw_output"],
-                            }
-                        )
-                    else:
-                        await websocket.send_json(
-                            {
-                                "type": "reasoning",
-                                "message": f"Fail with status {response.status}",
-                            }
-                        )
+            async with http_client.post(
+                ROBOT_TASK_URL,
+                # "https://alphaspace.menlo.ai/api",
+                headers={"Content-Type": "application/json"},
+                json=robot_task_data,
+            ) as response:
+                if response.status == 200:
+                    response_data = await response.json()
+                    response_cache.put(key, [(0.0, response_data)])
+                    await self.queue_task_response(websocket, response_data)
+                else:
+                    await websocket.send_json(
+                        {
+                            "type": "reasoning",
+                            "message": f"Fail with status {response.status}",
+                        }
+                    )
+        except Exception as e:
+            raise Exception(f"Exception occured: {e}")
+
+    async def queue_task_response(self, websocket, response_data):
+        for action in response_data["actions"]:
+            self.actions_queue.append(action)
+
+        await websocket.send_json(
+            {
+                "type": "reasoning",
+                "message": response_data["raw_output"],
+            }
+        )
+
+    async def stream_model_reasoning(self, websocket, robot_task_data, key):
+        """
+        Streamed variant of the robot task request: reasoning is forwarded
+        and actions are queued event by event, while the planner generates.
+        Cached answers are replayed at the pace they were streamed.
+        """
+        try:
+            async for event in response_cache.stream(
+                key,
+                lambda: self.task_events(robot_task_data),
+                cacheable=lambda events: not any("error" in e for e in events),
+            ):
+                if event.get("error"):
+                    await websocket.send_json(
+                        {"type": "reasoning", "message": event["error"]}
+                    )
+                if event.get("reasoning"):
+                    await websocket.send_json(
+                        {"type": "reasoning", "message": event["reasoning"]}
+                    )
+                if event.get("action") is not None:
+                    self.actions_queue.append(event["action"])
         except Exception as e:
             raise Exception(f"Exception occured: {e}")
+
+    async def task_events(self, robot_task_data):
+        async with http_client.post(
+            ROBOT_TASK_URL,
+            headers={
+                "Content-Type": "application/json",
+                "Accept": "application/x-ndjson, text/event-stream",
+            },
+            json={**robot_task_data, "stream": True},
+        ) as response:
+            if response.status != 200:
+                yield {"error": f"Fail with status {response.status}"}
+                return
+
+            async for event in decode_response(response):
+                yield event
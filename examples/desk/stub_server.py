@@ -0,0 +1,75 @@
+"""
+Local stand-in for the robot task planner, for tests and offline runs.
+
+    python -m examples.desk.stub_server --port 3348 --token-rate 40
+    ROBOT_TASK_URL=http://localhost:3348/robot/task ROBOT_TASK_STREAM=1 python example.py
+
+POST /robot/task takes {"instruction", "objects"} and plans picking the
+first object and stacking it on the second. Without "stream" it answers
+with one JSON {"actions", "raw_output"} once the whole answer would have
+been generated. With "stream": true it sends one event per line, as SSE
+`data:` lines when the request accepts text/event-stream and as NDJSON
+otherwise:
+
+    {"reasoning": "<text delta>"}
+    {"action": [x, y, z, roll, pitch, yaw, grip]}
+    {"raw_output": "<whole answer>"}
+
+Tokens are released at --token-rate per second after --first-token seconds,
+an action costs --action-tokens tokens, like the JSON a model would write.
+The app is `portal.mock` with this planner, so it also mocks the LLM, TTS
+and STT endpoints, and takes its --jitter, --failure-rate and --seed.
+"""
+
+import argparse
+
+import uvicorn
+
+from portal.mock import add_arguments, create_app, latency_from
+
+LIFT = 10  # Height above the objects of the moves between them
+
+
+def plan(objects):
+    """
+    Reasoning and the 7 actions of a pick and place, in model units.
+    """
+    names = [name for entry in objects for name in entry]
+    locations = [location for entry in objects for location in entry.values()]
+    if len(locations) < 2:
+        return "There is nothing to stack.", []
+
+    (px, py, pz), (qx, qy, qz) = locations[0], locations[1]
+    reasoning = (
+        f"The {names[0]} is at {locations[0]} and the {names[1]} at "
+        f"{locations[1]}. I will pick up the {names[0]} and stack it on "
+        f"top of the {names[1]}."
+    )
+    actions = [
+        [px, py, pz + LIFT, 0, 0, 0, 1],
+        [px, py, pz, 0, 0, 0, 1],
+        [px, py, pz, 0, 0, 0, 0],
+        [px, py, pz + LIFT, 0, 0, 0, 0],
+        [qx, qy, qz + LIFT, 0, 0, 0, 0],
+        [qx, qy, qz + LIFT // 2, 0, 0, 0, 0],
+        [qx, qy, qz + LIFT // 2, 0, 0, 0, 1],
+    ]
+    return reasoning, actions
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    add_arguments(parser)
+    parser.add_argument("--action-tokens", type=int, default=20)
+    args = parser.parse_args()
+
+    app = create_app(
+        latency_from(args),
+        planner=lambda body: plan(body.get("objects", [])),
+        action_tokens=args.action_tokens,
+    )
+    uvicorn.run(app, host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
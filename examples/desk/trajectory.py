@@ -0,0 +1,108 @@
+import numpy as np
+
+
+def to_numpy(path):
+    """
+    Stack a planner path (list of tensors or arrays) into an (N, D) float array.
+    """
+    return np.stack(
+        [p.cpu().numpy() if hasattr(p, "cpu") else np.asarray(p) for p in path]
+    ).astype(np.float64)
+
+
+def _segment_profiles(lengths, v_start, v_end, v_max, a_max):
+    """
+    Trapezoidal (or triangular) speed profile for every path segment.
+
+    Returns the accel/cruise durations, the cruise speed and the distance
+    covered while accelerating, all as arrays over the segments.
+    """
+    v_peak = np.sqrt((2 * a_max * lengths + v_start**2 + v_end**2) / 2)
+    v_cruise = np.minimum(v_peak, v_max)
+
+    t_acc = (v_cruise - v_start) / a_max
+    t_dec = (v_cruise - v_end) / a_max
+    d_acc = (v_cruise**2 - v_start**2) / (2 * a_max)
+    d_dec = (v_cruise**2 - v_end**2) / (2 * a_max)
+    t_cruise = np.maximum(lengths - d_acc - d_dec, 0) / v_cruise
+
+    return t_acc, t_cruise, t_dec, v_cruise, d_acc
+
+
+def retime(path, vel_limits, acc_limits, dt):
+    """
+    Time-optimal retiming of a piecewise-linear joint path.
+
+    The path is parameterized by joint-space arc length. Every segment gets a
+    path speed and acceleration bound from the per-joint limits, a
+    forward/backward pass makes the waypoint speeds consistent with those
+    bounds (starting and ending at rest), and the result is resampled at `dt`.
+
+    Args:
+        path: Planner waypoints, (N, D). Limits apply to the first
+            len(vel_limits) columns; the remaining ones (fingers) are
+            interpolated along.
+        vel_limits: Per-joint velocity limits in rad/s.
+        acc_limits: Per-joint acceleration limits in rad/s^2.
+        dt: Output sample period in seconds.
+
+    Returns:
+        numpy.ndarray: (M, D) waypoints spaced `dt` apart, ending on path[-1].
+    """
+    q = to_numpy(path)
+    n = len(vel_limits)
+    vel_limits = np.asarray(vel_limits, dtype=np.float64)
+    acc_limits = np.asarray(acc_limits, dtype=np.float64)
+
+    # Drop repeated waypoints, they carry no motion
+    delta = np.diff(q, axis=0)
+    lengths = np.linalg.norm(delta[:, :n], axis=1)
+    moving = lengths > 1e-9
+    q = np.concatenate([q[:1], q[1:][moving]])
+    delta = delta[moving]
+    lengths = lengths[moving]
+    if len(lengths) == 0:
+        return q[-1:]
+
+    direction = np.abs(delta[:, :n]) / lengths[:, None]
+    direction = np.maximum(direction, 1e-12)
+    v_max = np.min(vel_limits / direction, axis=1)
+    a_max = np.min(acc_limits / direction, axis=1)
+
+    # Waypoint speeds: capped by both neighbouring segments, at rest on the ends
+    v = np.zeros(len(q))
+    v[1:-1] = np.minimum(v_max[:-1], v_max[1:])
+    for i in range(len(lengths)):
+        v[i + 1] = min(v[i + 1], np.sqrt(v[i] ** 2 + 2 * a_max[i] * lengths[i]))
+    for i in reversed(range(len(lengths))):
+        v[i] = min(v[i], np.sqrt(v[i + 1] ** 2 + 2 * a_max[i] * lengths[i]))
+
+    t_acc, t_cruise, t_dec, v_cruise, d_acc = _segment_profiles(
+        lengths, v[:-1], v[1:], v_max, a_max
+    )
+    durations = t_acc + t_cruise + t_dec
+    starts = np.concatenate([[0.0], np.cumsum(durations)])
+
+    times = np.arange(0.0, starts[-1], dt)
+    seg = np.clip(np.searchsorted(starts, times, side="right") - 1, 0, len(lengths) - 1)
+    tau = times - starts[seg]
+
+    v0 = v[:-1][seg]
+    a = a_max[seg]
+    vc = v_cruise[seg]
+    t1 = t_acc[seg]
+    t2 = t_cruise[seg]
+    tau3 = np.maximum(tau - t1 - t2, 0)
+    s = np.where(
+        tau < t1,
+        v0 * tau + 0.5 * a * tau**2,
+        np.where(
+            tau < t1 + t2,
+            d_acc[seg] + vc * (tau - t1),
+            d_acc[seg] + vc * t2 + vc * tau3 - 0.5 * a * tau3**2,
+        ),
+    )
+    s = np.clip(s / lengths[seg], 0, 1)
+
+    samples = q[seg] + delta[seg] * s[:, None]
+    return np.concatenate([samples, q[-1:]])
@@ -1,5 +1,28 @@
-from .server import Server
+import importlib
 
-__all__ = [
-    Server,
-]
+# Imported on first use: server needs genesis and objects needs torch, the
+# services that only use the HTTP, cache or dispatch helpers need neither
+_exports = {
+    "Server": ".server",
+    "ObjectRegistry": ".objects",
+    "HTTPClient": ".http",
+    "http_client": ".http",
+    "ResponseCache": ".cache",
+    "SSEDecoder": ".sse",
+    "LLMDispatcher": ".dispatch",
+    "llm_dispatcher": ".dispatch",
+}
+
+__all__ = list(_exports)
+
+
+def __getattr__(name):
+    if name not in _exports:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(_exports[name], __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(list(globals()) + __all__)
@@ -0,0 +1,189 @@
+import asyncio
+import hashlib
+import json
+import os
+import re
+import time
+from collections import OrderedDict
+
+
+def normalize_instruction(instruction):
+    """
+    Lowercase, single spaces, no trailing punctuation.
+    """
+    instruction = re.sub(r"\s+", " ", instruction.lower()).strip()
+    return instruction.rstrip(".!?,;: ")
+
+
+def quantize(values, step):
+    """
+    Snap numbers to a grid of `step`, so close scene states share a key.
+    """
+    if hasattr(values, "tolist"):
+        values = values.tolist()
+    if isinstance(values, dict):
+        return {name: quantize(value, step) for name, value in values.items()}
+    if isinstance(values, (list, tuple)):
+        return [quantize(value, step) for value in values]
+    return int(round(float(values) / step))
+
+
+class ResponseCache:
+    """
+    Recorded LLM and planner answers, keyed by what they depend on.
+
+    The key is the normalized instruction, a hash of the prompt around it
+    (system prompt, history, endpoint) and the quantized scene state. An
+    answer is stored as its chunks with their arrival times and replayed
+    with the same gaps between chunks, only the wait for the first chunk is
+    skipped, so the UI streams a cached answer like a generated one.
+
+    Entries expire after `ttl` seconds and the least recently used ones are
+    evicted beyond `max_entries`. With `path`, the cache is loaded from and
+    saved to a JSON file, so it survives restarts. Saves are batched: the
+    file is written in a worker thread `save_delay` seconds after the first
+    new answer, and `close` writes what is still pending on shutdown.
+
+    Args:
+        max_entries (int): Answers kept.
+        ttl (float): Seconds an answer stays valid.
+        path (str): Optional JSON file to persist the cache to.
+        speed (float): Replay speed, relative to the recorded pace.
+        save_delay (float): Seconds new answers wait to be saved together.
+    """
+
+    def __init__(
+        self, max_entries=256, ttl=24 * 3600.0, path=None, speed=1.0, save_delay=5.0
+    ):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.path = path
+        self.speed = speed
+        self.save_delay = save_delay
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._dirty = False
+        self._timer = None
+        self._save_lock = asyncio.Lock()
+
+        if path and os.path.isfile(path):
+            with open(path, "r") as f:
+                for key, entry in json.load(f).items():
+                    self._entries[key] = entry
+            self._evict()
+
+    @staticmethod
+    def key(instruction, prompt="", state=None):
+        prompt_hash = hashlib.sha256(prompt.encode("utf-8")).hexdigest()[:16]
+        state = json.dumps(state, sort_keys=True, separators=(",", ":"))
+        return f"{normalize_instruction(instruction)}|{prompt_hash}|{state}"
+
+    def _evict(self):
+        now = time.time()
+        for key in [k for k, e in self._entries.items() if now - e["time"] > self.ttl]:
+            del self._entries[key]
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def _write(self, entries):
+        tmp = self.path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(entries, f)
+        os.replace(tmp, self.path)
+
+    def _save(self):
+        if not self.path:
+            return
+        self._dirty = True
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            # No event loop to block, write right away
+            self._dirty = False
+            self._write(dict(self._entries))
+            return
+        if self._timer is None:
+            self._timer = loop.call_later(self.save_delay, self._save_now)
+
+    def _save_now(self):
+        self._timer = None
+        asyncio.ensure_future(self.flush())
+
+    async def flush(self):
+        """
+        Write pending answers to `path` now, off the event loop.
+        """
+        async with self._save_lock:
+            if not self._dirty:
+                return
+            self._dirty = False
+            # Entries are replaced, never changed, a shallow copy is a snapshot
+            await asyncio.to_thread(self._write, dict(self._entries))
+
+    async def close(self):
+        """
+        Save what is pending, call on shutdown.
+        """
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        await self.flush()
+
+    def get(self, key):
+        """
+        [(seconds since the first chunk, chunk), ...] of a valid answer.
+        """
+        entry = self._entries.get(key)
+        if entry is None or time.time() - entry["time"] > self.ttl:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry["chunks"]
+
+    def put(self, key, chunks):
+        self._entries[key] = {"time": time.time(), "chunks": chunks}
+        self._entries.move_to_end(key)
+        self._evict()
+        self._save()
+
+    async def replay(self, chunks):
+        previous = None
+        for offset, chunk in chunks:
+            if previous is not None and offset > previous:
+                await asyncio.sleep((offset - previous) / self.speed)
+            previous = offset
+            yield chunk
+
+    async def stream(self, key, generate, cacheable=None, accepted=None):
+        """
+        Chunks of the answer for `key`, replayed when cached and otherwise
+        taken from `generate()` and recorded.
+
+        Args:
+            key (str): From `key`.
+            generate: Callable returning an async iterator of JSON chunks.
+            cacheable: Optional check of the recorded chunks, an answer is
+                only stored when it passes. Empty answers never are.
+            accepted: Optional future resolved with whether the answer is
+                served at all, awaited before it is stored.
+        """
+        chunks = self.get(key)
+        if chunks is not None:
+            async for chunk in self.replay(chunks):
+                yield chunk
+            return
+
+        chunks = []
+        start = None
+        async for chunk in generate():
+            now = time.monotonic()
+            if start is None:
+                start = now
+            chunks.append((now - start, chunk))
+            yield chunk
+
+        if chunks and (cacheable is None or cacheable([c for _, c in chunks])):
+            if accepted is None or await accepted:
+                self.put(key, chunks)
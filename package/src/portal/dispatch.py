@@ -0,0 +1,133 @@
+import asyncio
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class LLMDispatcher:
+    """
+    Runs the LLM requests of every session under one concurrency limit.
+
+    A session's command runs as a task of its own, so the session's handler
+    goes back to reading control messages at once. Only the latest command
+    of a session matters: submitting one cancels the request the session
+    still has waiting or in flight, which closes its HTTP stream so the
+    answer is not generated for nothing. At most `max_concurrent` requests
+    run at a time across sessions, the others wait in line.
+
+    Args:
+        max_concurrent (int): Requests running at once, over all sessions.
+    """
+
+    def __init__(self, max_concurrent=4):
+        self.max_concurrent = max_concurrent
+        self._semaphore = None
+        self._tasks = {}  # Session: its latest task
+
+        self.waiting = 0
+        self.running = 0
+        self.submitted = 0
+        self.completed = 0
+        self.superseded = 0
+        self.cancelled = 0
+        self.failed = 0
+        self.last_wait = 0.0
+        self.max_wait = 0.0
+        self.total_wait = 0.0
+        self.started = 0
+
+    def configure(self, max_concurrent):
+        """
+        Change the limit, for the requests submitted from now on.
+        """
+        self.max_concurrent = max_concurrent
+        self._semaphore = None
+
+    def submit(self, session, run, on_supersede=None):
+        """
+        Run `run()`, a coroutine function, as the latest request of
+        `session`, superseding the one before.
+
+        Args:
+            on_supersede: Optional callable, called when a request of the
+                session was still waiting or running and is cancelled, to
+                drop what it already queued (e.g. robot actions).
+
+        Returns:
+            asyncio.Task: The request.
+        """
+        previous = self._tasks.get(session)
+        if previous is not None and not previous.done():
+            previous.cancel()
+            self.superseded += 1
+            if on_supersede is not None:
+                on_supersede()
+
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrent)
+        task = asyncio.create_task(self._run(self._semaphore, run))
+        task.add_done_callback(lambda t: self._done(session, t))
+        self._tasks[session] = task
+        self.submitted += 1
+        return task
+
+    def cancel(self, session):
+        """
+        Cancel the request of `session`, when it is closed.
+        """
+        task = self._tasks.pop(session, None)
+        if task is not None and not task.done():
+            task.cancel()
+
+    async def _run(self, semaphore, run):
+        queued = time.monotonic()
+        self.waiting += 1
+        try:
+            await semaphore.acquire()
+        finally:
+            self.waiting -= 1
+
+        wait = time.monotonic() - queued
+        self.last_wait = wait
+        self.max_wait = max(self.max_wait, wait)
+        self.total_wait += wait
+        self.started += 1
+        self.running += 1
+        try:
+            return await run()
+        finally:
+            self.running -= 1
+            semaphore.release()
+
+    def _done(self, session, task):
+        if self._tasks.get(session) is task:
+            del self._tasks[session]
+        if task.cancelled():
+            self.cancelled += 1
+        elif task.exception() is not None:
+            self.failed += 1
+            logger.error(
+                f"LLM request of session {session} failed: {task.exception()!r}")
+        else:
+            self.completed += 1
+
+    def metrics(self):
+        return {
+            "max_concurrent": self.max_concurrent,
+            "queue_depth": self.waiting,
+            "running": self.running,
+            "sessions": len(self._tasks),
+            "submitted": self.submitted,
+            "completed": self.completed,
+            "superseded": self.superseded,
+            "cancelled": self.cancelled,
+            "failed": self.failed,
+            "last_wait_seconds": self.last_wait,
+            "max_wait_seconds": self.max_wait,
+            "mean_wait_seconds": self.total_wait / max(self.started, 1),
+        }
+
+
+# Shared by every session of the process
+llm_dispatcher = LLMDispatcher()
@@ -0,0 +1,87 @@
+import asyncio
+from urllib.parse import urlsplit
+
+import aiohttp
+
+
+class HTTPClient:
+    """
+    Process-wide aiohttp sessions, one per origin (scheme, host, port).
+
+    Every origin keeps its own keep-alive connection pool and DNS cache, so
+    repeated LLM, TTS, STT and planner calls reuse open TCP/TLS connections
+    instead of handshaking per request. Sessions are created lazily on the
+    running event loop and are closed by `close`, call it on app shutdown.
+
+    Args:
+        limit (int): Connections per origin, open at the same time.
+        keepalive_timeout (float): Seconds an idle connection stays open.
+        dns_ttl (int): Seconds a resolved host is cached.
+        total_timeout (float): Default limit of a whole request, in seconds.
+        connect_timeout (float): Default limit to get a connection.
+    """
+
+    def __init__(
+        self,
+        limit=10,
+        keepalive_timeout=30.0,
+        dns_ttl=300,
+        total_timeout=300.0,
+        connect_timeout=10.0,
+    ):
+        self._sessions = {}
+        self.configure(
+            limit=limit,
+            keepalive_timeout=keepalive_timeout,
+            dns_ttl=dns_ttl,
+            total_timeout=total_timeout,
+            connect_timeout=connect_timeout,
+        )
+
+    def configure(self, **options):
+        """
+        Change the settings of the sessions opened from now on.
+        """
+        for name, value in options.items():
+            setattr(self, name, value)
+
+    def session(self, url):
+        """
+        The shared session of the origin of `url`.
+        """
+        parts = urlsplit(url)
+        origin = (parts.scheme, parts.hostname, parts.port)
+        loop = asyncio.get_running_loop()
+
+        session, session_loop = self._sessions.get(origin, (None, None))
+        if session is None or session.closed or session_loop is not loop:
+            connector = aiohttp.TCPConnector(
+                limit=self.limit,
+                limit_per_host=self.limit,
+                keepalive_timeout=self.keepalive_timeout,
+                use_dns_cache=True,
+                ttl_dns_cache=self.dns_ttl,
+            )
+            session = aiohttp.ClientSession(
+                connector=connector,
+                timeout=aiohttp.ClientTimeout(
+                    total=self.total_timeout, connect=self.connect_timeout
+                ),
+            )
+            self._sessions[origin] = (session, loop)
+        return session
+
+    def get(self, url, **kwargs):
+        return self.session(url).get(url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.session(url).post(url, **kwargs)
+
+    async def close(self):
+        sessions, self._sessions = self._sessions, {}
+        for session, _ in sessions.values():
+            if not session.closed:
+                await session.close()
+
+
+http_client = HTTPClient()
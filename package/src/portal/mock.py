@@ -0,0 +1,337 @@
+"""
+Local stand-ins for the LLM, planner, TTS and STT services, for offline runs
+and reproducible latency benchmarks.
+
+    python -m portal.mock --port 3348 --token-rate 40 --jitter 0.2 --failure-rate 0.05 --seed 0
+
+    OPENAI_BASE_URL=http://localhost:3348/v1/chat/completions
+    TTS_URL=http://localhost:3348/v1/audio/speech
+    STT_URL=http://localhost:3348/v1/audio/transcriptions
+
+Endpoints:
+
+    POST /v1/chat/completions   OpenAI chat completions, SSE with "stream"
+    POST /robot/task            Planner answer, NDJSON or SSE with "stream"
+    POST /v1/audio/speech       Silent WAV as long as the text would be spoken
+    POST /v1/audio/transcriptions
+                                Scripted transcript, NDJSON partials with
+                                "stream"
+
+Answers are scripted: the chat reply is the first of `replies` whose
+pattern is found in the last user message, the transcript is `transcript`
+and the plan comes from `planner`. Timing follows a `Latency`: a wait before
+the first token, then tokens at a steady rate, each wait scaled by a random
+jitter, and requests fail with a 503 at `failure_rate`.
+
+The streamed transcript grows one segment per partial, like the
+hypotheses of a streaming STT, and the final text only follows after
+`final_delay`, the time the STT takes to decide the speaker is done.
+"""
+
+import argparse
+import asyncio
+import io
+import json
+import random
+import re
+import time
+import wave
+
+from fastapi import FastAPI, File, Form, Request, UploadFile
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+
+DEFAULT_REPLIES = [
+    (
+        "where|take me|go to|find",
+        'Sure, follow me. {"actions": [{"type": "rotate_left", "angle": 45}, '
+        '{"type": "move_forward", "distance": 2}, '
+        '{"type": "rotate_right", "angle": 30}, '
+        '{"type": "move_forward", "distance": 1}]}',
+    ),
+    ("bye|thank", "You are welcome, enjoy your day! <GOODBYE>"),
+    ("", "Sorry, I do not know about that. <UNKNOWN>"),
+]
+
+DEFAULT_TRANSCRIPT = ["Excuse me,", "where is the", "supermarket?"]
+
+
+class Latency:
+    """
+    Timing and failures of a mocked service.
+
+    Args:
+        first_token (float): Seconds before the first token.
+        token_rate (float): Tokens per second after it.
+        jitter (float): Every wait is scaled by a uniform factor in
+            [1 - jitter, 1 + jitter].
+        failure_rate (float): Share of requests answered with a 503.
+        seed (int): Seed of the jitter and failures, for reproducible runs.
+    """
+
+    def __init__(self, first_token=0.3, token_rate=40.0, jitter=0.0, failure_rate=0.0, seed=None):
+        self.first_token = first_token
+        self.token_rate = token_rate
+        self.jitter = jitter
+        self.failure_rate = failure_rate
+        self.random = random.Random(seed)
+
+    def scale(self, seconds):
+        if self.jitter:
+            seconds *= self.random.uniform(1 - self.jitter, 1 + self.jitter)
+        return max(seconds, 0.0)
+
+    async def first(self):
+        await asyncio.sleep(self.scale(self.first_token))
+
+    async def tokens(self, count=1):
+        await asyncio.sleep(self.scale(count / self.token_rate))
+
+    def fail(self):
+        return self.random.random() < self.failure_rate
+
+
+def unavailable():
+    return JSONResponse(
+        status_code=503, content={"error": {"message": "Mock failure", "type": "server_error"}}
+    )
+
+
+def tokenize(text):
+    """
+    Words with their trailing space, a stand-in for model tokens.
+    """
+    return re.findall(r"\S+\s*", text)
+
+
+def silent_wav(seconds, rate=24000):
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as f:
+        f.setnchannels(1)
+        f.setsampwidth(2)
+        f.setframerate(rate)
+        f.writeframes(b"\0\0" * int(seconds * rate))
+    return buffer.getvalue()
+
+
+def wav_seconds(data):
+    try:
+        with wave.open(io.BytesIO(data), "rb") as f:
+            return f.getnframes() / f.getframerate()
+    except (wave.Error, EOFError):
+        return 0.0
+
+
+def encode_events(events, sse):
+    async def lines():
+        async for event in events:
+            line = json.dumps(event)
+            yield f"data: {line}\n\n" if sse else line + "\n"
+        if sse:
+            yield "data: [DONE]\n\n"
+
+    return StreamingResponse(
+        lines(), media_type="text/event-stream" if sse else "application/x-ndjson"
+    )
+
+
+def create_app(
+    latency=None,
+    replies=DEFAULT_REPLIES,
+    planner=None,
+    transcript=DEFAULT_TRANSCRIPT,
+    action_tokens=20,
+    speech_rate=2.5,
+    stt_speed=10.0,
+    final_delay=0.3,
+):
+    """
+    FastAPI app of the mocked services.
+
+    Args:
+        latency (Latency): Timing and failures of every endpoint.
+        replies (list): (regex, reply) pairs of the chat endpoint.
+        planner: Callable taking the /robot/task body and returning
+            (reasoning, actions), None plans nothing.
+        transcript: What the STT endpoint hears, a list of segments
+            streamed one partial each, or a string streamed word by word.
+        action_tokens (int): Tokens a planner action costs.
+        speech_rate (float): Words per second of the TTS audio.
+        stt_speed (float): Seconds of audio transcribed per second.
+        final_delay (float): Seconds between the last partial and the
+            final text.
+    """
+    app = FastAPI(title="Mock services")
+    app.state.latency = latency or Latency()
+    latency = app.state.latency
+
+    def reply_to(messages):
+        prompt = next(
+            (m["content"] for m in reversed(messages) if m.get("role") == "user"), ""
+        )
+        for pattern, reply in replies:
+            if re.search(pattern, prompt, re.IGNORECASE):
+                return reply
+        return prompt
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+        if latency.fail():
+            return unavailable()
+        reply = reply_to(body.get("messages", []))
+        model = body.get("model", "mock")
+        created = int(time.time())
+
+        def chunk(delta, finish_reason=None):
+            return {
+                "id": "chatcmpl-mock",
+                "object": "chat.completion.chunk",
+                "created": created,
+                "model": model,
+                "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+            }
+
+        async def events():
+            await latency.first()
+            yield chunk({"role": "assistant", "content": ""})
+            for token in tokenize(reply):
+                await latency.tokens()
+                yield chunk({"content": token})
+            yield chunk({}, "stop")
+
+        if body.get("stream"):
+            return encode_events(events(), sse=True)
+
+        await latency.first()
+        await latency.tokens(len(tokenize(reply)))
+        return {
+            "id": "chatcmpl-mock",
+            "object": "chat.completion",
+            "created": created,
+            "model": model,
+            "choices": [
+                {
+                    "index": 0,
+                    "message": {"role": "assistant", "content": reply},
+                    "finish_reason": "stop",
+                }
+            ],
+        }
+
+    async def plan_events(reasoning, actions):
+        await latency.first()
+        for token in tokenize(reasoning):
+            await latency.tokens()
+            yield {"reasoning": token}
+        for action in actions:
+            await latency.tokens(action_tokens)
+            yield {"action": action}
+        yield {"raw_output": reasoning + "\n" + json.dumps({"actions": actions})}
+
+    @app.post("/robot/task")
+    async def robot_task(request: Request):
+        body = await request.json()
+        if latency.fail():
+            return unavailable()
+        reasoning, actions = planner(body) if planner else ("There is nothing to do.", [])
+
+        if body.get("stream"):
+            sse = "text/event-stream" in request.headers.get("accept", "")
+            return encode_events(plan_events(reasoning, actions), sse)
+
+        raw_output = ""
+        async for event in plan_events(reasoning, actions):
+            raw_output = event.get("raw_output", raw_output)
+        return {"actions": actions, "raw_output": raw_output}
+
+    @app.post("/v1/audio/speech")
+    async def speech(request: Request):
+        body = await request.json()
+        if latency.fail():
+            return unavailable()
+        words = len(tokenize(body.get("input", "")))
+        await latency.first()
+        await latency.tokens(words)
+        return Response(silent_wav(words / speech_rate), media_type="audio/wav")
+
+    @app.post("/v1/audio/transcriptions")
+    async def transcriptions(
+        file: UploadFile = File(...), model: str = Form("tiny"), stream: bool = Form(False)
+    ):
+        audio = await file.read()
+        if latency.fail():
+            return unavailable()
+        segments = tokenize(transcript) if isinstance(transcript, str) else transcript
+        text = " ".join(segment.strip() for segment in segments)
+        words = len(tokenize(text))
+        # Decoding takes as long as the audio at stt_speed, spread over words
+        step = latency.scale(wav_seconds(audio) / stt_speed) / max(words, 1)
+
+        if stream:
+            async def events():
+                await latency.first()
+                partial = ""
+                for segment in segments:
+                    await asyncio.sleep(step * len(tokenize(segment)))
+                    partial = f"{partial} {segment.strip()}".strip()
+                    yield {"partial": partial}
+                await asyncio.sleep(latency.scale(final_delay))
+                yield {"text": text}
+
+            return encode_events(events(), sse=False)
+
+        await latency.first()
+        await asyncio.sleep(step * words + latency.scale(final_delay))
+        return {"text": text}
+
+    return app
+
+
+def add_arguments(parser):
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=3348)
+    parser.add_argument("--first-token", type=float, default=0.3, help="seconds")
+    parser.add_argument("--token-rate", type=float, default=40.0, help="tokens/s")
+    parser.add_argument("--jitter", type=float, default=0.0, help="relative")
+    parser.add_argument("--failure-rate", type=float, default=0.0)
+    parser.add_argument("--seed", type=int)
+
+
+def latency_from(args):
+    return Latency(
+        first_token=args.first_token,
+        token_rate=args.token_rate,
+        jitter=args.jitter,
+        failure_rate=args.failure_rate,
+        seed=args.seed,
+    )
+
+
+def main():
+    import uvicorn
+
+    parser = argparse.ArgumentParser()
+    add_arguments(parser)
+    parser.add_argument("--replies", help="JSON file of [[regex, reply], ...]")
+    parser.add_argument(
+        "--transcript", nargs="+", default=DEFAULT_TRANSCRIPT, help="segments"
+    )
+    parser.add_argument("--final-delay", type=float, default=0.3, help="seconds")
+    args = parser.parse_args()
+
+    replies = DEFAULT_REPLIES
+    if args.replies:
+        with open(args.replies, "r") as f:
+            replies = [tuple(pair) for pair in json.load(f)]
+
+    app = create_app(
+        latency_from(args),
+        replies=replies,
+        transcript=args.transcript,
+        final_delay=args.final_delay,
+    )
+    uvicorn.run(app, host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+from typing import Dict, List
+
+import numpy as np
+import torch
+
+
+class SceneObject:
+    __slots__ = ("name", "entity", "link_idx")
+
+    def __init__(self, name, entity):
+        self.name = name
+        self.entity = entity
+        self.link_idx = entity.links[0].idx  # Global index of the base link
+
+
+class ObjectRegistry:
+    """
+    Name -> entity index over the movable objects of a Genesis scene.
+
+    Poses of every registered object are fetched from the rigid solver in a
+    single batched query and a single device to host copy. The result is
+    cached per simulation step, so repeated queries within a tick are free.
+    """
+
+    def __init__(self, scene):
+        self._scene = scene
+        self._objects: List[SceneObject] = []
+        self._index: Dict[str, int] = {}
+        self._links_idx = []
+
+        self._poses = None
+        self._poses_step = -1
+
+    def add(self, name, entity):
+        if name in self._index:
+            raise ValueError(f"Object {name} is already registered")
+
+        obj = SceneObject(name, entity)
+        self._index[name] = len(self._objects)
+        self._objects.append(obj)
+        self._links_idx.append(obj.link_idx)
+        self._poses = None
+
+        return entity
+
+    @property
+    def names(self):
+        return [obj.name for obj in self._objects]
+
+    def __len__(self):
+        return len(self._objects)
+
+    def __contains__(self, name):
+        return name in self._index
+
+    def __getitem__(self, name):
+        return self._objects[self._index[name]].entity
+
+    def __iter__(self):
+        return iter(self._objects)
+
+    def index(self, name):
+        return self._index[name]
+
+    def poses(self):
+        """
+        Poses of all registered objects, in registration order.
+
+        Returns:
+            numpy.ndarray: (N, 7) array of [x, y, z, qw, qx, qy, qz] rows.
+        """
+        step = self._scene.t
+        if self._poses is not None and self._poses_step == step:
+            return self._poses
+
+        if len(self._objects) == 0:
+            self._poses = np.zeros((0, 7), dtype=np.float32)
+        else:
+            solver = self._scene.rigid_solver
+            pos = solver.get_links_pos(self._links_idx)
+            quat = solver.get_links_quat(self._links_idx)
+            self._poses = torch.cat([pos, quat], dim=-1).cpu().numpy()
+        self._poses_step = step
+
+        return self._poses
+
+    def pose(self, name):
+        return self.poses()[self._index[name]]
+
+    def grid_positions(self, scale):
+        """
+        Positions of all registered objects in integer units of 1 / `scale`,
+        truncated like the per-object int(float(x) * scale) they replace.
+
+        Returns:
+            numpy.ndarray: (N, 3) int array.
+        """
+        return (self.poses()[:, :3].astype(np.float64) * scale).astype(int)
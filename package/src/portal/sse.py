@@ -0,0 +1,149 @@
+import json
+import logging
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+logger = logging.getLogger(__name__)
+
+
+def loads(data):
+    """
+    Parse JSON from bytes or str, with orjson when it is installed.
+    """
+    if orjson is not None:
+        return orjson.loads(data)
+    if isinstance(data, bytes):
+        # Skips json's sniffing of the encoding of bytes
+        data = data.decode("utf-8")
+    return json.loads(data)
+
+
+def delta_content(event):
+    """
+    `choices[0].delta.content` of an OpenAI chat completion chunk, "" when
+    the chunk carries none (role-only, tool calls, usage, finish).
+    """
+    try:
+        return event["choices"][0]["delta"].get("content") or ""
+    except (KeyError, IndexError, TypeError, AttributeError):
+        return ""
+
+
+def is_sse(content_type):
+    """
+    Whether a response of `content_type` is SSE rather than NDJSON. Unknown
+    types count as SSE, which OpenAI-compatible servers send.
+    """
+    return not (content_type or "").endswith(("ndjson", "jsonl", "json-seq"))
+
+
+class SSEDecoder:
+    """
+    Incremental decoder of a server-sent event or NDJSON stream into JSON
+    events.
+
+    Bytes are fed as they come off the socket, in reads of any size: a line
+    split across reads is held until its end arrives. In SSE mode, `data:`
+    lines are joined until the blank line ending the event, comments and the
+    other fields are skipped, and `[DONE]` ends the stream. In NDJSON mode,
+    every non-empty line is an event. Payloads that are not JSON are counted
+    in `errors` and skipped.
+
+    Args:
+        sse (bool): SSE rather than NDJSON.
+    """
+
+    def __init__(self, sse=True):
+        self.sse = sse
+        self.done = False
+        self.errors = 0
+        self._buffer = b""
+        self._data = []  # data: lines of the event being read
+
+    def feed(self, chunk):
+        """
+        Decode the next bytes of the stream.
+
+        Returns:
+            list: Events completed by these bytes, in order.
+        """
+        if self.done:
+            return []
+        lines = (self._buffer + chunk).split(b"\n")
+        self._buffer = lines.pop()  # Until its newline arrives
+        events = []
+        for line in lines:
+            self._line(line, events)
+            if self.done:
+                break
+        return events
+
+    def close(self):
+        """
+        Events left at the end of the stream, a last line without newline
+        and an event without its blank line.
+        """
+        events = []
+        if self._buffer and not self.done:
+            self._line(self._buffer, events)
+        self._buffer = b""
+        if self._data and not self.done:
+            self._dispatch(events)
+        return events
+
+    def _line(self, line, events):
+        if line.endswith(b"\r"):
+            line = line[:-1]
+
+        if not self.sse:
+            if line.strip():
+                self._parse(line, events)
+        elif not line:
+            if self._data:
+                self._dispatch(events)
+        elif line.startswith(b"data:"):
+            self._data.append(line[6:] if line.startswith(b"data: ") else line[5:])
+        # Comments (":") and the event, id and retry fields are skipped
+
+    def _dispatch(self, events):
+        data = self._data[0] if len(self._data) == 1 else b"\n".join(self._data)
+        self._data = []
+        self._parse(data, events)
+
+    def _parse(self, data, events):
+        if data == b"[DONE]":
+            self.done = True
+            return
+        try:
+            events.append(loads(data))
+        except ValueError:
+            # json.JSONDecodeError and orjson.JSONDecodeError both are
+            if data.strip() == b"[DONE]":
+                self.done = True
+                return
+            self.errors += 1
+            logger.warning("Skipping a stream event that is not JSON: %r", data[:200])
+
+
+async def decode_stream(chunks, sse=True):
+    """
+    JSON events of an async iterator of byte chunks.
+    """
+    decoder = SSEDecoder(sse)
+    async for chunk in chunks:
+        for event in decoder.feed(chunk):
+            yield event
+        if decoder.done:
+            return
+    for event in decoder.close():
+        yield event
+
+
+def decode_response(response):
+    """
+    JSON events of an aiohttp response, SSE or NDJSON by its content type.
+    """
+    return decode_stream(response.content.iter_any(), is_sse(response.content_type))